@@ -1,19 +1,47 @@
+import asyncio
 import logging
-import json
-import re
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Type
 
+import httpx
 from agno.agent import Agent, RunResponse
+from agno.run.response import RunEvent
 from agno.models.openai import OpenAIChat
-from agno.tools.youtube import YouTubeTools
+from pydantic import BaseModel, ValidationError
 
+from backend.agent.concurrency import AdaptiveLimiter
+from backend.agent.parsing import UNREADABLE_RESPONSE, extract_json, parse_json
+from backend.agent.pool import AgentClient, AgentPool
+from backend.agent.streaming import CategoryStreamParser
+from backend.agent.tiers import Escalation
+from backend.agent.transcript import merge_evaluations
+from backend.cache.result_cache import make_cache_key
 from backend.config import get_settings
-from backend.schemas.schemas import EvaluationResult
+from backend.metrics.metrics import LLM_TOKENS, PARSE_FAILURES, timed, worker_label
+from backend.schemas.schemas import (
+    BatchEvaluationResult,
+    CategoryResult,
+    EvaluationResult,
+    OverallResult,
+    VideoEvaluationResult,
+)
 
-from backend.ws.websocket import send_score_to_ws
+from backend.ws.websocket import (
+    send_category_score_to_ws,
+    send_error_to_ws,
+    send_score_to_ws,
+)
 
 logger = logging.getLogger("youtube-agent")
 settings = get_settings()
 
+# Called with the videoId, if the model wrote one, and each category parsed
+# from the model output while it streams
+CategoryCallback = Callable[[Optional[str], dict], Awaitable[None]]
+
+# Called with each videoId and its result, returns whether the result is held
+# back for a second opinion instead of being sent
+HoldCallback = Callable[[str, Optional[EvaluationResult]], bool]
+
 PROMPTS = {
     "role": """
         Act as a content integrity and quality analyst trained to evaluate YouTube video captions. You are an expert in content policy enforcement, linguistic analysis, and media integrity.
@@ -23,7 +51,7 @@ PROMPTS = {
         Your task is to assess whether specific content categories are present based solely on the language in the transcript. Your judgments should be precise, unbiased, and strictly based on linguistic clues — do not rely on assumptions about video intent or tone.
     """,
     "instructions": """
-        As input, you will receive a list of categories to evaluate and a YouTube video URL. You have to get the video caption from the provided URL by using one of your available tools and analyze it to determine the presence of the specified categories.
+        As input, you will receive a list of categories to evaluate, a YouTube video URL and the caption of that video. You have to analyze the caption to determine the presence of the specified categories.
 
         Before starting your task, you MUST do this first check:
         Validate and filter the input categories:
@@ -83,10 +111,8 @@ PROMPTS = {
                     "First, we define the term. Then we apply it to examples."
 
         Once you have a valid list of categories, follow these steps precisely:
-        1. Get the video caption from the provided YouTube URL.
-        - If the caption cannot be retrieved, return a JSON object with an "error" field containing the reason.
-        - Once you get the caption, include it in your messages to the model for analysis.
-        - If you receive the following error "Error getting captions for video: no element found: line 1, column 0 ", retry the caption retrieval up to 2 times.
+        1. Read the video caption provided after "Caption:" in the input.
+        - If the caption is empty, return a JSON object with an "error" field containing the reason.
         - DO NOT DO ANYTHING ELSE IF THE CAPTION IS NOT AVAILABLE.
         2. Carefully analyze the caption text and evaluate each filtered category by assigning a score from 0 to 10:
         - For positive connotations ("educational", "relevance", "integrity", "clarity"):
@@ -98,6 +124,7 @@ PROMPTS = {
         Include the connotation type ("positive" or "negative") for each category in the result.
         Provide a clear and concise reason for each score, with references to the video where category is evident.
         3. Calculate the overall average score across all evaluated categories and provide a short text summary explaining your evaluation.
+        - Rate how confident you are in your scores from 0 (a guess) to 1 (certain). Lower it when the caption is short, ambiguous, sarcastic, quoted or in a language you do not master.
         4. Summarize the content of the video to be provided in the JSON response.
         - Include a brief overview of the video content, focusing on the main themes and messages.
         - Avoid personal opinions or subjective interpretations; stick to the content presented in the video.
@@ -117,7 +144,8 @@ PROMPTS = {
             ],
             "overall": {
                 "score": average score,
-                "reason": "A detailed summary of the reasons for each category"
+                "reason": "A detailed summary of the reasons for each category",
+                "confidence": confidence from 0 to 1
             },
             "error": "",
             "content_summary": "A brief overview of the video content, focusing on the main themes and messages."
@@ -126,39 +154,213 @@ PROMPTS = {
         Start your response with `{` and end it with `}`.
         Your output will be passed to json.loads() to convert it to a Python object. Make sure it only contains valid JSON.
     """,
+    "repair_instructions": """
+        You will receive a JSON object with the evaluation of a video that is malformed or was cut off.
+        Return the same object as valid JSON with the structure described below. Do not evaluate the video again:
+        - Keep every category, score, connotation and reason exactly as written.
+        - Drop a category that was cut off before its score.
+        - If "overall" is missing, set its score to the average of the category scores and its reason to "".
+        - Fill any other missing field with "".
+
+        The structure is:
+        {
+            "categories": [{"name": "...", "score": 0, "connotation": "positive or negative", "reason": "..."}],
+            "overall": {"score": 0, "reason": "..."},
+            "error": "",
+            "content_summary": "..."
+        }
+        Start your response with `{` and end it with `}`.
+    """,
+    "batch_instructions": """
+        This time you will receive several videos at once, each one introduced by "Video N:" with its own VideoId, URL and caption. The categories and additional user prompts apply to all of them.
+        Evaluate each video independently, following all the steps above, and never let the caption of one video influence the evaluation of another.
+
+        Your final response must be a JSON object with one entry per video, in the same order as the input:
+        {
+            "results": [
+                {
+                    "videoId": "the VideoId of the evaluated video",
+                    "categories": [...],
+                    "overall": {...},
+                    "error": "",
+                    "content_summary": "..."
+                },
+                ...
+            ]
+        }
+        Each entry has exactly the structure described above plus the "videoId" field.
+    """,
 }
 
 
-def parse_model_response(response: str) -> EvaluationResult:
+def to_evaluation(data: Any) -> Optional[EvaluationResult]:
+    """
+    Validates a decoded model response. When the response is incomplete,
+    keeps the categories that are whole and fills in the missing fields.
+
+    Returns:
+        Optional[EvaluationResult]: The result, or None if nothing is usable
+    """
+    if not isinstance(data, dict):
+        return None
+    try:
+        return EvaluationResult.model_validate(data)
+    except ValidationError:
+        pass
+
+    categories = []
+    for entry in data.get("categories") or []:
+        try:
+            categories.append(CategoryResult.model_validate(entry))
+        except ValidationError:
+            continue
+    error = data.get("error") if isinstance(data.get("error"), str) else ""
+    if not categories and not error:
+        return None
+    try:
+        overall = OverallResult.model_validate(data.get("overall"))
+    except ValidationError:
+        overall = OverallResult(
+            score=(
+                sum(c.score for c in categories) / len(categories)
+                if categories
+                else None
+            ),
+            reason="",
+        )
+    summary = data.get("content_summary")
+    return EvaluationResult(
+        categories=categories,
+        overall=overall,
+        error=error,
+        content_summary=summary if isinstance(summary, str) else "",
+    )
+
+
+def record_parse(stage: str, outcome: str) -> None:
+    PARSE_FAILURES.inc(stage=stage, worker=worker_label.get(), outcome=outcome)
+
+
+def record_tokens(agent: Agent, stage: str) -> None:
+    """
+    Records the tokens of the agent's last run, as reported by the provider.
+    """
+    metrics = getattr(agent.run_response, "metrics", None) or {}
+    for direction in ("input", "output"):
+        tokens = metrics.get(f"{direction}_tokens")
+        if tokens:
+            LLM_TOKENS.observe(
+                sum(tokens), stage=stage, worker=worker_label.get(), direction=direction
+            )
+
+
+def mark_incomplete(evaluation_result: EvaluationResult, categories) -> bool:
+    """
+    Marks a result that scores fewer categories than were requested as
+    incomplete, so it is neither cached nor taken as final. Unsupported
+    categories are left out by the model, so a result asked for one of them
+    is marked too: only results already known to be damaged are checked.
+
+    Returns:
+        bool: Whether the result is incomplete
+    """
+    if evaluation_result.error or not categories:
+        return False
+    requested = {c.strip().lower() for c in categories if c.strip()}
+    scored = [c for c in evaluation_result.categories if c is not None]
+    if len(scored) < len(requested):
+        evaluation_result.incomplete = True
+    return evaluation_result.incomplete
+
+
+def parse_model_response(response: str, categories=None) -> Optional[EvaluationResult]:
     """
     Parse the model response into a structured format.
 
     Args:
         response (str): The raw response from the model.
+        categories (List[str]): The requested categories, a recovered result
+            missing some of them is marked incomplete.
 
     Returns:
-        EvaluationResult: The parsed evaluation result.
+        Optional[EvaluationResult]: The parsed evaluation result, or None if
+            the response is unreadable.
     """
-    try:
-        match = re.search(r"\{.*\}", response, re.DOTALL)
-        if match:
-            json_str = match.group(0)
-            data = json.loads(json_str)
-            return EvaluationResult(**data)
-    except json.JSONDecodeError as e:
-        logger.error(f"Error parsing model response: {e}")
-        return EvaluationResult(categories=[], overall={}, error=str(e))
+    data, recovered = parse_json(response or "")
+    evaluation_result = to_evaluation(data)
+    if evaluation_result is None:
+        record_parse("single", "unreadable")
+        logger.error(f"Unreadable model response: {(response or '')[:200]!r}")
+    elif recovered:
+        incomplete = mark_incomplete(evaluation_result, categories)
+        record_parse("single", "incomplete" if incomplete else "recovered")
+        logger.warning(
+            f"Recovered truncated model response with "
+            f"{len(evaluation_result.categories)} categories"
+        )
+    return evaluation_result
 
 
-async def run_agent(video_id, categories, custom_prompts=None, manager=None):
-    logger.info(f"🤖 Starting agent for video evaluation {video_id}")
+def parse_batch_response(
+    response: str, categories=None
+) -> Optional[BatchEvaluationResult]:
+    """
+    Parse the response of a batched evaluation. Unreadable entries are left
+    out, so their videos are evaluated again on their own.
 
-    # Prepare the video URL
-    video_url = f"https://www.youtube.com/watch?v={video_id}"
-    # Build instructions based on categories and custom prompts
+    Args:
+        response (str): The raw response from the model.
+        categories (List[str]): The requested categories, recovered entries
+            missing some of them are marked incomplete.
+
+    Returns:
+        Optional[BatchEvaluationResult]: The parsed results, or None if unreadable.
+    """
+    data, recovered = parse_json(response or "")
+    entries = data.get("results") if isinstance(data, dict) else None
+    if not isinstance(entries, list):
+        record_parse("batch", "unreadable")
+        logger.error(f"Unreadable batch model response: {(response or '')[:200]!r}")
+        return None
 
+    results = []
+    for entry in entries:
+        evaluation_result = to_evaluation(entry)
+        video_id = entry.get("videoId") if isinstance(entry, dict) else None
+        if evaluation_result is None or not isinstance(video_id, str):
+            continue
+        if recovered:
+            mark_incomplete(evaluation_result, categories)
+        results.append(
+            VideoEvaluationResult(videoId=video_id, **evaluation_result.model_dump())
+        )
+    if recovered:
+        record_parse("batch", "recovered")
+        logger.warning(f"Recovered truncated batch response with {len(results)} videos")
+    return BatchEvaluationResult(results=results)
+
+
+def response_format(schema: Type[BaseModel]) -> Optional[dict]:
+    """
+    Output format requested from the model, per STRUCTURED_OUTPUT.
+    """
+    if settings.STRUCTURED_OUTPUT == "json_schema":
+        return {
+            "type": "json_schema",
+            "json_schema": {
+                "name": schema.__name__,
+                "schema": schema.model_json_schema(),
+                "strict": False,
+            },
+        }
+    if settings.STRUCTURED_OUTPUT == "json_object":
+        return {"type": "json_object"}
+    return None
+
+
+def build_header(categories, custom_prompts=None) -> str:
     # Build the prompt for the agent
-    prompt = f"Categories:{categories}." f"URL:{video_url}."
+    prompt = f"Categories:{categories}."
 
     # Add specific category instructions if provided
     if custom_prompts and isinstance(custom_prompts, list):
@@ -169,27 +371,400 @@ async def run_agent(video_id, categories, custom_prompts=None, manager=None):
         logger.warning(
             f"customPrompts is not a valid array: {custom_prompts}. It will be ignored."
         )
+    return prompt
+
+
+def build_prompt(video_id, categories, transcript, custom_prompts=None) -> str:
+    # Prepare the video URL
+    video_url = f"https://www.youtube.com/watch?v={video_id}"
 
-    agent = Agent(
-        model=OpenAIChat(temperature=0.1, id=settings.MODEL),
-        tools=[
-            YouTubeTools(languages=["en", "es"], get_video_timestamps=False),
-        ],
-        role=PROMPTS["role"],
-        goal=PROMPTS["goal"],
-        instructions=PROMPTS["instructions"],
-        show_tool_calls=False,
-        debug_mode=False,
+    # The caption is fetched beforehand, so the model answers in a single
+    # completion without tool calls
+    return (
+        f"{build_header(categories, custom_prompts)}"
+        f"URL:{video_url}."
+        f"\nCaption:\n{transcript}"
     )
 
-    logger.info(f"Running agent with prompt: {prompt}")
+
+def build_batch_prompt(videos, categories, custom_prompts=None) -> str:
+    prompt = build_header(categories, custom_prompts)
+    for index, (video_id, transcript) in enumerate(videos, start=1):
+        video_url = f"https://www.youtube.com/watch?v={video_id}"
+        prompt += (
+            f"\n\nVideo {index}:\nVideoId:{video_id}.URL:{video_url}."
+            f"\nCaption:\n{transcript}"
+        )
+    return prompt
+
+
+def create_agent_client(
+    limiter: Optional[AdaptiveLimiter] = None,
+    transport: Optional[httpx.AsyncBaseTransport] = None,
+    model_id: Optional[str] = None,
+) -> AgentClient:
+    """
+    Builds the agents used for evaluations around a persistent HTTP client,
+    so connections to the model provider are kept alive between calls.
+    The limiter, if any, observes every response of the provider. A custom
+    transport replaces the network, e.g. with the benchmark's fake model.
+    The agents use `model_id`, or MODEL if none is given.
+    """
+    event_hooks = {}
+    if limiter is not None:
+        event_hooks = {
+            "request": [limiter.observe_request],
+            "response": [limiter.observe_response],
+        }
+    http_client = httpx.AsyncClient(
+        transport=transport,
+        event_hooks=event_hooks,
+        limits=httpx.Limits(
+            max_connections=settings.AGENT_POOL_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.AGENT_POOL_MAX_CONNECTIONS,
+        ),
+        timeout=settings.LLM_TIMEOUT_SECONDS,
+    )
+    agents = {}
+    for name, instructions, schema in (
+        ("single", PROMPTS["instructions"], EvaluationResult),
+        (
+            "batch",
+            PROMPTS["instructions"] + PROMPTS["batch_instructions"],
+            BatchEvaluationResult,
+        ),
+        ("repair", PROMPTS["repair_instructions"], EvaluationResult),
+    ):
+        # Each agent asks for output bound to its own schema
+        output_format = response_format(schema)
+        model = OpenAIChat(
+            temperature=0.1,
+            id=model_id or settings.MODEL,
+            http_client=http_client,
+            request_params=(
+                {"response_format": output_format} if output_format else None
+            ),
+        )
+        agents[name] = Agent(
+            model=model,
+            role=PROMPTS["role"],
+            goal=PROMPTS["goal"],
+            instructions=instructions,
+            show_tool_calls=False,
+            debug_mode=False,
+        )
+    return AgentClient(http_client, agents)
+
+
+def partial_sender(manager, keys: Dict[str, str]) -> Optional[CategoryCallback]:
+    """
+    Returns a callback sending the partial result of a video each time one
+    of its categories is parsed, or None if partial results are disabled.
+    `keys` maps each evaluated video to the key of its evaluation.
+    Categories of single evaluations belong to their only video, whatever
+    videoId the model wrote.
+    """
+    if manager is None or not settings.STREAM_PARTIAL_RESULTS:
+        return None
+    scored: Dict[str, List[CategoryResult]] = {}
+
+    async def on_category(video_id: Optional[str], data: dict) -> None:
+        if len(keys) == 1:
+            video_id = next(iter(keys))
+        if video_id not in keys:
+            return
+        try:
+            category = CategoryResult(**data)
+        except (TypeError, ValidationError):
+            return
+        scored.setdefault(video_id, []).append(category)
+        send_category_score_to_ws(manager, keys[video_id], video_id, scored[video_id])
+
+    return on_category
+
+
+async def run_streaming(
+    agent: Agent, prompt: str, on_category: CategoryCallback
+) -> str:
+    """
+    Runs the agent streaming its output, reporting each category as soon as
+    it is complete.
+
+    Returns:
+        str: The whole response
+    """
+    parser = CategoryStreamParser()
+    content = ""
+    stream = await agent.arun(prompt, stream=True)
+    async for chunk in stream:
+        if chunk.event != RunEvent.run_response or not isinstance(chunk.content, str):
+            continue
+        content += chunk.content
+        for video_id, category in parser.feed(chunk.content):
+            await on_category(video_id, category)
+    return content
+
+
+async def run_model(
+    client: AgentClient,
+    name: str,
+    prompt: str,
+    on_category: Optional[CategoryCallback] = None,
+) -> str:
+    """
+    Runs one of the client's agents and returns its response text.
+    """
+    agent = client.agents[name]
+    with timed("llm_" + name):
+        if on_category is not None:
+            content = await run_streaming(agent, prompt, on_category)
+        else:
+            response: RunResponse = await agent.arun(
+                prompt, stream_intermediate_steps=True
+            )
+            content = response.content
+    record_tokens(agent, name)
+    return content
+
+
+async def evaluate_transcript(
+    video_id,
+    categories,
+    transcript,
+    pool: AgentPool,
+    custom_prompts=None,
+    on_category: Optional[CategoryCallback] = None,
+) -> EvaluationResult:
+    """
+    Scores one transcript, or one chunk of it, with a single model call.
+    """
+    prompt = build_prompt(video_id, categories, transcript, custom_prompts)
+
+    logger.info(f"Running agent for video {video_id} ({len(transcript)} caption chars)")
+    async with pool.borrow() as client:
+        content = await run_model(client, "single", prompt, on_category)
+        evaluation_result = parse_model_response(content, categories)
+        if evaluation_result is None:
+            evaluation_result = await repair_response(client, content, categories)
+    if evaluation_result is None:
+        return EvaluationResult.from_error(UNREADABLE_RESPONSE)
+    return evaluation_result
+
+
+async def repair_response(
+    client: AgentClient, content: str, categories=None
+) -> Optional[EvaluationResult]:
+    """
+    Asks the model to fix a malformed response. Only the broken JSON is sent,
+    so the caption is not evaluated again, and the categories cut off with
+    it stay missing: such a repair is marked incomplete.
+    """
+    fragment = extract_json(content or "")
+    if not fragment or len(fragment) > settings.PARSE_REPAIR_MAX_CHARS:
+        return None
+    for attempt in range(1, settings.PARSE_REPAIR_ATTEMPTS + 1):
+        logger.warning(
+            f"Asking the model to repair its response ({len(fragment)} chars), "
+            f"attempt {attempt}/{settings.PARSE_REPAIR_ATTEMPTS}"
+        )
+        evaluation_result = parse_model_response(
+            await run_model(client, "repair", fragment)
+        )
+        if evaluation_result is not None:
+            mark_incomplete(evaluation_result, categories)
+            return evaluation_result
+    return None
+
+
+async def evaluate_video(
+    video_id,
+    categories,
+    chunks,
+    pool: AgentPool,
+    custom_prompts=None,
+    on_category: Optional[CategoryCallback] = None,
+) -> Optional[EvaluationResult]:
+    """
+    Scores every chunk of a video and merges their evaluations.
+    """
+    results = await asyncio.gather(
+        *(
+            evaluate_transcript(
+                video_id, categories, chunk, pool, custom_prompts, on_category
+            )
+            for chunk in chunks
+        )
+    )
+    return merge_evaluations(results)
+
+
+async def escalate(
+    escalation: Escalation,
+    video_id,
+    categories,
+    chunks,
+    custom_prompts,
+    evaluation_result: Optional[EvaluationResult],
+) -> Optional[EvaluationResult]:
+    """
+    Evaluates again with the strong model a video whose cheap result the
+    policy doubts. The cheap result is kept if the strong model fails.
+    """
+    try:
+        with timed("escalation"):
+            strong_result = await evaluate_video(
+                video_id, categories, chunks, escalation.pool, custom_prompts
+            )
+    except Exception as e:
+        logger.error(f"Error in escalated evaluation of {video_id}: {e}")
+        strong_result = None
+    if strong_result is None or strong_result.error:
+        escalation.kept += 1
+        return evaluation_result
+    escalation.replaced += 1
+    return strong_result
+
+
+async def run_agent(
+    video_id,
+    categories,
+    chunks,
+    pool: AgentPool,
+    custom_prompts=None,
+    manager=None,
+    hold: Optional[HoldCallback] = None,
+):
+    """
+    Evaluates a video whose caption is already prepared.
+
+    Args:
+        video_id (str): ID of the video
+        categories (List[str]): Categories to evaluate
+        chunks (List[str]): Transcript chunks from `prepare_transcript`
+        pool (AgentPool): Pool the agent clients are borrowed from
+        custom_prompts (Any): Additional user prompts
+        manager (ConnectionManager): Manager used to deliver the result
+        hold (HoldCallback): Decides which results are not sent, because
+            they go to the strong tier first
+
+    Returns:
+        Optional[EvaluationResult]: The result, or None if the evaluation failed
+    """
+    logger.info(f"🤖 Starting agent for video evaluation {video_id}")
+    key = make_cache_key(video_id, categories, custom_prompts)
+    # Chunks are merged at the end, so only whole videos stream their scores
+    on_category = None
+    if len(chunks) > 1:
+        logger.info(f"Evaluating video {video_id} in {len(chunks)} chunks")
+    else:
+        on_category = partial_sender(manager, {video_id: key})
 
     try:
-        # Run the blocking call in a thread to not block the loop
-        response: RunResponse = await agent.arun(prompt, stream_intermediate_steps=True)
-        evaluation_result = parse_model_response(response.content)
-        await send_score_to_ws(manager, video_id, evaluation_result)
+        evaluation_result = await evaluate_video(
+            video_id, categories, chunks, pool, custom_prompts, on_category
+        )
+        if hold is not None and hold(video_id, evaluation_result):
+            return evaluation_result
+        if evaluation_result is None or evaluation_result.error:
+            logger.warning(f"Agent could not evaluate video {video_id}")
+            if evaluation_result is not None and (
+                evaluation_result.error != UNREADABLE_RESPONSE
+            ):
+                # Unreadable results fail their job instead, to be submitted again
+                send_error_to_ws(manager, key, video_id, evaluation_result.error)
+            return evaluation_result
+        if evaluation_result.incomplete:
+            logger.warning(f"Sending incomplete result of video {video_id}")
+        await send_score_to_ws(manager, key, video_id, evaluation_result)
 
         logger.info(f"Agent completed evaluation for video {video_id}")
+        return evaluation_result
     except Exception as e:
         logger.error(f"Error in agent processing: {e}")
+        return None
+
+
+async def run_agent_batch(
+    videos,
+    categories,
+    pool: AgentPool,
+    custom_prompts=None,
+    manager=None,
+    hold: Optional[HoldCallback] = None,
+) -> Dict[str, Optional[EvaluationResult]]:
+    """
+    Evaluates several short videos with a single model call, so the system
+    prompt is paid once per batch instead of once per video.
+
+    Args:
+        videos (List[Tuple[str, str]]): (video_id, transcript) pairs
+        categories (List[str]): Categories shared by every video
+        pool (AgentPool): Pool the agent clients are borrowed from
+        custom_prompts (Any): Additional user prompts shared by every video
+        manager (ConnectionManager): Manager used to deliver each result
+        hold (HoldCallback): Decides which results are not sent, because
+            they go to the strong tier first
+
+    Returns:
+        Dict[str, Optional[EvaluationResult]]: Result of each video by its ID,
+            None for every video if the model call failed
+    """
+    video_ids = [video_id for video_id, _ in videos]
+    keys = {v: make_cache_key(v, categories, custom_prompts) for v in video_ids}
+    logger.info(f"🤖 Starting batched evaluation of {len(videos)} videos")
+
+    try:
+        prompt = build_batch_prompt(videos, categories, custom_prompts)
+        on_category = partial_sender(manager, keys)
+        async with pool.borrow() as client:
+            content = await run_model(client, "batch", prompt, on_category)
+    except Exception as e:
+        # The provider failed or throttles us: evaluating every video alone
+        # would only add load, the jobs fail instead
+        logger.error(f"Error in batched agent processing: {e}")
+        return {video_id: None for video_id in video_ids}
+
+    results: Dict[str, Optional[EvaluationResult]] = {}
+    batch_result = parse_batch_response(content, categories)
+    if batch_result is None:
+        logger.warning(f"Unreadable batch response for {len(videos)} videos")
+        results = {
+            video_id: EvaluationResult.from_error(UNREADABLE_RESPONSE)
+            for video_id in video_ids
+        }
+    else:
+        for result in batch_result.results:
+            if result.videoId in video_ids and result.videoId not in results:
+                results[result.videoId] = EvaluationResult(
+                    **result.model_dump(exclude={"videoId"})
+                )
+
+    for video_id, evaluation_result in results.items():
+        if hold is not None and hold(video_id, evaluation_result):
+            continue
+        if not evaluation_result.error:
+            await send_score_to_ws(manager, keys[video_id], video_id, evaluation_result)
+        elif evaluation_result.error != UNREADABLE_RESPONSE:
+            # Unreadable results fail their job instead, to be submitted again
+            send_error_to_ws(manager, keys[video_id], video_id, evaluation_result.error)
+
+    # Videos the model left out of its response are evaluated on their own
+    missing = [(v, transcript) for v, transcript in videos if v not in results]
+    if missing:
+        logger.warning(f"{len(missing)} videos missing from batch, evaluating alone")
+        retried = await asyncio.gather(
+            *(
+                run_agent(
+                    video_id,
+                    categories,
+                    [transcript],
+                    pool,
+                    custom_prompts,
+                    manager,
+                    hold,
+                )
+                for video_id, transcript in missing
+            )
+        )
+        results.update(zip([video_id for video_id, _ in missing], retried))
+    return results
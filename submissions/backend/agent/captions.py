@@ -0,0 +1,118 @@
+import asyncio
+import logging
+import random
+import threading
+from typing import Callable, List, Optional
+
+from youtube_transcript_api import YouTubeTranscriptApi
+from youtube_transcript_api._errors import (
+    AgeRestricted,
+    InvalidVideoId,
+    NoTranscriptFound,
+    TranscriptsDisabled,
+    VideoUnavailable,
+    VideoUnplayable,
+)
+
+from backend.cache.transcript_cache import TranscriptCache
+
+logger = logging.getLogger("captions")
+
+# Errors that will not go away by asking again
+PERMANENT_ERRORS = (
+    AgeRestricted,
+    InvalidVideoId,
+    NoTranscriptFound,
+    TranscriptsDisabled,
+    VideoUnavailable,
+    VideoUnplayable,
+)
+
+
+class CaptionError(Exception):
+    """
+    Raised when the caption of a video cannot be retrieved. `permanent` is set
+    when asking again would not help, e.g. because the video has no captions.
+    """
+
+    def __init__(self, message: str, permanent: bool = False):
+        super().__init__(message)
+        self.permanent = permanent
+
+
+class CaptionFetcher:
+    """
+    Fetches video captions ahead of the model stage.
+    Transcripts are served from the transcript cache when possible, otherwise
+    downloaded with retries and exponential backoff. A custom `download`,
+    called in the fetcher's threads, replaces YouTube, e.g. with the
+    benchmark's fake.
+    """
+
+    def __init__(
+        self,
+        cache: TranscriptCache,
+        languages: List[str],
+        max_retries: int,
+        retry_base_delay: float,
+        download: Optional[Callable[[str], str]] = None,
+    ):
+        self.cache = cache
+        self.languages = languages
+        self.max_retries = max_retries
+        self.retry_base_delay = retry_base_delay
+        self.download = download or self._download
+        # YouTubeTranscriptApi keeps a requests.Session that is not thread-safe,
+        # so each thread gets its own and keeps its connections alive
+        self._local = threading.local()
+
+    async def fetch(self, video_id: str) -> str:
+        """
+        Returns the caption text of a video.
+
+        Args:
+            video_id (str): ID of the video
+
+        Returns:
+            str: Caption lines separated by newlines
+
+        Raises:
+            CaptionError: If the caption is not available
+        """
+        transcript = await self.cache.get(video_id)
+        if transcript is not None:
+            logger.info(f"Transcript cache hit for video {video_id}")
+            return transcript
+
+        attempt = 0
+        while True:
+            try:
+                transcript = await asyncio.to_thread(self.download, video_id)
+                break
+            except PERMANENT_ERRORS as e:
+                raise CaptionError(
+                    f"Captions not available: {type(e).__name__}", permanent=True
+                )
+            except Exception as e:
+                if attempt >= self.max_retries:
+                    raise CaptionError(f"Error getting captions for video: {e}")
+                delay = self.retry_base_delay * 2**attempt
+                delay += random.uniform(0, delay)
+                attempt += 1
+                logger.warning(
+                    f"Error getting captions for video {video_id}: {e}. "
+                    f"Retry {attempt}/{self.max_retries} in {delay:.2f}s"
+                )
+                await asyncio.sleep(delay)
+
+        if not transcript.strip():
+            raise CaptionError("No captions found for video", permanent=True)
+        await self.cache.set(video_id, transcript)
+        return transcript
+
+    def _download(self, video_id: str) -> str:
+        api = getattr(self._local, "api", None)
+        if api is None:
+            api = self._local.api = YouTubeTranscriptApi()
+        captions = api.fetch(video_id, languages=self.languages)
+        return "\n".join(snippet.text for snippet in captions)
@@ -0,0 +1,201 @@
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Awaitable, Callable, Optional
+
+import httpx
+
+logger = logging.getLogger("concurrency")
+
+
+def parse_retry_after(response: httpx.Response) -> Optional[float]:
+    """
+    Seconds the provider asks us to wait, from the Retry-After headers.
+    """
+    value = response.headers.get("retry-after-ms")
+    try:
+        if value is not None:
+            return float(value) / 1000
+        value = response.headers.get("retry-after")
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+class ObservedStream(httpx.AsyncByteStream):
+    """
+    Response body that calls `on_read` once it was read to the end. Bodies
+    left unread, e.g. by a cancelled call, are not reported.
+    """
+
+    def __init__(
+        self, stream: httpx.AsyncByteStream, on_read: Callable[[], Awaitable[None]]
+    ):
+        self._stream = stream
+        self._on_read = on_read
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        async for chunk in self._stream:
+            yield chunk
+        await self._on_read()
+
+    async def aclose(self) -> None:
+        await self._stream.aclose()
+
+
+class AdaptiveLimiter:
+    """
+    Limits the number of evaluations in flight and adapts the limit to the
+    model provider with AIMD: the limit grows by one every `limit` successful
+    calls and is cut by `backoff` when the provider errors, rate limits us, or
+    its latency grows past `latency_tolerance` times the usual latency.
+
+    Signals are read from every HTTP response of the agent clients through
+    `observe_request` and `observe_response`. The latency of a successful
+    call runs until its body is read: streamed answers hold their slot long
+    after the headers arrive.
+    """
+
+    def __init__(
+        self,
+        initial: int,
+        min_limit: int,
+        max_limit: int,
+        latency_tolerance: float,
+        backoff: float,
+    ):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.limit = float(min(max(initial, min_limit), max_limit))
+        self.latency_tolerance = latency_tolerance
+        self.backoff = backoff
+        self.in_flight = 0
+        # Short and long moving averages of the model latency
+        self.latency: Optional[float] = None
+        self.baseline: Optional[float] = None
+        self.remaining_requests: Optional[int] = None
+        self.increases = 0
+        self.decreases = 0
+        self.rate_limited = 0
+        self.errors = 0
+        self._paused_until = 0.0
+        self._last_decrease = 0.0
+        self._condition = asyncio.Condition()
+
+    @property
+    def current_limit(self) -> int:
+        return int(self.limit)
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        """
+        Holds one evaluation slot, waiting while the limit is reached or the
+        provider asked us to back off.
+        """
+        while True:
+            delay = self._paused_until - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+            async with self._condition:
+                if self.in_flight < self.current_limit:
+                    self.in_flight += 1
+                    break
+                await self._condition.wait()
+        try:
+            yield
+        finally:
+            async with self._condition:
+                self.in_flight -= 1
+                self._condition.notify()
+
+    async def observe_request(self, request: httpx.Request) -> None:
+        request.extensions["started_at"] = time.monotonic()
+
+    async def observe_response(self, response: httpx.Response) -> None:
+        now = time.monotonic()
+        started_at = response.request.extensions.get("started_at", now)
+        remaining = response.headers.get("x-ratelimit-remaining-requests")
+        if remaining is not None and remaining.isdigit():
+            self.remaining_requests = int(remaining)
+
+        if response.status_code == 429:
+            self.rate_limited += 1
+            retry_after = parse_retry_after(response)
+            if retry_after:
+                self._paused_until = max(self._paused_until, now + retry_after)
+            self._decrease(started_at, "rate limited")
+        elif response.status_code >= 500:
+            self.errors += 1
+            self._decrease(started_at, f"provider error {response.status_code}")
+        elif response.is_success:
+            if response.is_stream_consumed:
+                # Answered with a body already in memory
+                await self._on_read(started_at)
+            else:
+                response.stream = ObservedStream(
+                    response.stream, lambda: self._on_read(started_at)
+                )
+
+    def stats(self) -> dict:
+        return {
+            "limit": self.current_limit,
+            "minLimit": self.min_limit,
+            "maxLimit": self.max_limit,
+            "inFlight": self.in_flight,
+            "latency": round(self.latency, 3) if self.latency is not None else None,
+            "baseline": round(self.baseline, 3) if self.baseline is not None else None,
+            "remainingRequests": self.remaining_requests,
+            "increases": self.increases,
+            "decreases": self.decreases,
+            "rateLimited": self.rate_limited,
+            "errors": self.errors,
+        }
+
+    async def _on_read(self, started_at: float) -> None:
+        if self._on_success(started_at, time.monotonic() - started_at):
+            # Let one more waiting worker in
+            async with self._condition:
+                self._condition.notify()
+
+    def _on_success(self, started_at: float, latency: float) -> bool:
+        """
+        Updates the latency averages.
+
+        Returns:
+            bool: Whether the limit grew
+        """
+        if self.latency is None:
+            self.latency = self.baseline = latency
+        else:
+            self.latency += 0.3 * (latency - self.latency)
+            self.baseline += 0.02 * (latency - self.baseline)
+
+        if self.latency > self.baseline * self.latency_tolerance:
+            self._decrease(started_at, f"latency {self.latency:.1f}s")
+            return False
+        # Only grow while the limit is what holds us back
+        if self.in_flight < self.current_limit or self.limit >= self.max_limit:
+            return False
+        if (
+            self.remaining_requests is not None
+            and self.remaining_requests <= self.current_limit
+        ):
+            return False
+        previous = self.current_limit
+        self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+        if self.current_limit == previous:
+            return False
+        self.increases += 1
+        logger.info(f"Concurrency limit raised to {self.current_limit}")
+        return True
+
+    def _decrease(self, started_at: float, reason: str) -> None:
+        # Calls started before the last decrease saw the old limit, react once
+        if started_at < self._last_decrease or self.limit <= self.min_limit:
+            return
+        self._last_decrease = time.monotonic()
+        self.limit = max(self.min_limit, self.limit * self.backoff)
+        self.decreases += 1
+        logger.warning(f"Concurrency limit lowered to {self.current_limit} ({reason})")
@@ -0,0 +1,128 @@
+import json
+import re
+from typing import Any, List, Optional, Tuple
+
+try:
+    import orjson
+
+    _loads = orjson.loads
+except ImportError:  # orjson is optional, fall back to the standard library
+    _loads = json.loads
+
+# Error of the evaluations whose response could not be read, even repaired
+UNREADABLE_RESPONSE = "Could not read the model response"
+
+# Markdown fences the model sometimes wraps its answer in
+FENCE_PATTERN = re.compile(r"^```(?:json)?\s*|\s*```$")
+
+
+def loads(text: str) -> Any:
+    """
+    Decodes JSON with orjson when installed.
+
+    Raises:
+        ValueError: If the text is not valid JSON
+    """
+    return _loads(text)
+
+
+def extract_json(text: str) -> str:
+    """
+    Returns the JSON part of a response: from the first `{` on, without
+    Markdown fences or text around it.
+    """
+    text = FENCE_PATTERN.sub("", text.strip())
+    start = text.find("{")
+    if start < 0:
+        return ""
+    end = text.rfind("}")
+    # A missing closing brace means the object was truncated, keep it all
+    if end < start:
+        return text[start:]
+    tail = text[end + 1 :]
+    return text[start : end + 1] if not tail.strip(" \n\r\t`") else text[start:]
+
+
+def close_json(text: str) -> Optional[str]:
+    """
+    Recovers a truncated JSON object: cuts it after the last complete value
+    and closes every open array and object.
+
+    Returns:
+        Optional[str]: The closed JSON, or None if nothing could be kept
+    """
+    stack: List[str] = []
+    in_string = False
+    escape = False
+    # Whether the next string in each open object is a key
+    expect_key: List[bool] = []
+    safe: Optional[Tuple[int, str]] = None
+
+    def closers() -> str:
+        return "".join("}" if c == "{" else "]" for c in reversed(stack))
+
+    for index, char in enumerate(text):
+        if in_string:
+            if escape:
+                escape = False
+            elif char == "\\":
+                escape = True
+            elif char == '"':
+                in_string = False
+                if not (stack and stack[-1] == "{" and expect_key[-1]):
+                    safe = (index + 1, closers())
+            continue
+        if char == '"':
+            in_string = True
+        elif char in "{[":
+            stack.append(char)
+            expect_key.append(char == "{")
+        elif char in "}]":
+            if not stack:
+                break
+            stack.pop()
+            expect_key.pop()
+            safe = (index + 1, closers())
+            if not stack:
+                break
+        elif char == ":":
+            if expect_key:
+                expect_key[-1] = False
+        elif char == ",":
+            # Whatever came before the comma is complete
+            safe = (index, closers())
+            if stack and stack[-1] == "{":
+                expect_key[-1] = True
+
+    if safe is None:
+        return None
+    end, suffix = safe
+    return text[:end] + suffix
+
+
+def parse_json(text: str) -> Tuple[Optional[Any], bool]:
+    """
+    Parses the JSON object in a model response, recovering it if truncated.
+
+    Returns:
+        Tuple[Optional[Any], bool]: The decoded object, or None if unreadable,
+            and whether it had to be recovered
+    """
+    try:
+        return loads(text), False
+    except ValueError:
+        pass
+    fragment = extract_json(text)
+    if not fragment:
+        return None, False
+    try:
+        return loads(fragment), False
+    except ValueError:
+        pass
+    closed = close_json(fragment)
+    if closed is None:
+        return None, False
+    try:
+        return loads(closed), True
+    except ValueError:
+        return None, False
@@ -0,0 +1,116 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable, Dict, List, Set
+
+import httpx
+from agno.agent import Agent
+from openai import APIConnectionError
+
+logger = logging.getLogger("agent-pool")
+
+
+class AgentClient:
+    """
+    A set of evaluation agents sharing one model and one keep-alive HTTP client.
+    A client is used by one evaluation at a time.
+    """
+
+    def __init__(self, http_client: httpx.AsyncClient, agents: Dict[str, Agent]):
+        self.http_client = http_client
+        self.agents = agents
+        self.uses = 0
+        self.failures = 0
+        self.broken = False
+
+    def reset(self) -> None:
+        # Agents keep every run in memory, forget them between evaluations
+        for agent in self.agents.values():
+            agent.memory = None
+            agent.run_response = None
+
+    def is_healthy(self, max_failures: int, max_uses: int) -> bool:
+        return (
+            not self.broken
+            and not self.http_client.is_closed
+            and self.failures < max_failures
+            and self.uses < max_uses
+        )
+
+    async def aclose(self) -> None:
+        await self.http_client.aclose()
+
+
+class AgentPool:
+    """
+    Pool of long-lived agent clients created at startup.
+    Workers borrow a client for each model call and give it back afterwards.
+    Clients that break, fail repeatedly or reach their use limit are closed
+    and replaced with fresh ones.
+    """
+
+    def __init__(
+        self,
+        size: int,
+        factory: Callable[[], AgentClient],
+        max_failures: int,
+        max_uses: int,
+    ):
+        self.size = size
+        self.factory = factory
+        self.max_failures = max_failures
+        self.max_uses = max_uses
+        self.recycled = 0
+        self._idle: asyncio.Queue = asyncio.Queue()
+        self._clients: List[AgentClient] = []
+        self._closing: Set[asyncio.Task] = set()
+        for _ in range(size):
+            client = factory()
+            self._clients.append(client)
+            self._idle.put_nowait(client)
+
+    def available(self) -> int:
+        return self._idle.qsize()
+
+    @asynccontextmanager
+    async def borrow(self) -> AsyncIterator[AgentClient]:
+        """
+        Borrows a healthy client, waiting if all of them are in use.
+        """
+        client: AgentClient = await self._idle.get()
+        if not client.is_healthy(self.max_failures, self.max_uses):
+            client = self._recycle(client)
+        try:
+            yield client
+            client.failures = 0
+        except Exception as e:
+            client.failures += 1
+            if isinstance(e, (APIConnectionError, httpx.TransportError)):
+                client.broken = True
+            raise
+        finally:
+            client.uses += 1
+            client.reset()
+            if not client.is_healthy(self.max_failures, self.max_uses):
+                client = self._recycle(client)
+            self._idle.put_nowait(client)
+
+    async def close(self) -> None:
+        await asyncio.gather(
+            *(client.aclose() for client in self._clients), return_exceptions=True
+        )
+        self._clients.clear()
+
+    def _recycle(self, client: AgentClient) -> AgentClient:
+        logger.info(
+            f"Recycling agent client after {client.uses} uses "
+            f"({client.failures} consecutive failures, broken={client.broken})"
+        )
+        self.recycled += 1
+        self._clients.remove(client)
+        task = asyncio.get_running_loop().create_task(client.aclose())
+        self._closing.add(task)
+        task.add_done_callback(self._closing.discard)
+        replacement = self.factory()
+        self._clients.append(replacement)
+        return replacement
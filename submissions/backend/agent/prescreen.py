@@ -0,0 +1,220 @@
+import re
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from backend.schemas.schemas import CategoryResult, EvaluationResult
+
+# Category blocks of the instructions prompt: name, clues and example quotes
+CATEGORY_BLOCK = re.compile(
+    r"-\s+(\w+)\s*\n\s*Definition:.*?\n\s*Clues:(.*?)\n\s*Examples:\s*\n"
+    r"((?:\s*(?:\".*?\"|If .*?)\s*\n)+)",
+)
+NEGATIVE_LIST = re.compile(r"For negative connotations \(([^)]*)\)")
+QUOTED = re.compile(r'"([^"]+)"')
+PLACEHOLDER = re.compile(r"\[[^\]]*\]")
+
+NO_SPEECH = "No speech found in captions"
+
+# Phrases that leave little doubt, on top of the examples in the prompt
+MARKERS: Dict[str, List[str]] = {
+    "fraud": [
+        "send crypto",
+        "send bitcoin",
+        "send ethereum",
+        "double your bitcoin",
+        "double your money",
+        "guaranteed returns",
+        "guaranteed profit",
+        "risk-free investment",
+        "claim your free",
+        "free iphone",
+        "send it back doubled",
+        "wallet address below",
+        "get rich quick",
+    ],
+    "hatred": [
+        "are animals",
+        "are vermin",
+        "are subhuman",
+        "are parasites",
+        "don't deserve rights",
+        "inferior race",
+        "should be exterminated",
+    ],
+    "violence": [
+        "kill them all",
+        "take them out ourselves",
+        "deserved to be beaten",
+        "shoot them",
+        "burn it down",
+    ],
+    "misinformation": [
+        "vaccines are used to track",
+        "the earth is flat",
+        "nasa lies",
+        "5g causes",
+        "moon landing was faked",
+        "chemtrails",
+        "plandemic",
+    ],
+}
+
+
+def normalize_phrase(text: str) -> str:
+    text = text.lower().replace("’", "'")
+    return " ".join(re.sub(r"[^\w\s'-]", " ", text).split())
+
+
+class KeywordAutomaton:
+    """
+    Aho-Corasick automaton matching every phrase in a single pass over the
+    text. Phrases only match on word boundaries.
+    """
+
+    def __init__(self, phrases: Dict[str, str]):
+        # Transitions, failure links and (phrase, label) outputs of each state
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[Tuple[str, str]]] = [[]]
+        for phrase, label in phrases.items():
+            self._insert(phrase, label)
+        self._link()
+
+    def _insert(self, phrase: str, label: str) -> None:
+        state = 0
+        for char in phrase:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            state = next_state
+        self._out[state].append((phrase, label))
+
+    def _link(self) -> None:
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_state] = self._goto[fail].get(char, 0)
+                self._out[next_state] += self._out[self._fail[next_state]]
+
+    def find(self, text: str) -> Dict[str, Set[str]]:
+        """
+        Returns the phrases found in the text, by label.
+        """
+        found: Dict[str, Set[str]] = {}
+        state = 0
+        length = len(text)
+        for index, char in enumerate(text):
+            while state and char not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(char, 0)
+            for phrase, label in self._out[state]:
+                start = index - len(phrase) + 1
+                if (start == 0 or not text[start - 1].isalnum()) and (
+                    index + 1 == length or not text[index + 1].isalnum()
+                ):
+                    found.setdefault(label, set()).add(phrase)
+        return found
+
+
+def build_markers(instructions: str) -> Tuple[Dict[str, str], Set[str]]:
+    """
+    Collects the marker phrases of each negative category from the category
+    definitions of the instructions prompt and MARKERS.
+
+    Returns:
+        Tuple[Dict[str, str], Set[str]]: Category of each phrase and the
+            negative categories
+    """
+    negative_list = NEGATIVE_LIST.search(instructions)
+    negative = set(QUOTED.findall(negative_list.group(1))) if negative_list else set()
+    phrases: Dict[str, str] = {}
+    for name, _, examples in CATEGORY_BLOCK.findall(instructions):
+        category = name.lower()
+        if category not in negative:
+            continue
+        for example in QUOTED.findall(examples):
+            # Examples with placeholders such as [group] are templates
+            if PLACEHOLDER.search(example):
+                continue
+            phrase = normalize_phrase(example)
+            if phrase:
+                phrases[phrase] = category
+    for category, markers in MARKERS.items():
+        if category in negative:
+            for marker in markers:
+                phrases[normalize_phrase(marker)] = category
+    return phrases, negative
+
+
+class PreScreen:
+    """
+    Local screening of transcripts before the model stage.
+    Settles the videos whose captions carry no speech, and flags the
+    requested negative categories evident from `min_hits` different marker
+    phrases. Flags are only provisional: quoting a claim to debunk it reads
+    the same to a keyword match, so flagged videos still go to the model.
+    """
+
+    def __init__(
+        self, instructions: str, min_words: int, min_hits: int, flag_score: float
+    ):
+        phrases, self.negative = build_markers(instructions)
+        self.automaton = KeywordAutomaton(phrases)
+        self.min_words = min_words
+        self.min_hits = min_hits
+        self.flag_score = flag_score
+        self.screened = 0
+        self.no_captions = 0
+        self.flagged = 0
+
+    def screen(
+        self, categories: Iterable[str], chunks: List[str]
+    ) -> Tuple[Optional[EvaluationResult], List[CategoryResult]]:
+        """
+        Screens the prepared transcript of a video.
+
+        Returns:
+            Tuple[Optional[EvaluationResult], List[CategoryResult]]: The
+                settled result, or None if the video needs the model, and
+                the provisional scores of the flagged categories
+        """
+        self.screened += 1
+        text = normalize_phrase(" ".join(chunks))
+        if len(text.split()) < self.min_words:
+            self.no_captions += 1
+            return EvaluationResult.from_error(NO_SPEECH), []
+
+        requested = {c.strip().lower() for c in categories} & self.negative
+        if not requested:
+            return None, []
+        found = self.automaton.find(text)
+        flagged = [
+            CategoryResult(
+                name=category,
+                score=self.flag_score,
+                connotation="negative",
+                reason="Matched: " + ", ".join(f'"{p}"' for p in sorted(phrases)),
+            )
+            for category, phrases in sorted(found.items())
+            if category in requested and len(phrases) >= self.min_hits
+        ]
+        if flagged:
+            self.flagged += 1
+        return None, flagged
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "screened": self.screened,
+            "noCaptions": self.no_captions,
+            "flagged": self.flagged,
+            "llmCallsSaved": self.no_captions,
+        }
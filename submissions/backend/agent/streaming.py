@@ -0,0 +1,92 @@
+import json
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+# The key right before an opening bracket
+CATEGORIES_KEY = re.compile(r'"categories"\s*:\s*$')
+VIDEO_ID_FIELD = re.compile(r'"videoId"\s*:\s*"([^"\\]*)"')
+
+
+class CategoryStreamParser:
+    """
+    Reads a JSON document produced in pieces by the model and returns every
+    entry of a "categories" array as soon as the entry is complete, so it can
+    be shown before the model finishes the rest of the response.
+    Entries of batched responses come with the "videoId" of their result.
+    """
+
+    def __init__(self):
+        self._text = ""
+        self._position = 0
+        self._in_string = False
+        self._escape = False
+        # Positions of the open brackets
+        self._stack: List[int] = []
+        # Depth of the categories array being read and its video
+        self._array_depth: Optional[int] = None
+        self._video_id: Optional[str] = None
+        self._entry_start: Optional[int] = None
+
+    def feed(self, delta: str) -> List[Tuple[Optional[str], Dict[str, Any]]]:
+        """
+        Adds the next piece of the response.
+
+        Returns:
+            List[Tuple[Optional[str], Dict[str, Any]]]: (videoId, category)
+                pairs completed by this piece
+        """
+        self._text += delta
+        text = self._text
+        completed = []
+        for index in range(self._position, len(text)):
+            char = text[index]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in "{[":
+                if (
+                    char == "{"
+                    and self._array_depth is not None
+                    and len(self._stack) == self._array_depth
+                ):
+                    self._entry_start = index
+                elif (
+                    char == "["
+                    and self._array_depth is None
+                    and self._stack
+                    and CATEGORIES_KEY.search(text, self._stack[-1], index)
+                ):
+                    self._array_depth = len(self._stack) + 1
+                    match = VIDEO_ID_FIELD.search(text, self._stack[-1], index)
+                    self._video_id = match.group(1) if match else None
+                self._stack.append(index)
+            elif char in "}]":
+                if not self._stack:
+                    continue
+                self._stack.pop()
+                if self._array_depth is None:
+                    continue
+                if char == "}" and self._entry_start is not None:
+                    if len(self._stack) == self._array_depth:
+                        entry = self._load(text[self._entry_start : index + 1])
+                        if entry is not None:
+                            completed.append((self._video_id, entry))
+                        self._entry_start = None
+                elif char == "]" and len(self._stack) < self._array_depth:
+                    self._array_depth = None
+        self._position = len(text)
+        return completed
+
+    @staticmethod
+    def _load(text: str) -> Optional[Dict[str, Any]]:
+        try:
+            entry = json.loads(text)
+        except ValueError:
+            return None
+        return entry if isinstance(entry, dict) else None
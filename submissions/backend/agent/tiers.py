@@ -0,0 +1,102 @@
+import asyncio
+from typing import Dict, Iterable, Optional
+
+from backend.agent.parsing import UNREADABLE_RESPONSE
+from backend.agent.pool import AgentPool
+from backend.metrics.metrics import ESCALATIONS
+from backend.schemas.schemas import EvaluationResult
+
+
+class EscalationPolicy:
+    """
+    Decides which results of the cheap model are checked by the strong one:
+    unreadable answers, answers cut off before every category was scored,
+    answers the model is not confident about, and harmful categories scored
+    between `borderline_low` and `borderline_high`, neither clearly present
+    nor clearly absent.
+    """
+
+    def __init__(
+        self,
+        min_confidence: float,
+        harmful_categories: Iterable[str],
+        borderline_low: float,
+        borderline_high: float,
+    ):
+        self.min_confidence = min_confidence
+        self.harmful_categories = {
+            name.strip().lower() for name in harmful_categories if name.strip()
+        }
+        self.borderline_low = borderline_low
+        self.borderline_high = borderline_high
+
+    def reason(self, result: Optional[EvaluationResult]) -> Optional[str]:
+        """
+        Returns why the result needs the strong model, or None if it does not.
+        """
+        if result is None or result.error == UNREADABLE_RESPONSE:
+            return "unreadable"
+        if result.error:
+            # Missing captions and unsupported categories, no model does better
+            return None
+        if result.incomplete:
+            return "incomplete"
+        confidence = result.overall.confidence
+        if confidence is not None and confidence < self.min_confidence:
+            return "low_confidence"
+        for category in result.categories:
+            if category is None or not self.is_harmful(category.name):
+                continue
+            if self.borderline_low <= category.score <= self.borderline_high:
+                return "borderline"
+        return None
+
+    def is_harmful(self, name: str) -> bool:
+        return name.strip().lower() in self.harmful_categories
+
+
+class Escalation:
+    """
+    Strong tier of the cascade: the pool of the strong model, whose size caps
+    the escalated evaluations in flight, the queue of results waiting for it,
+    and how often it was needed.
+    """
+
+    def __init__(self, pool: AgentPool, policy: EscalationPolicy):
+        self.pool = pool
+        self.policy = policy
+        # Jobs and their cheap results, the cheap tier does not wait for them
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.checked = 0
+        self.escalated: Dict[str, int] = {}
+        # Escalations answered by the strong model, the ones that kept the
+        # cheap result because the strong model failed, and the ones past
+        # their deadline before the strong model got to them
+        self.replaced = 0
+        self.kept = 0
+        self.late = 0
+
+    def check(self, result: Optional[EvaluationResult]) -> Optional[str]:
+        """
+        Counts the result and returns why it must be escalated, if it must.
+        """
+        self.checked += 1
+        reason = self.policy.reason(result)
+        if reason is not None:
+            self.escalated[reason] = self.escalated.get(reason, 0) + 1
+            ESCALATIONS.inc(reason=reason)
+        return reason
+
+    def stats(self) -> Dict[str, object]:
+        escalated = sum(self.escalated.values())
+        return {
+            "checked": self.checked,
+            "escalated": escalated,
+            "escalationRate": round(escalated / self.checked, 3) if self.checked else 0,
+            "byReason": dict(self.escalated),
+            "replaced": self.replaced,
+            "kept": self.kept,
+            "late": self.late,
+            "waiting": self.queue.qsize(),
+            "strongAvailable": self.pool.available(),
+        }
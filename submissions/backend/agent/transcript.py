@@ -0,0 +1,178 @@
+import re
+from typing import List, Optional
+
+from backend.schemas.schemas import CategoryResult, EvaluationResult, OverallResult
+
+try:
+    import tiktoken
+
+    _encoding = tiktoken.get_encoding("o200k_base")
+except Exception:  # tiktoken is optional, fall back to an estimate
+    _encoding = None
+
+# Caption annotations such as [Music] or ♪
+ANNOTATION_PATTERN = re.compile(r"\[[^\]]{0,40}\]|[♪♫]+")
+# Hesitations that carry no meaning for the evaluation
+FILLER_PATTERN = re.compile(
+    r"\b(?:u+h+|u+m+|e+r+m+|a+h+|h+m+|mhm|uh-huh)\b[,.]?\s*", re.IGNORECASE
+)
+WHITESPACE_PATTERN = re.compile(r"\s+")
+
+
+def count_tokens(text: str) -> int:
+    """
+    Counts model tokens with tiktoken when installed, otherwise estimates them
+    as one token every four characters.
+    """
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return (len(text) + 3) // 4
+
+
+def clean_transcript(text: str) -> List[str]:
+    """
+    Removes annotations, filler words and repeated lines from a caption.
+
+    Args:
+        text (str): Caption lines separated by newlines
+
+    Returns:
+        List[str]: The remaining lines
+    """
+    lines: List[str] = []
+    seen = set()
+    for line in text.splitlines():
+        line = ANNOTATION_PATTERN.sub(" ", line)
+        line = FILLER_PATTERN.sub("", line)
+        line = WHITESPACE_PATTERN.sub(" ", line).strip()
+        key = line.lower().strip(".,!?")
+        # Auto-generated captions repeat lines a lot, keep the first occurrence
+        if not key or key in seen:
+            continue
+        seen.add(key)
+        lines.append(line)
+    return lines
+
+
+def chunk_lines(lines: List[str], chunk_tokens: int) -> List[str]:
+    """
+    Groups consecutive lines into chunks of at most `chunk_tokens` tokens.
+    """
+    chunks: List[str] = []
+    current: List[str] = []
+    current_tokens = 0
+    for line in lines:
+        tokens = count_tokens(line) + 1
+        if current and current_tokens + tokens > chunk_tokens:
+            chunks.append("\n".join(current))
+            current, current_tokens = [], 0
+        current.append(line)
+        current_tokens += tokens
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+
+def sample_chunks(chunks: List[str], count: int) -> List[str]:
+    """
+    Picks `count` chunks spread evenly over the video, always keeping the
+    first and the last one.
+    """
+    if count >= len(chunks):
+        return chunks
+    if count <= 1:
+        return chunks[:1]
+    step = (len(chunks) - 1) / (count - 1)
+    return [chunks[round(i * step)] for i in range(count)]
+
+
+def prepare_transcript(
+    text: str,
+    max_tokens: int,
+    chunk_tokens: int,
+    max_chunks: int,
+    strategy: str,
+) -> List[str]:
+    """
+    Cleans a caption and fits it into the token budget.
+
+    Args:
+        text (str): Raw caption text
+        max_tokens (int): Largest transcript sent in a single model call
+        chunk_tokens (int): Size of each chunk when the transcript is too long
+        max_chunks (int): Largest number of chunks evaluated for one video
+        strategy (str): "sample" sends representative segments in one call,
+            "map_reduce" evaluates up to `max_chunks` chunks separately
+
+    Returns:
+        List[str]: Transcripts to evaluate, one per model call
+    """
+    lines = clean_transcript(text)
+    cleaned = "\n".join(lines)
+    if count_tokens(cleaned) <= max_tokens:
+        return [cleaned]
+
+    if strategy == "map_reduce":
+        chunks = chunk_lines(lines, chunk_tokens)
+        return sample_chunks(chunks, max_chunks)
+
+    # Representative segments from the whole video that fit in one call
+    segment_tokens = max(1, max_tokens // max_chunks)
+    segments = sample_chunks(chunk_lines(lines, segment_tokens), max_chunks)
+    return ["\n[...]\n".join(segments)]
+
+
+def merge_evaluations(results: List[EvaluationResult]) -> Optional[EvaluationResult]:
+    """
+    Merges the evaluations of several chunks of the same video.
+    A negative category scores as its worst chunk, since harmful content in
+    any part of the video counts. Positive categories are averaged.
+    """
+    valid = [r for r in results if r is not None and not r.error]
+    if not valid:
+        # Nothing to merge, surface the first error if there is one
+        return next((r for r in results if r is not None), None)
+    results = valid
+    if len(results) == 1:
+        return results[0]
+
+    merged = {}
+    for result in results:
+        for category in result.categories:
+            if category is None:
+                continue
+            merged.setdefault(category.name, []).append(category)
+
+    categories = []
+    for name, scored in merged.items():
+        connotation = scored[0].connotation
+        if connotation == "negative":
+            worst = min(scored, key=lambda c: c.score)
+            score, reason = worst.score, worst.reason
+        else:
+            score = sum(c.score for c in scored) / len(scored)
+            reason = " ".join(dict.fromkeys(c.reason for c in scored))
+        categories.append(
+            CategoryResult(
+                name=name, score=score, connotation=connotation, reason=reason
+            )
+        )
+
+    overall_score = (
+        sum(c.score for c in categories) / len(categories) if categories else None
+    )
+    # The video is as doubtful as its most doubtful chunk
+    confidences = [
+        r.overall.confidence for r in results if r.overall.confidence is not None
+    ]
+    return EvaluationResult(
+        categories=categories,
+        overall=OverallResult(
+            score=overall_score,
+            reason=" ".join(r.overall.reason for r in results if r.overall.reason),
+            confidence=min(confidences) if confidences else None,
+        ),
+        error="",
+        content_summary=" ".join(r.content_summary for r in results),
+        incomplete=any(r.incomplete for r in results),
+    )
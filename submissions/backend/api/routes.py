@@ -1,11 +1,59 @@
 import logging
+from typing import Dict, List, Optional
 
-from fastapi import APIRouter, Request
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import PlainTextResponse
 
-from backend.schemas.schemas import ActionRequest, StatusResponse
+from backend.cache.result_cache import ResultCache, make_cache_key
+from backend.config import get_settings
+from backend.metrics import metrics
+from backend.queue.admission import AdmissionError
+from backend.schemas.schemas import (
+    ActionRequest,
+    BatchActionRequest,
+    BatchStatusResponse,
+    ScoresResponse,
+    StatusResponse,
+    VideoScoreResult,
+)
 
 router = APIRouter()
 logger = logging.getLogger("FastAPI")
+settings = get_settings()
+
+
+def too_many_requests(error: AdmissionError) -> HTTPException:
+    logger.warning(f"Request rejected: {error}")
+    return HTTPException(
+        status_code=429,
+        detail=str(error),
+        headers={"Retry-After": str(error.retry_after)},
+    )
+
+
+def client_key(client_id: str, request: Request) -> str:
+    # Anonymous requests are limited by address
+    if client_id:
+        return client_id
+    return request.client.host if request.client else "unknown"
+
+
+def split_param(value: Optional[str]) -> List[str]:
+    return list(dict.fromkeys(v.strip() for v in (value or "").split(",") if v.strip()))
+
+
+async def stored_results(
+    cache: ResultCache, video_ids: List[str], categories: List[str]
+) -> Dict[str, VideoScoreResult]:
+    """
+    Looks up the stored results of the given videos: for the given
+    categories, or the most recent one of each video if none are given.
+    """
+    if not categories:
+        return await cache.latest_many(video_ids)
+    keys = {make_cache_key(video_id, categories): video_id for video_id in video_ids}
+    found = await cache.get_many(list(keys))
+    return {keys[key]: result for key, result in found.items()}
 
 
 @router.get("/ping", response_model=dict, summary="Liveness check")
@@ -14,6 +62,105 @@ async def ping():
     return {"message": "pong"}
 
 
+@router.get("/api/queue/stats", response_model=dict, summary="Queue statistics")
+async def queue_stats(request: Request):
+    """
+    Returns queue depth, dropped and rejected jobs, the age of jobs when
+    dequeued, the current concurrency limit, the model calls saved by the
+    pre-screen and how often results are escalated to the strong model.
+    """
+    stats = request.app.state.queue.stats()
+    stats["rateLimited"] = request.app.state.rate_limiter.limited
+    stats["concurrency"] = request.app.state.limiter.stats()
+    if request.app.state.screener is not None:
+        stats["prescreen"] = request.app.state.screener.stats()
+    if request.app.state.escalation is not None:
+        stats["tiers"] = request.app.state.escalation.stats()
+    if request.app.state.journal is not None:
+        stats["journal"] = request.app.state.journal.stats()
+    if request.app.state.prewarmer is not None:
+        stats["prewarm"] = request.app.state.prewarmer.stats()
+    stats["replayed"] = request.app.state.manager.replayed
+    if request.app.state.fakes is not None:
+        stats["fakes"] = request.app.state.fakes.stats()
+    return stats
+
+
+@router.get("/metrics", response_class=PlainTextResponse, summary="Metrics")
+async def metrics_endpoint(request: Request):
+    """
+    Metrics in the Prometheus text format: latency histograms of each
+    pipeline stage by worker, tokens, parse failures, WebSocket fan-out,
+    connections and cache hit ratios.
+    """
+    return PlainTextResponse(
+        metrics.render(
+            request.app.state.queue.qsize(), request.app.state.limiter.stats()
+        ),
+        media_type="text/plain; version=0.0.4",
+    )
+
+
+@router.get(
+    "/api/videos/scores",
+    response_model=ScoresResponse,
+    summary="Stored scores of several videos",
+)
+async def get_scores(
+    request: Request,
+    ids: str = Query(..., description="Comma-separated video IDs."),
+    categories: Optional[str] = Query(
+        None, description="Comma-separated categories, any if omitted."
+    ),
+):
+    """
+    Returns the stored results of many videos at once, without evaluating
+    the missing ones.
+    """
+    video_ids = split_param(ids)
+    if len(video_ids) > settings.BATCH_MAX_VIDEOS:
+        raise HTTPException(
+            status_code=422,
+            detail=f"At most {settings.BATCH_MAX_VIDEOS} videos per request.",
+        )
+    found = await stored_results(
+        request.app.state.cache, video_ids, split_param(categories)
+    )
+    return ScoresResponse(
+        results=[found[v].to_dict() for v in video_ids if v in found],
+        missing=[v for v in video_ids if v not in found],
+    )
+
+
+@router.get(
+    "/api/videos/{video_id}/score",
+    response_model=StatusResponse,
+    summary="Stored score of a video",
+)
+async def get_score(
+    video_id: str,
+    request: Request,
+    categories: Optional[str] = Query(
+        None, description="Comma-separated categories, any if omitted."
+    ),
+):
+    """
+    Returns the stored result of a video, or 404 if it was not evaluated.
+    """
+    found = await stored_results(
+        request.app.state.cache, [video_id], split_param(categories)
+    )
+    if video_id not in found:
+        raise HTTPException(
+            status_code=404, detail=f"No stored score for video {video_id}."
+        )
+    return StatusResponse(
+        status="cached",
+        detail=f"Video {video_id} already evaluated.",
+        result=found[video_id].to_dict(),
+    )
+
+
 @router.post(
     "/api/videos/evaluate",
     response_model=StatusResponse,
@@ -22,10 +169,96 @@ async def ping():
 async def action(payload: ActionRequest, request: Request):
     """
     Receives an HTTP request and enqueues the action.
+    Cached evaluations are returned right away without being enqueued.
     """
+    if request.app.state.prewarmer is not None:
+        request.app.state.prewarmer.record([payload])
+    cache = request.app.state.cache
+    key = make_cache_key(payload.videoId, payload.categories, payload.customPrompts)
+    cached = await cache.get(key)
+    if cached is not None:
+        logger.info(f"Cache hit for video: {payload.videoId}")
+        return StatusResponse(
+            status="cached",
+            detail=f"Video {payload.videoId} already evaluated.",
+            result=cached.to_dict(),
+        )
+
+    rate_limiter = request.app.state.rate_limiter
+    rate_key = client_key(payload.clientId, request)
+    try:
+        rate_limiter.acquire(rate_key)
+    except AdmissionError as e:
+        raise too_many_requests(e)
+
     queue = request.app.state.queue
-    await queue.put(payload)
+    try:
+        _, created = await queue.submit(payload)
+    except AdmissionError as e:
+        rate_limiter.refund(rate_key)
+        raise too_many_requests(e)
+
+    # Route the result to the submitting WebSocket client, only once the
+    # job is admitted
+    if payload.clientId:
+        # With the replay, a result sent while the request was on its way is
+        # not missed by a submission that joins its job
+        request.app.state.manager.subscribe(
+            payload.clientId, [(payload.videoId, key)], replay=True
+        )
+    if not created:
+        return StatusResponse(
+            status="submitted",
+            detail=f"Video {payload.videoId} is already being evaluated.",
+        )
     logger.info(f"Enqueued video: {payload.videoId}")
     return StatusResponse(
         status="submitted", detail=f"Video {payload.videoId} successfully enqueued."
     )
+
+
+@router.post(
+    "/api/videos/evaluate/batch",
+    response_model=BatchStatusResponse,
+    summary="Evaluate a page of videos with shared categories and prompts",
+)
+async def batch_action(payload: BatchActionRequest, request: Request):
+    """
+    Receives a batch of videos, answers cache hits inline and enqueues the
+    misses in a single operation.
+    """
+    requests = payload.to_requests()
+    if request.app.state.prewarmer is not None:
+        request.app.state.prewarmer.record(requests)
+    keys = [make_cache_key(r.videoId, r.categories, r.customPrompts) for r in requests]
+    cached = await request.app.state.cache.get_many(keys)
+    misses = [(r, key) for r, key in zip(requests, keys) if key not in cached]
+
+    queue = request.app.state.queue
+    rate_limiter = request.app.state.rate_limiter
+    rate_key = client_key(payload.clientId, request)
+    try:
+        if misses:
+            rate_limiter.acquire(rate_key, len(misses))
+    except AdmissionError as e:
+        raise too_many_requests(e)
+    try:
+        submitted = await queue.submit_many([r for r, _ in misses])
+    except AdmissionError as e:
+        rate_limiter.refund(rate_key, len(misses))
+        raise too_many_requests(e)
+    if payload.clientId and misses:
+        request.app.state.manager.subscribe(
+            payload.clientId, [(r.videoId, key) for r, key in misses], replay=True
+        )
+    created = sum(1 for _, is_new in submitted if is_new)
+    logger.info(
+        f"Batch of {len(requests)} videos: {len(cached)} cached, "
+        f"{created} enqueued, {len(misses) - created} already pending"
+    )
+    return BatchStatusResponse(
+        status="submitted",
+        detail=f"{len(cached)} cached, {len(misses)} submitted.",
+        results=[cached[key].to_dict() for key in keys if key in cached],
+        enqueued=[r.videoId for r, _ in misses],
+    )
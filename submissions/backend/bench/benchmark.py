@@ -0,0 +1,483 @@
+"""
+Load test of the whole backend against a fake model and a fake YouTube.
+
+Starts the app with uvicorn in a separate process, with FAKE_BACKENDS set,
+opens one WebSocket per simulated tab, submits each tab's videos to
+/api/videos/evaluate and waits for their scores. Reports submit-to-result
+latency, throughput, and the memory and event-loop lag of the server.
+
+    python -m backend.bench.benchmark --tabs 1000 --videos-per-tab 10
+
+Settings (WORKERS, CONCURRENCY_*, SCORING_BATCH_*, ...) come from the
+environment as usual. The caches start empty on every run.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+import httpx
+import websockets
+
+from backend.bench.fakes import percentile
+from backend.ws.protocol import msgpack
+
+CATEGORIES = ["hatred", "misinformation", "fraud", "educational", "clarity"]
+
+
+def rss_mb(pid: int) -> float:
+    """
+    Current resident memory of a process, in MB.
+    """
+    try:
+        with open(f"/proc/{pid}/statm") as statm:
+            pages = int(statm.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError):
+        return 0.0
+
+
+def peak_rss_mb(pid: int) -> float:
+    """
+    Largest resident memory a process has had so far, in MB.
+    """
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except (OSError, ValueError):
+        pass
+    return 0.0
+
+
+class Results:
+    def __init__(self):
+        self.submitted = 0
+        self.latencies: List[float] = []
+        self.cached = 0
+        self.rejected = 0
+        self.dropped = 0
+        self.no_captions = 0
+        self.timed_out = 0
+        self.failed = 0
+        self.partials = 0
+        self.first_partial: List[float] = []
+        self.frames = 0
+        self.frame_bytes = 0
+
+
+class Tab:
+    """
+    A browser tab with the extension: one WebSocket, and one evaluation
+    request per video shown on its page.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        ws_url: str,
+        http: httpx.AsyncClient,
+        results: Results,
+        video_ids: List[str],
+        interval: float,
+        timeout: float,
+    ):
+        self.base_url = base_url
+        self.ws_url = ws_url
+        self.http = http
+        self.results = results
+        self.video_ids = video_ids
+        self.interval = interval
+        self.timeout = timeout
+        # Submission time of each video still waiting for its score
+        self.pending: Dict[str, float] = {}
+        self.partial_seen: set = set()
+        self.submitted_all = False
+        self.done = asyncio.Event()
+
+    async def run(self) -> None:
+        try:
+            async with websockets.connect(
+                self.ws_url, open_timeout=self.timeout, max_queue=None
+            ) as ws:
+                hello = self.decode(await ws.recv())
+                reader = asyncio.create_task(self.read(ws))
+                try:
+                    await self.submit_all(hello["clientId"])
+                    await asyncio.wait_for(self.done.wait(), self.timeout)
+                except asyncio.TimeoutError:
+                    pass
+                finally:
+                    reader.cancel()
+                    await asyncio.gather(reader, return_exceptions=True)
+        except (OSError, websockets.WebSocketException, asyncio.TimeoutError):
+            self.results.failed += len(self.video_ids)
+            return
+        self.results.timed_out += len(self.pending)
+
+    async def submit_all(self, client_id: str) -> None:
+        for video_id in self.video_ids:
+            self.pending[video_id] = time.monotonic()
+            self.results.submitted += 1
+            try:
+                response = await self.http.post(
+                    self.base_url + "/api/videos/evaluate",
+                    json={
+                        "videoId": video_id,
+                        "categories": CATEGORIES,
+                        "customPrompts": [],
+                        "clientId": client_id,
+                        "priority": "visible",
+                    },
+                )
+            except httpx.HTTPError:
+                self.results.failed += 1
+                self.resolve(video_id, None)
+                continue
+            if response.status_code == 429:
+                self.results.rejected += 1
+                self.resolve(video_id, None)
+            elif response.status_code != 200:
+                self.results.failed += 1
+                self.resolve(video_id, None)
+            elif response.json().get("status") == "cached":
+                self.results.cached += 1
+                self.resolve(video_id, time.monotonic())
+            if self.interval:
+                await asyncio.sleep(random.uniform(0, 2 * self.interval))
+        self.submitted_all = True
+        if not self.pending:
+            self.done.set()
+
+    async def read(self, ws) -> None:
+        async for data in ws:
+            self.results.frames += 1
+            self.results.frame_bytes += len(data)
+            frame = self.decode(data)
+            if frame.get("type") == "batch":
+                for message in frame["messages"]:
+                    self.handle(message)
+            else:
+                self.handle(frame)
+
+    @staticmethod
+    def decode(data) -> dict:
+        if isinstance(data, bytes):
+            return msgpack.unpackb(data)
+        return json.loads(data)
+
+    def handle(self, message: dict) -> None:
+        video_id = message.get("videoId")
+        if video_id not in self.pending:
+            return
+        kind = message.get("type")
+        if kind == "videoScore":
+            self.resolve(video_id, time.monotonic())
+        elif kind == "categoryScore" and video_id not in self.partial_seen:
+            self.partial_seen.add(video_id)
+            self.results.partials += 1
+            self.results.first_partial.append(time.monotonic() - self.pending[video_id])
+        elif kind == "videoDropped":
+            self.results.dropped += 1
+            self.resolve(video_id, None)
+        elif kind == "noCaptions":
+            self.results.no_captions += 1
+            self.resolve(video_id, None)
+
+    def resolve(self, video_id: str, received_at: Optional[float]) -> None:
+        submitted_at = self.pending.pop(video_id, None)
+        if submitted_at is not None and received_at is not None:
+            self.results.latencies.append(received_at - submitted_at)
+        if self.submitted_all and not self.pending:
+            self.done.set()
+
+
+def popular_videos(count: int, catalogue: int, rng: random.Random) -> List[str]:
+    """
+    Picks distinct videos for a tab, favouring popular ones (Zipf-like), so
+    tabs overlap the way real feeds do.
+    """
+    weights = [1 / (rank + 1) for rank in range(catalogue)]
+    chosen: Dict[str, None] = {}
+    while len(chosen) < min(count, catalogue):
+        rank = rng.choices(range(catalogue), weights)[0]
+        chosen[f"bench{rank:06d}"] = None
+    return list(chosen)
+
+
+async def start_server(args: argparse.Namespace) -> asyncio.subprocess.Process:
+    """
+    Starts the app in a separate process, so the simulated tabs do not
+    compete with it for its event loop, and waits until it answers.
+    """
+    server = await asyncio.create_subprocess_exec(
+        sys.executable,
+        "-m",
+        "backend.bench.benchmark",
+        "--serve",
+        "--port",
+        str(args.port),
+        "--log-level",
+        args.log_level,
+    )
+    async with httpx.AsyncClient() as http:
+        while True:
+            if server.returncode is not None:
+                raise RuntimeError(f"Server exited with code {server.returncode}")
+            try:
+                await http.get(f"http://127.0.0.1:{args.port}/ping")
+                return server
+            except httpx.TransportError:
+                await asyncio.sleep(0.1)
+
+
+async def run_benchmark(args: argparse.Namespace) -> Dict[str, Any]:
+    server = await start_server(args)
+    try:
+        return await run_tabs(args, server.pid)
+    finally:
+        # uvicorn shuts down gracefully on SIGTERM, running the lifespan exit
+        server.terminate()
+        await server.wait()
+
+
+async def run_tabs(args: argparse.Namespace, server_pid: int) -> Dict[str, Any]:
+    base_url = f"http://127.0.0.1:{args.port}"
+    ws_url = f"ws://127.0.0.1:{args.port}/ws?protocol={args.protocol}"
+    rng = random.Random(args.seed)
+    results = Results()
+    rss_before = rss_mb(server_pid)
+    limits = httpx.Limits(max_connections=args.http_connections)
+    async with httpx.AsyncClient(limits=limits, timeout=args.timeout) as http:
+        tabs = [
+            Tab(
+                base_url,
+                ws_url,
+                http,
+                results,
+                popular_videos(args.videos_per_tab, args.catalogue, rng),
+                args.submit_interval,
+                args.timeout,
+            )
+            for _ in range(args.tabs)
+        ]
+
+        async def open_tab(index: int, tab: Tab) -> None:
+            # Tabs open evenly over the ramp-up time
+            await asyncio.sleep(args.ramp * index / max(1, len(tabs)))
+            await tab.run()
+
+        started_at = time.monotonic()
+        await asyncio.gather(*(open_tab(i, tab) for i, tab in enumerate(tabs)))
+        elapsed = time.monotonic() - started_at
+        queue_stats = (await http.get(base_url + "/api/queue/stats")).json()
+    rss_after, rss_peak = rss_mb(server_pid), peak_rss_mb(server_pid)
+    fakes = queue_stats["fakes"]
+
+    latencies = results.latencies
+    return {
+        "tabs": args.tabs,
+        "elapsedSeconds": round(elapsed, 2),
+        "submitted": results.submitted,
+        "scored": len(latencies),
+        "cached": results.cached,
+        "rejected": results.rejected,
+        "dropped": results.dropped,
+        "noCaptions": results.no_captions,
+        "timedOut": results.timed_out,
+        "failed": results.failed,
+        "websocket": {
+            "protocol": args.protocol,
+            "frames": results.frames,
+            "bytes": results.frame_bytes,
+        },
+        "throughputPerSecond": round(len(latencies) / elapsed, 2) if elapsed else 0,
+        "latencySeconds": {
+            "p50": round(percentile(latencies, 0.5), 3),
+            "p90": round(percentile(latencies, 0.9), 3),
+            "p99": round(percentile(latencies, 0.99), 3),
+            "max": round(max(latencies, default=0.0), 3),
+        },
+        "firstPartialSeconds": {
+            "count": results.partials,
+            "p50": round(percentile(results.first_partial, 0.5), 3),
+            "p99": round(percentile(results.first_partial, 0.99), 3),
+        },
+        "loopLagSeconds": fakes["loopLagSeconds"],
+        "memoryMB": {
+            "before": round(rss_before, 1),
+            "after": round(rss_after, 1),
+            "peak": round(rss_peak, 1),
+        },
+        "model": fakes["model"],
+        "captions": fakes["captions"],
+        "queue": {
+            key: queue_stats.get(key)
+            for key in ("coalesced", "expired", "abandoned", "shed", "rejected")
+        },
+        "concurrency": queue_stats.get("concurrency"),
+        "tiers": queue_stats.get("tiers"),
+    }
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    latency = report["latencySeconds"]
+    lag = report["loopLagSeconds"]
+    memory = report["memoryMB"]
+    model = report["model"]
+    print(f"Tabs:            {report['tabs']} in {report['elapsedSeconds']}s")
+    print(
+        f"Videos:          {report['submitted']} submitted, {report['scored']} "
+        f"scored ({report['cached']} cached), {report['rejected']} rejected, "
+        f"{report['dropped']} dropped, {report['noCaptions']} without captions, "
+        f"{report['timedOut']} timed out, "
+        f"{report['failed']} failed"
+    )
+    print(f"Throughput:      {report['throughputPerSecond']} results/s")
+    print(
+        f"WebSocket:       {report['websocket']['frames']} frames, "
+        f"{report['websocket']['bytes']} bytes ({report['websocket']['protocol']})"
+    )
+    print(
+        f"Latency:         p50 {latency['p50']}s  p90 {latency['p90']}s  "
+        f"p99 {latency['p99']}s  max {latency['max']}s"
+    )
+    print(
+        f"First partial:   p50 {report['firstPartialSeconds']['p50']}s  "
+        f"p99 {report['firstPartialSeconds']['p99']}s"
+    )
+    print(f"Loop lag:        p50 {lag['p50']}s  p99 {lag['p99']}s  max {lag['max']}s")
+    print(
+        f"Memory:          {memory['before']} MB before, {memory['after']} MB "
+        f"after, {memory['peak']} MB peak"
+    )
+    print(
+        f"Model:           {model['calls']} calls for {model['videos']} videos, "
+        f"{model['rateLimited']} rate limited, {model['errors']} errors, "
+        f"{model['promptTokens']} + {model['completionTokens']} tokens"
+    )
+    print(
+        f"Captions:        {report['captions']['downloads']} downloads, "
+        f"{report['captions']['errors']} errors"
+    )
+    print(f"Queue:           {report['queue']}")
+    if report["tiers"]:
+        tiers = report["tiers"]
+        print(
+            f"Escalations:     {tiers['escalated']} of {tiers['checked']} results "
+            f"({tiers['byReason']}), {tiers['kept']} kept the cheap result"
+        )
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--tabs", type=int, default=500)
+    parser.add_argument("--videos-per-tab", type=int, default=10)
+    parser.add_argument(
+        "--catalogue", type=int, default=2000, help="Distinct videos to pick from"
+    )
+    parser.add_argument(
+        "--ramp", type=float, default=5.0, help="Seconds to open every tab"
+    )
+    parser.add_argument(
+        "--submit-interval",
+        type=float,
+        default=0.05,
+        help="Mean seconds between the submissions of a tab",
+    )
+    parser.add_argument(
+        "--timeout", type=float, default=60.0, help="Seconds a tab waits for scores"
+    )
+    parser.add_argument(
+        "--protocol",
+        choices=("json", "compact", "msgpack"),
+        default="json",
+        help="WebSocket protocol of the tabs",
+    )
+    parser.add_argument("--llm-latency", type=float, default=1.5)
+    parser.add_argument("--llm-jitter", type=float, default=0.5)
+    parser.add_argument("--llm-rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--caption-latency", type=float, default=0.3)
+    parser.add_argument("--caption-jitter", type=float, default=0.1)
+    parser.add_argument("--caption-error-rate", type=float, default=0.0)
+    parser.add_argument(
+        "--caption-unavailable-rate",
+        type=float,
+        default=0.0,
+        help="Videos without captions, their tabs get noCaptions instead of a score",
+    )
+    parser.add_argument("--caption-words", type=int, default=600)
+    parser.add_argument("--http-connections", type=int, default=200)
+    parser.add_argument("--port", type=int, default=3900)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--log-level", default="ERROR")
+    parser.add_argument(
+        "--json", action="store_true", help="Print the report as JSON, as a baseline"
+    )
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+def serve(args: argparse.Namespace) -> None:
+    """
+    Runs the app of the benchmark, in the process started by `start_server`.
+    """
+    logging.basicConfig(level=args.log_level.upper())
+    # Imported here, after the logging is configured
+    import uvicorn
+
+    from backend.main import app
+
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning")
+
+
+def main() -> None:
+    args = parse_args()
+    if args.serve:
+        serve(args)
+        return
+    random.seed(args.seed)
+    # Read by the server process: cold caches, a placeholder key for the
+    # fake model and the fakes' options
+    data_dir = tempfile.mkdtemp(prefix="tubewarden-bench-")
+    os.environ["CACHE_DB_PATH"] = os.path.join(data_dir, "results.sqlite3")
+    os.environ["TRANSCRIPT_CACHE_DB_PATH"] = os.path.join(
+        data_dir, "transcripts.sqlite3"
+    )
+    os.environ["BROKER_DB_PATH"] = os.path.join(data_dir, "broker.sqlite3")
+    os.environ["JOURNAL_DB_PATH"] = os.path.join(data_dir, "journal.sqlite3")
+    os.environ.setdefault("OPENAI_API_KEY", "bench")
+    os.environ["FAKE_BACKENDS"] = "1"
+    for name in (
+        "seed",
+        "llm_latency",
+        "llm_jitter",
+        "llm_rate_limit_rate",
+        "llm_error_rate",
+        "caption_latency",
+        "caption_jitter",
+        "caption_error_rate",
+        "caption_unavailable_rate",
+        "caption_words",
+    ):
+        os.environ["FAKE_" + name.upper()] = str(getattr(args, name))
+    logging.basicConfig(level=args.log_level.upper())
+
+    report = asyncio.run(run_benchmark(args))
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,331 @@
+import ast
+import asyncio
+import json
+import os
+import random
+import re
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+import httpx
+from youtube_transcript_api import TranscriptsDisabled
+
+# Fields of the prompts built by backend.agent.agent
+PROMPT_CATEGORIES = re.compile(r"Categories:(\[.*?\])\.")
+PROMPT_BATCH_VIDEO = re.compile(r"VideoId:([^.\s]+)\.URL:")
+PROMPT_VIDEO = re.compile(r"watch\?v=([^.\s]+)\.")
+
+NEGATIVE = {"hatred", "misinformation", "violence", "fraud"}
+WORDS = (
+    "today we look at how the recipe comes together with a few simple steps "
+    "and some tips on timing the sauce so everything is ready at once"
+).split()
+
+
+class FakeLatency:
+    """
+    Latency drawn from a normal distribution, never below zero.
+    """
+
+    def __init__(self, mean: float, jitter: float):
+        self.mean = mean
+        self.jitter = jitter
+
+    def sample(self) -> float:
+        return max(0.0, random.gauss(self.mean, self.jitter))
+
+
+class FakeLLM(httpx.AsyncBaseTransport):
+    """
+    Stands in for the OpenAI chat completions API. Answers every evaluation
+    prompt with a well-formed result for each video and category, streamed
+    when asked to, after a configurable latency. A share of the calls fails
+    with 429 or 500, like a loaded provider.
+    """
+
+    def __init__(
+        self,
+        latency: FakeLatency,
+        rate_limit_rate: float = 0.0,
+        error_rate: float = 0.0,
+        stream_pieces: int = 20,
+    ):
+        self.latency = latency
+        self.rate_limit_rate = rate_limit_rate
+        self.error_rate = error_rate
+        self.stream_pieces = stream_pieces
+        self.calls = 0
+        self.rate_limited = 0
+        self.errors = 0
+        self.videos = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        self.calls += 1
+        body = json.loads(request.content)
+        draw = random.random()
+        if draw < self.rate_limit_rate:
+            self.rate_limited += 1
+            await asyncio.sleep(0.01)
+            return httpx.Response(
+                429,
+                headers={"retry-after-ms": "500"},
+                json={"error": {"message": "Rate limit reached", "type": "requests"}},
+            )
+        if draw < self.rate_limit_rate + self.error_rate:
+            self.errors += 1
+            await asyncio.sleep(self.latency.sample() / 2)
+            return httpx.Response(
+                500, json={"error": {"message": "Server error", "type": "server"}}
+            )
+
+        prompt = body["messages"][-1]["content"]
+        content = json.dumps(self.answer(prompt))
+        prompt_tokens = sum(len(m["content"]) for m in body["messages"]) // 4
+        completion_tokens = len(content) // 4
+        self.prompt_tokens += prompt_tokens
+        self.completion_tokens += completion_tokens
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        }
+        latency = self.latency.sample()
+        if body.get("stream"):
+            return httpx.Response(
+                200,
+                headers={"content-type": "text/event-stream"},
+                content=self.stream(body["model"], content, usage, latency),
+            )
+        await asyncio.sleep(latency)
+        return httpx.Response(
+            200,
+            json={
+                "id": "chatcmpl-bench",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": body["model"],
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": {"role": "assistant", "content": content},
+                        "finish_reason": "stop",
+                    }
+                ],
+                "usage": usage,
+            },
+        )
+
+    async def stream(
+        self, model: str, content: str, usage: dict, latency: float
+    ) -> AsyncIterator[bytes]:
+        # Half the latency before the first token, the rest spread over the
+        # pieces of the answer
+        await asyncio.sleep(latency / 2)
+        size = max(1, len(content) // self.stream_pieces + 1)
+        pieces = [content[i : i + size] for i in range(0, len(content), size)]
+        for index, piece in enumerate(pieces):
+            last = index == len(pieces) - 1
+            chunk = {
+                "id": "chatcmpl-bench",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [
+                    {
+                        "index": 0,
+                        "delta": {"content": piece},
+                        "finish_reason": "stop" if last else None,
+                    }
+                ],
+            }
+            if last:
+                chunk["usage"] = usage
+            yield f"data: {json.dumps(chunk)}\n\n".encode()
+            await asyncio.sleep(latency / 2 / len(pieces))
+        yield b"data: [DONE]\n\n"
+
+    def answer(self, prompt: str) -> dict:
+        match = PROMPT_CATEGORIES.search(prompt)
+        try:
+            categories = ast.literal_eval(match.group(1)) if match else []
+        except (SyntaxError, ValueError):
+            categories = []
+        batch = PROMPT_BATCH_VIDEO.findall(prompt)
+        if batch:
+            self.videos += len(batch)
+            return {
+                "results": [
+                    {"videoId": video_id, **self.evaluation(video_id, categories)}
+                    for video_id in batch
+                ]
+            }
+        self.videos += 1
+        match = PROMPT_VIDEO.search(prompt)
+        return self.evaluation(match.group(1) if match else "", categories)
+
+    @staticmethod
+    def evaluation(video_id: str, categories: List[str]) -> dict:
+        # Stable scores per video, so repeated runs are comparable. Harmful
+        # content is rare, so negative categories mostly score near 10
+        rng = random.Random(video_id)
+        scored = [
+            {
+                "name": name,
+                "score": round(
+                    (
+                        min(10.0, max(0.0, rng.gauss(9, 1.5)))
+                        if name in NEGATIVE
+                        else rng.uniform(0, 10)
+                    ),
+                    1,
+                ),
+                "connotation": "negative" if name in NEGATIVE else "positive",
+                "reason": "Benchmark score.",
+            }
+            for name in categories
+        ]
+        return {
+            "categories": scored,
+            "overall": {
+                "score": round(
+                    sum(c["score"] for c in scored) / len(scored) if scored else 5, 1
+                ),
+                "reason": "Benchmark score.",
+                "confidence": round(rng.uniform(0.5, 1.0), 2),
+            },
+            "error": "",
+            "content_summary": "Benchmark video.",
+        }
+
+
+class FakeYouTube:
+    """
+    Stands in for the caption download of CaptionFetcher. Runs in the
+    fetcher's threads like the real download, with a configurable latency, a
+    share of transient failures (retried) and of videos without captions.
+    """
+
+    def __init__(
+        self,
+        latency: FakeLatency,
+        error_rate: float = 0.0,
+        unavailable_rate: float = 0.0,
+        words: int = 600,
+    ):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.unavailable_rate = unavailable_rate
+        self.words = words
+        self.downloads = 0
+        self.errors = 0
+
+    def download(self, video_id: str) -> str:
+        self.downloads += 1
+        time.sleep(self.latency.sample())
+        rng = random.Random(video_id)
+        if rng.random() < self.unavailable_rate:
+            raise TranscriptsDisabled(video_id)
+        if random.random() < self.error_rate:
+            self.errors += 1
+            raise ConnectionError("Fake caption download failed")
+        count = rng.randint(self.words // 2, self.words * 3 // 2)
+        lines = []
+        for _ in range(0, count, 12):
+            lines.append(" ".join(rng.choice(WORDS) for _ in range(12)))
+        return "\n".join(lines)
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class LoopLagMonitor:
+    """
+    Measures how late a periodic timer fires, which is how long the event
+    loop was kept busy by other work.
+    """
+
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.lags: List[float] = []
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self.lags.append(max(0.0, loop.time() - expected))
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "p50": round(percentile(self.lags, 0.5), 4),
+            "p99": round(percentile(self.lags, 0.99), 4),
+            "max": round(max(self.lags, default=0.0), 4),
+        }
+
+
+class FakeBackends:
+    """
+    The fakes the app uses instead of the model provider and YouTube when
+    FAKE_BACKENDS is set, and the lag of the app's event loop they run on.
+    The benchmark configures them through the FAKE_* variables, since the
+    app runs in its own process.
+    """
+
+    def __init__(self, llm: FakeLLM, youtube: FakeYouTube):
+        self.llm = llm
+        self.youtube = youtube
+        self.lag = LoopLagMonitor()
+
+    @classmethod
+    def from_environment(cls) -> "FakeBackends":
+        def number(name: str, default: float) -> float:
+            return float(os.getenv("FAKE_" + name, default))
+
+        random.seed(int(number("SEED", 1)))
+        return cls(
+            FakeLLM(
+                FakeLatency(number("LLM_LATENCY", 1.5), number("LLM_JITTER", 0.5)),
+                number("LLM_RATE_LIMIT_RATE", 0.0),
+                number("LLM_ERROR_RATE", 0.0),
+            ),
+            FakeYouTube(
+                FakeLatency(
+                    number("CAPTION_LATENCY", 0.3), number("CAPTION_JITTER", 0.1)
+                ),
+                number("CAPTION_ERROR_RATE", 0.0),
+                number("CAPTION_UNAVAILABLE_RATE", 0.0),
+                int(number("CAPTION_WORDS", 600)),
+            ),
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "model": {
+                "calls": self.llm.calls,
+                "videos": self.llm.videos,
+                "rateLimited": self.llm.rate_limited,
+                "errors": self.llm.errors,
+                "promptTokens": self.llm.prompt_tokens,
+                "completionTokens": self.llm.completion_tokens,
+            },
+            "captions": {
+                "downloads": self.youtube.downloads,
+                "errors": self.youtube.errors,
+            },
+            "loopLagSeconds": self.lag.stats(),
+        }
@@ -0,0 +1,319 @@
+import asyncio
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from backend.metrics.metrics import record_cache_lookup
+from backend.schemas.schemas import VideoScoreResult
+
+logger = logging.getLogger("cache")
+
+
+def normalize_categories(categories: List[str]) -> List[str]:
+    """
+    Returns the categories lowercased, stripped, deduplicated and sorted.
+    """
+    return sorted({c.strip().lower() for c in categories or [] if c and c.strip()})
+
+
+def normalize_prompts(custom_prompts: Any) -> List[str]:
+    """
+    Returns the custom prompts that the agent will actually use, sorted.
+    Anything that is not a list is ignored by the agent, so it normalizes to [].
+    """
+    if not isinstance(custom_prompts, list):
+        return []
+    return sorted(p.strip() for p in custom_prompts if isinstance(p, str) and p.strip())
+
+
+def make_cache_key(
+    video_id: str, categories: List[str], custom_prompts: Any = None
+) -> str:
+    """
+    Builds a stable key for an evaluation request.
+
+    Args:
+        video_id (str): ID of the video
+        categories (List[str]): Categories to evaluate
+        custom_prompts (Any): Additional user prompts
+
+    Returns:
+        str: SHA-256 hex digest of the normalized request
+    """
+    normalized = {
+        "videoId": video_id.strip(),
+        "categories": normalize_categories(categories),
+        "customPrompts": normalize_prompts(custom_prompts),
+    }
+    payload = json.dumps(normalized, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """
+    Two-level cache of video evaluation results.
+    A bounded in-memory LRU sits in front of a SQLite table, so hits survive
+    restarts. Both levels expire entries after `ttl_seconds`.
+    Reads do not write: the access times of hits are kept in memory and
+    written with the next `set`, and the table is trimmed to
+    `disk_max_entries` once every `evict_every` sets.
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        ttl_seconds: int,
+        max_entries: int,
+        disk_max_entries: int,
+        evict_every: int = 100,
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.disk_max_entries = disk_max_entries
+        self.evict_every = max(1, evict_every)
+        self.hits = 0
+        self.misses = 0
+        self._memory: "OrderedDict[str, Tuple[float, dict]]" = OrderedDict()
+        # Last access of the keys hit since the previous set
+        self._touched: Dict[str, float] = {}
+        self._sets = 0
+        self._db_lock = threading.Lock()
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS results (
+                key TEXT PRIMARY KEY,
+                video_id TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                expires_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+            """
+        )
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS idx_results_accessed ON results (accessed_at)"
+        )
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS idx_results_video "
+            "ON results (video_id, expires_at)"
+        )
+        self._db.commit()
+
+    async def get(self, key: str) -> Optional[VideoScoreResult]:
+        """
+        Returns the cached result for `key`, or None on a miss or expired entry.
+        """
+        now = time.time()
+        entry = self._memory.get(key)
+        if entry is not None:
+            expires_at, data = entry
+            if expires_at > now:
+                self._memory.move_to_end(key)
+                self._touched[key] = now
+                self.hits += 1
+                record_cache_lookup("result", 1)
+                return VideoScoreResult.from_dict(data)
+            del self._memory[key]
+
+        row = await asyncio.to_thread(self._db_get, key, now)
+        if row is None:
+            self.misses += 1
+            record_cache_lookup("result", 0, 1)
+            return None
+
+        expires_at, data = row
+        self._memory_set(key, expires_at, data)
+        self._touched[key] = now
+        self.hits += 1
+        record_cache_lookup("result", 1)
+        return VideoScoreResult.from_dict(data)
+
+    async def get_many(self, keys: List[str]) -> Dict[str, VideoScoreResult]:
+        """
+        Looks up several keys with a single disk query for the memory misses.
+
+        Returns:
+            Dict[str, VideoScoreResult]: Cached results by key, misses are omitted
+        """
+        now = time.time()
+        found: Dict[str, VideoScoreResult] = {}
+        missing: List[str] = []
+        for key in keys:
+            entry = self._memory.get(key)
+            if entry is not None and entry[0] > now:
+                self._memory.move_to_end(key)
+                self._touched[key] = now
+                found[key] = VideoScoreResult.from_dict(entry[1])
+            else:
+                self._memory.pop(key, None)
+                missing.append(key)
+
+        if missing:
+            rows = await asyncio.to_thread(self._db_get_many, missing, now)
+            for key, (expires_at, data) in rows.items():
+                self._memory_set(key, expires_at, data)
+                self._touched[key] = now
+                found[key] = VideoScoreResult.from_dict(data)
+
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        record_cache_lookup("result", len(found), len(keys) - len(found))
+        return found
+
+    async def latest_many(self, video_ids: List[str]) -> Dict[str, VideoScoreResult]:
+        """
+        Returns the most recent result of each video, whatever categories and
+        prompts it was evaluated with.
+
+        Returns:
+            Dict[str, VideoScoreResult]: Results by video ID, videos without
+                one are omitted
+        """
+        if not video_ids:
+            return {}
+        rows = await asyncio.to_thread(self._db_latest_many, video_ids, time.time())
+        return {
+            video_id: VideoScoreResult.from_dict(data)
+            for video_id, data in rows.items()
+        }
+
+    async def expiring(self, keys: List[str], within: float) -> List[str]:
+        """
+        Returns the keys whose result is stored but expires in the next
+        `within` seconds.
+        """
+        deadline = time.time() + within
+        expiring = []
+        missing = []
+        for key in keys:
+            entry = self._memory.get(key)
+            if entry is None:
+                missing.append(key)
+            elif entry[0] <= deadline:
+                expiring.append(key)
+        if missing:
+            rows = await asyncio.to_thread(self._db_expiry_many, missing)
+            expiring.extend(key for key, expires_at in rows if expires_at <= deadline)
+        return expiring
+
+    async def set(self, key: str, result: VideoScoreResult) -> None:
+        """
+        Stores `result` under `key` in memory and on disk.
+        """
+        data = result.to_dict()
+        expires_at = time.time() + self.ttl_seconds
+        self._memory_set(key, expires_at, data)
+        touched, self._touched = self._touched, {}
+        self._sets += 1
+        await asyncio.to_thread(
+            self._db_set,
+            key,
+            result.video_id,
+            expires_at,
+            data,
+            touched,
+            self._sets % self.evict_every == 0,
+        )
+
+    def close(self) -> None:
+        touched, self._touched = self._touched, {}
+        with self._db_lock:
+            self._db_touch(touched)
+            self._db.commit()
+            self._db.close()
+
+    def _memory_set(self, key: str, expires_at: float, data: dict) -> None:
+        self._memory[key] = (expires_at, data)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _db_get(self, key: str, now: float) -> Optional[Tuple[float, dict]]:
+        with self._db_lock:
+            row = self._db.execute(
+                "SELECT expires_at, payload FROM results "
+                "WHERE key = ? AND expires_at > ?",
+                (key, now),
+            ).fetchone()
+        if row is None:
+            return None
+        return row[0], json.loads(row[1])
+
+    def _db_get_many(
+        self, keys: List[str], now: float
+    ) -> Dict[str, Tuple[float, dict]]:
+        placeholders = ",".join("?" for _ in keys)
+        with self._db_lock:
+            rows = self._db.execute(
+                f"SELECT key, expires_at, payload FROM results "
+                f"WHERE key IN ({placeholders}) AND expires_at > ?",
+                (*keys, now),
+            ).fetchall()
+        return {row[0]: (row[1], json.loads(row[2])) for row in rows}
+
+    def _db_latest_many(self, video_ids: List[str], now: float) -> Dict[str, dict]:
+        placeholders = ",".join("?" for _ in video_ids)
+        with self._db_lock:
+            # SQLite returns the row holding MAX() for the bare columns
+            rows = self._db.execute(
+                f"SELECT video_id, payload, MAX(expires_at) FROM results "
+                f"WHERE video_id IN ({placeholders}) AND expires_at > ? "
+                f"GROUP BY video_id",
+                (*video_ids, now),
+            ).fetchall()
+        return {row[0]: json.loads(row[1]) for row in rows}
+
+    def _db_expiry_many(self, keys: List[str]) -> List[Tuple[str, float]]:
+        placeholders = ",".join("?" for _ in keys)
+        with self._db_lock:
+            return self._db.execute(
+                f"SELECT key, expires_at FROM results WHERE key IN ({placeholders})",
+                keys,
+            ).fetchall()
+
+    def _db_touch(self, touched: Dict[str, float]) -> None:
+        if touched:
+            self._db.executemany(
+                "UPDATE results SET accessed_at = ? WHERE key = ?",
+                [(accessed_at, key) for key, accessed_at in touched.items()],
+            )
+
+    def _db_set(
+        self,
+        key: str,
+        video_id: str,
+        expires_at: float,
+        data: dict,
+        touched: Dict[str, float],
+        evict: bool,
+    ) -> None:
+        now = time.time()
+        with self._db_lock:
+            self._db_touch(touched)
+            self._db.execute(
+                """
+                INSERT OR REPLACE INTO results
+                    (key, video_id, payload, expires_at, accessed_at)
+                VALUES (?, ?, ?, ?, ?)
+                """,
+                (key, video_id, json.dumps(data), expires_at, now),
+            )
+            if evict:
+                self._db.execute("DELETE FROM results WHERE expires_at <= ?", (now,))
+                # Evict least recently used rows once the table is over capacity
+                self._db.execute(
+                    """
+                    DELETE FROM results WHERE key IN (
+                        SELECT key FROM results ORDER BY accessed_at DESC
+                        LIMIT -1 OFFSET ?
+                    )
+                    """,
+                    (self.disk_max_entries,),
+                )
+            self._db.commit()
@@ -0,0 +1,128 @@
+import asyncio
+import hashlib
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from backend.metrics.metrics import record_cache_lookup
+
+
+def transcript_digest(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class TranscriptCache:
+    """
+    Content-addressed store of video transcripts.
+    Each distinct transcript text is stored once under its SHA-256 digest and
+    videos point at a digest, so re-uploads and mirrors share one copy.
+    Recently used transcripts are also kept in a bounded in-memory LRU.
+    """
+
+    def __init__(self, db_path: str, ttl_seconds: int, max_entries: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._memory: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._db_lock = threading.Lock()
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS transcripts (
+                digest TEXT PRIMARY KEY,
+                text TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS video_transcripts (
+                video_id TEXT PRIMARY KEY,
+                digest TEXT NOT NULL REFERENCES transcripts (digest),
+                expires_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_video_transcripts_expires
+                ON video_transcripts (expires_at);
+            """
+        )
+        self._db.commit()
+
+    async def get(self, video_id: str) -> Optional[str]:
+        """
+        Returns the cached transcript of a video, or None if missing or expired.
+        """
+        now = time.time()
+        entry = self._memory.get(video_id)
+        if entry is not None:
+            if entry[0] > now:
+                self._memory.move_to_end(video_id)
+                record_cache_lookup("transcript", 1)
+                return entry[1]
+            del self._memory[video_id]
+
+        row = await asyncio.to_thread(self._db_get, video_id, now)
+        if row is None:
+            record_cache_lookup("transcript", 0, 1)
+            return None
+        self._memory_set(video_id, *row)
+        record_cache_lookup("transcript", 1)
+        return row[1]
+
+    async def set(self, video_id: str, text: str) -> str:
+        """
+        Stores the transcript of a video.
+
+        Returns:
+            str: Digest the transcript is stored under
+        """
+        digest = transcript_digest(text)
+        expires_at = time.time() + self.ttl_seconds
+        self._memory_set(video_id, expires_at, text)
+        await asyncio.to_thread(self._db_set, video_id, digest, expires_at, text)
+        return digest
+
+    def close(self) -> None:
+        with self._db_lock:
+            self._db.close()
+
+    def _memory_set(self, video_id: str, expires_at: float, text: str) -> None:
+        self._memory[video_id] = (expires_at, text)
+        self._memory.move_to_end(video_id)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _db_get(self, video_id: str, now: float) -> Optional[Tuple[float, str]]:
+        with self._db_lock:
+            return self._db.execute(
+                """
+                SELECT v.expires_at, t.text
+                FROM video_transcripts v JOIN transcripts t ON t.digest = v.digest
+                WHERE v.video_id = ? AND v.expires_at > ?
+                """,
+                (video_id, now),
+            ).fetchone()
+
+    def _db_set(self, video_id: str, digest: str, expires_at: float, text: str):
+        with self._db_lock:
+            self._db.execute(
+                "INSERT OR IGNORE INTO transcripts (digest, text) VALUES (?, ?)",
+                (digest, text),
+            )
+            self._db.execute(
+                """
+                INSERT OR REPLACE INTO video_transcripts (video_id, digest, expires_at)
+                VALUES (?, ?, ?)
+                """,
+                (video_id, digest, expires_at),
+            )
+            # Drop expired pointers and the transcripts nobody points at anymore
+            expired = self._db.execute(
+                "DELETE FROM video_transcripts WHERE expires_at <= ?", (time.time(),)
+            ).rowcount
+            if expired:
+                self._db.execute(
+                    """
+                    DELETE FROM transcripts WHERE digest NOT IN (
+                        SELECT digest FROM video_transcripts
+                    )
+                    """
+                )
+            self._db.commit()
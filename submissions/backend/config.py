@@ -1,3 +1,5 @@
+import os
+
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -12,10 +14,146 @@ class Settings:
     APP_NAME: str = "YouTube Agent"
     DEBUG: bool = False
     HOST: str = "0.0.0.0"
-    PORT: int = 3000
+    PORT: int = int(os.getenv("PORT", 3000))
     MODEL: str = "gpt-4.1-mini"
+    LLM_TIMEOUT_SECONDS: float = float(os.getenv("LLM_TIMEOUT_SECONDS", 120))
     WORKERS: int = 8
+    CAPTION_WORKERS: int = int(os.getenv("CAPTION_WORKERS", 16))
+
+    # Evaluations in flight adapt to the provider, starting at WORKERS
+    CONCURRENCY_MIN: int = int(os.getenv("CONCURRENCY_MIN", 1))
+    CONCURRENCY_MAX: int = int(os.getenv("CONCURRENCY_MAX", 32))
+    CONCURRENCY_LATENCY_TOLERANCE: float = float(
+        os.getenv("CONCURRENCY_LATENCY_TOLERANCE", 2.0)
+    )
+    CONCURRENCY_BACKOFF: float = float(os.getenv("CONCURRENCY_BACKOFF", 0.7))
+
+    # Long-lived agent clients shared by the workers
+    AGENT_POOL_SIZE: int = int(os.getenv("AGENT_POOL_SIZE", CONCURRENCY_MAX))
+    AGENT_POOL_MAX_CONNECTIONS: int = int(os.getenv("AGENT_POOL_MAX_CONNECTIONS", 4))
+    AGENT_POOL_MAX_FAILURES: int = int(os.getenv("AGENT_POOL_MAX_FAILURES", 3))
+    AGENT_POOL_MAX_USES: int = int(os.getenv("AGENT_POOL_MAX_USES", 1000))
     WS_ENDPOINT: str = "/ws"
+    # "memory" for a single process, "sqlite" to share jobs and results
+    # between the processes that open BROKER_DB_PATH
+    BROKER: str = os.getenv("BROKER", "memory")
+    BROKER_DB_PATH: str = os.getenv("BROKER_DB_PATH", "broker.sqlite3")
+    BROKER_POLL_INTERVAL: float = float(os.getenv("BROKER_POLL_INTERVAL", 0.2))
+    BROKER_LEASE_SECONDS: float = float(os.getenv("BROKER_LEASE_SECONDS", 600))
+    # On-disk journal of the memory broker's jobs, replayed after a restart
+    JOURNAL_ENABLED: bool = os.getenv("JOURNAL_ENABLED", "1") == "1"
+    JOURNAL_DB_PATH: str = os.getenv("JOURNAL_DB_PATH", "journal.sqlite3")
+    # Events are written together at most this often (group commit)
+    JOURNAL_FLUSH_INTERVAL: float = float(os.getenv("JOURNAL_FLUSH_INTERVAL", 0.05))
+    # API-only replicas leave the evaluations to the worker processes
+    RUN_WORKERS: bool = os.getenv("RUN_WORKERS", "1") == "1"
+    # Serve the model and YouTube with the benchmark's fakes, configured by
+    # the FAKE_* variables (see backend.bench.fakes)
+    FAKE_BACKENDS: bool = os.getenv("FAKE_BACKENDS", "0") == "1"
+    # Admission control
+    QUEUE_MAX_DEPTH: int = int(os.getenv("QUEUE_MAX_DEPTH", 2000))
+    QUEUE_RETRY_AFTER_SECONDS: int = int(os.getenv("QUEUE_RETRY_AFTER_SECONDS", 10))
+    RATE_LIMIT_PER_MINUTE: float = float(os.getenv("RATE_LIMIT_PER_MINUTE", 600))
+    RATE_LIMIT_BURST: int = int(os.getenv("RATE_LIMIT_BURST", 200))
+
+    # Seconds a queued job stays useful, by priority
+    QUEUE_DEADLINES: dict = {
+        "visible": float(os.getenv("QUEUE_DEADLINE_VISIBLE", 120)),
+        "prefetch": float(os.getenv("QUEUE_DEADLINE_PREFETCH", 300)),
+        "background": float(os.getenv("QUEUE_DEADLINE_BACKGROUND", 900)),
+    }
+
+    # Caption fetching stage
+    CAPTION_LANGUAGES: list = os.getenv("CAPTION_LANGUAGES", "en,es").split(",")
+    CAPTION_MAX_RETRIES: int = int(os.getenv("CAPTION_MAX_RETRIES", 2))
+    CAPTION_RETRY_BASE_DELAY: float = float(os.getenv("CAPTION_RETRY_BASE_DELAY", 0.5))
+    TRANSCRIPT_CACHE_DB_PATH: str = os.getenv(
+        "TRANSCRIPT_CACHE_DB_PATH", "transcript_cache.sqlite3"
+    )
+    TRANSCRIPT_CACHE_TTL_SECONDS: int = int(
+        os.getenv("TRANSCRIPT_CACHE_TTL_SECONDS", 7 * 24 * 60 * 60)
+    )
+    TRANSCRIPT_CACHE_MAX_ENTRIES: int = int(
+        os.getenv("TRANSCRIPT_CACHE_MAX_ENTRIES", 500)
+    )
+
+    # Transcript token budget per deployment
+    TRANSCRIPT_MAX_TOKENS: int = int(os.getenv("TRANSCRIPT_MAX_TOKENS", 8000))
+    TRANSCRIPT_CHUNK_TOKENS: int = int(os.getenv("TRANSCRIPT_CHUNK_TOKENS", 4000))
+    TRANSCRIPT_MAX_CHUNKS: int = int(os.getenv("TRANSCRIPT_MAX_CHUNKS", 6))
+    # "sample" or "map_reduce"
+    TRANSCRIPT_STRATEGY: str = os.getenv("TRANSCRIPT_STRATEGY", "sample")
+
+    # Pack several short transcripts into one model call
+    SCORING_BATCH_ENABLED: bool = os.getenv("SCORING_BATCH_ENABLED", "1") == "1"
+    SCORING_BATCH_MAX_VIDEOS: int = int(os.getenv("SCORING_BATCH_MAX_VIDEOS", 8))
+    SCORING_BATCH_MAX_TOKENS: int = int(os.getenv("SCORING_BATCH_MAX_TOKENS", 12000))
+    # Only transcripts up to this size are batched
+    SCORING_BATCH_VIDEO_MAX_TOKENS: int = int(
+        os.getenv("SCORING_BATCH_VIDEO_MAX_TOKENS", 2000)
+    )
+    SCORING_BATCH_LINGER_MS: int = int(os.getenv("SCORING_BATCH_LINGER_MS", 50))
+
+    # Keyword pre-screen that settles videos without speech and sends
+    # provisional flags before the model
+    PRESCREEN_ENABLED: bool = os.getenv("PRESCREEN_ENABLED", "1") == "1"
+    # Fewer words than this means the captions carry no speech
+    PRESCREEN_MIN_WORDS: int = int(os.getenv("PRESCREEN_MIN_WORDS", 8))
+    # Different marker phrases needed to flag a negative category
+    PRESCREEN_MIN_HITS: int = int(os.getenv("PRESCREEN_MIN_HITS", 3))
+    PRESCREEN_FLAG_SCORE: float = float(os.getenv("PRESCREEN_FLAG_SCORE", 2.0))
+
+    # "cascade" scores with TIER_CHEAP_MODEL first and sends doubtful results
+    # to MODEL, "single" scores everything with MODEL
+    TIER_POLICY: str = os.getenv("TIER_POLICY", "cascade")
+    TIER_CHEAP_MODEL: str = os.getenv("TIER_CHEAP_MODEL", "gpt-4.1-nano")
+    # Results the model is less confident about than this are escalated
+    TIER_MIN_CONFIDENCE: float = float(os.getenv("TIER_MIN_CONFIDENCE", 0.6))
+    # Harmful categories scored within this range are escalated
+    TIER_HARMFUL_CATEGORIES: list = os.getenv(
+        "TIER_HARMFUL_CATEGORIES", "hatred,misinformation,violence,fraud"
+    ).split(",")
+    TIER_BORDERLINE_LOW: float = float(os.getenv("TIER_BORDERLINE_LOW", 3.0))
+    TIER_BORDERLINE_HIGH: float = float(os.getenv("TIER_BORDERLINE_HIGH", 6.0))
+    # Escalated evaluations in flight, the cheap tier is bounded by
+    # AGENT_POOL_SIZE and the concurrency limiter
+    TIER_STRONG_CONCURRENCY: int = int(os.getenv("TIER_STRONG_CONCURRENCY", 4))
+
+    # "json_schema" binds the model output to the result schema, "json_object"
+    # only asks for JSON, "off" leaves it to the prompt
+    STRUCTURED_OUTPUT: str = os.getenv("STRUCTURED_OUTPUT", "json_schema")
+    # Malformed responses are sent back to the model to be fixed
+    PARSE_REPAIR_ATTEMPTS: int = int(os.getenv("PARSE_REPAIR_ATTEMPTS", 1))
+    PARSE_REPAIR_MAX_CHARS: int = int(os.getenv("PARSE_REPAIR_MAX_CHARS", 8000))
+
+    # Send each category score as soon as the model produces it
+    STREAM_PARTIAL_RESULTS: bool = os.getenv("STREAM_PARTIAL_RESULTS", "1") == "1"
+
+    BATCH_MAX_VIDEOS: int = int(os.getenv("BATCH_MAX_VIDEOS", 100))
+    WS_SEND_QUEUE_SIZE: int = int(os.getenv("WS_SEND_QUEUE_SIZE", 256))
+    # Compact protocol clients get the messages of each window in one frame
+    WS_BATCH_WINDOW_MS: int = int(os.getenv("WS_BATCH_WINDOW_MS", 25))
+    WS_BATCH_MAX_MESSAGES: int = int(os.getenv("WS_BATCH_MAX_MESSAGES", 64))
+
+    # Evaluation result cache (in-memory LRU backed by SQLite)
+    CACHE_DB_PATH: str = os.getenv("CACHE_DB_PATH", "result_cache.sqlite3")
+    CACHE_TTL_SECONDS: int = int(os.getenv("CACHE_TTL_SECONDS", 24 * 60 * 60))
+    CACHE_MAX_ENTRIES: int = int(os.getenv("CACHE_MAX_ENTRIES", 5000))
+    CACHE_DISK_MAX_ENTRIES: int = int(os.getenv("CACHE_DISK_MAX_ENTRIES", 100000))
+    # Expired and least recently used rows are deleted once every this many writes
+    CACHE_DISK_EVICT_EVERY: int = int(os.getenv("CACHE_DISK_EVICT_EVERY", 100))
+
+    # Results sent in the last RESULT_REPLAY_SECONDS go to late subscribers
+    RESULT_REPLAY_SECONDS: float = float(os.getenv("RESULT_REPLAY_SECONDS", 300))
+    RESULT_REPLAY_MAX_ENTRIES: int = int(os.getenv("RESULT_REPLAY_MAX_ENTRIES", 5000))
+
+    # Trending evaluations are scored again before their result expires
+    PREWARM_ENABLED: bool = os.getenv("PREWARM_ENABLED", "1") == "1"
+    PREWARM_INTERVAL: float = float(os.getenv("PREWARM_INTERVAL", 300))
+    PREWARM_TOP: int = int(os.getenv("PREWARM_TOP", 50))
+    PREWARM_REFRESH_BEFORE: float = float(os.getenv("PREWARM_REFRESH_BEFORE", 3600))
+    # Demand of a video halves after this many seconds without requests
+    PREWARM_HALF_LIFE: float = float(os.getenv("PREWARM_HALF_LIFE", 3600))
 
 
 def get_settings():
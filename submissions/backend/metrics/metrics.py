@@ -0,0 +1,274 @@
+import math
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+# Worker the current task belongs to, set once by each pipeline worker
+worker_label: ContextVar[str] = ContextVar("worker_label", default="api")
+
+# Seconds, from a cached lookup to a slow model call
+LATENCY_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+    120.0,
+)
+TOKEN_BUCKETS = (100, 250, 500, 1000, 2000, 4000, 8000, 16000, 32000)
+FANOUT_BUCKETS = (0, 1, 2, 5, 10, 25, 50, 100)
+BYTES_BUCKETS = (128, 256, 512, 1024, 2048, 4096, 8192, 16384, 65536)
+
+LabelValues = Tuple[str, ...]
+
+
+def format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    pairs = (f'{name}="{escape_label(value)}"' for name, value in zip(names, values))
+    return "{" + ",".join(pairs) + "}"
+
+
+class Metric:
+    """
+    A metric family in the Prometheus text exposition format.
+    """
+
+    kind = "untyped"
+
+    def __init__(self, name: str, description: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(name, "")) for name in self.labels)
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        return [
+            f"# HELP {self.name} {self.description}",
+            f"# TYPE {self.name} {self.kind}",
+            *self.samples(),
+        ]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, description: str, labels: Sequence[str] = ()):
+        super().__init__(name, description, labels)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self) -> List[str]:
+        return [
+            f"{self.name}{format_labels(self.labels, key)} {format_value(value)}"
+            for key, value in sorted(self._values.items())
+        ]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels: str) -> None:
+        self._values[self._key(labels)] = value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ):
+        super().__init__(name, description, labels)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        # Per label set: count of each bucket (not cumulative), sum and count
+        self._values: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        entry = self._values.get(key)
+        if entry is None:
+            entry = self._values[key] = ([0] * len(self.buckets), [0.0, 0])
+        counts, totals = entry
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[index] += 1
+                break
+        totals[0] += value
+        totals[1] += 1
+
+    def samples(self) -> List[str]:
+        lines = []
+        bucket_labels = self.labels + ("le",)
+        for key, (counts, totals) in sorted(self._values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                labels = format_labels(bucket_labels, key + (format_value(bound),))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = format_labels(self.labels, key)
+            lines.append(f"{self.name}_sum{labels} {format_value(totals[0])}")
+            lines.append(f"{self.name}_count{labels} {format_value(totals[1])}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: List[Metric] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.register(
+    Histogram(
+        "tubewarden_stage_seconds",
+        "Time spent in each pipeline stage",
+        ("stage", "worker"),
+    )
+)
+LLM_TOKENS = REGISTRY.register(
+    Histogram(
+        "tubewarden_llm_tokens",
+        "Tokens used per model call",
+        ("stage", "worker", "direction"),
+        TOKEN_BUCKETS,
+    )
+)
+PARSE_FAILURES = REGISTRY.register(
+    Counter(
+        "tubewarden_parse_failures_total",
+        "Model responses that were truncated or unreadable",
+        ("stage", "worker", "outcome"),
+    )
+)
+WS_FANOUT = REGISTRY.register(
+    Histogram(
+        "tubewarden_ws_fanout_clients",
+        "Local clients each message was queued for",
+        ("type", "worker"),
+        FANOUT_BUCKETS,
+    )
+)
+WS_FRAME_BYTES = REGISTRY.register(
+    Histogram(
+        "tubewarden_ws_frame_bytes",
+        "Size of each WebSocket frame sent, by protocol",
+        ("protocol",),
+        BYTES_BUCKETS,
+    )
+)
+WS_ACTIVE_CONNECTIONS = REGISTRY.register(
+    Gauge("tubewarden_ws_active_connections", "Connected WebSocket clients")
+)
+ESCALATIONS = REGISTRY.register(
+    Counter(
+        "tubewarden_escalations_total",
+        "Results of the cheap model checked by the strong one, by reason",
+        ("reason",),
+    )
+)
+CACHE_LOOKUPS = REGISTRY.register(
+    Counter(
+        "tubewarden_cache_lookups_total",
+        "Cache lookups by cache and result",
+        ("cache", "result"),
+    )
+)
+CACHE_HIT_RATIO = REGISTRY.register(
+    Gauge(
+        "tubewarden_cache_hit_ratio",
+        "Share of lookups served by each cache",
+        ("cache",),
+    )
+)
+QUEUE_DEPTH = REGISTRY.register(
+    Gauge("tubewarden_queue_depth", "Jobs waiting in the queue")
+)
+CONCURRENCY_LIMIT = REGISTRY.register(
+    Gauge("tubewarden_concurrency_limit", "Evaluations allowed in flight")
+)
+IN_FLIGHT = REGISTRY.register(
+    Gauge("tubewarden_evaluations_in_flight", "Evaluations in flight")
+)
+
+
+def observe_stage(stage: str, seconds: float, worker: Optional[str] = None) -> None:
+    STAGE_SECONDS.observe(seconds, stage=stage, worker=worker or worker_label.get())
+
+
+@contextmanager
+def timed(stage: str, worker: Optional[str] = None) -> Iterator[None]:
+    """
+    Records the time spent in the block, whether or not it raises.
+    """
+    started_at = time.monotonic()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.monotonic() - started_at, worker)
+
+
+def record_cache_lookup(cache: str, hits: int, misses: int = 0) -> None:
+    if hits:
+        CACHE_LOOKUPS.inc(hits, cache=cache, result="hit")
+    if misses:
+        CACHE_LOOKUPS.inc(misses, cache=cache, result="miss")
+
+
+def render(queue_depth: int, concurrency: Dict[str, float]) -> str:
+    """
+    Renders every metric, after refreshing the ones read at scrape time.
+    """
+    QUEUE_DEPTH.set(queue_depth)
+    CONCURRENCY_LIMIT.set(concurrency["limit"])
+    IN_FLIGHT.set(concurrency["inFlight"])
+    for cache in ("result", "transcript"):
+        hits = CACHE_LOOKUPS.value(cache=cache, result="hit")
+        total = hits + CACHE_LOOKUPS.value(cache=cache, result="miss")
+        CACHE_HIT_RATIO.set(hits / total if total else 0.0, cache=cache)
+    return REGISTRY.render()
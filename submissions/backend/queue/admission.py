@@ -0,0 +1,84 @@
+import time
+from typing import Dict, Tuple
+
+
+class AdmissionError(Exception):
+    """
+    Raised when a request cannot be admitted right now.
+    `retry_after` is the number of seconds the client should wait.
+    """
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class QueueFullError(AdmissionError):
+    """
+    Raised when the queue is at capacity and nothing can be shed.
+    """
+
+
+class RateLimitedError(AdmissionError):
+    """
+    Raised when a client submits faster than its rate limit.
+    """
+
+
+class RateLimiter:
+    """
+    Per-client token bucket.
+    Each client may submit `burst` videos at once and `rate_per_minute`
+    videos per minute on average.
+    """
+
+    def __init__(self, rate_per_minute: float, burst: int, max_clients: int = 10000):
+        self.rate = rate_per_minute / 60
+        self.burst = burst
+        self.max_clients = max_clients
+        self.limited = 0
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+
+    def acquire(self, client: str, cost: int = 1) -> None:
+        """
+        Takes `cost` tokens from the client's bucket.
+
+        Raises:
+            RateLimitedError: If the bucket does not hold enough tokens
+        """
+        # A request larger than the bucket would never be admitted
+        cost = min(cost, self.burst)
+        now = time.monotonic()
+        tokens, updated_at = self._buckets.get(client, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated_at) * self.rate)
+        if tokens < cost:
+            self.limited += 1
+            retry_after = (cost - tokens) / self.rate if self.rate else 60
+            raise RateLimitedError(
+                f"Rate limit exceeded for client {client}",
+                max(1, int(retry_after + 0.999)),
+            )
+        self._buckets[client] = (tokens - cost, now)
+        if len(self._buckets) > self.max_clients:
+            self._prune(now)
+
+    def refund(self, client: str, cost: int = 1) -> None:
+        """
+        Gives back the tokens of a request that was not admitted after all.
+        """
+        bucket = self._buckets.get(client)
+        if bucket is not None:
+            tokens, updated_at = bucket
+            self._buckets[client] = (
+                min(self.burst, tokens + min(cost, self.burst)),
+                updated_at,
+            )
+
+    def _prune(self, now: float) -> None:
+        # Buckets that are full again behave like new ones, forget them
+        refill = self.burst / self.rate if self.rate else float("inf")
+        self._buckets = {
+            client: bucket
+            for client, bucket in self._buckets.items()
+            if now - bucket[1] < refill
+        }
@@ -0,0 +1,101 @@
+import logging
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Dict, Optional
+
+from backend.cache.result_cache import make_cache_key
+from backend.queue.admission import QueueFullError
+from backend.queue.job_queue import Job, VideoQueue
+from backend.ws.connection_manager import ConnectionManager
+
+logger = logging.getLogger("broker")
+
+
+class Broker(ABC):
+    """
+    Carries jobs from the API to the workers, and results from the workers to
+    the node holding each subscriber's socket.
+    """
+
+    def __init__(self, manager: ConnectionManager):
+        self.manager = manager
+
+    @abstractmethod
+    def create_queue(
+        self,
+        deadlines: Dict[str, float],
+        max_depth: int,
+        retry_after: int,
+        is_wanted: Optional[Callable[[Job], bool]] = None,
+        on_drop: Optional[Callable[[Job, str], None]] = None,
+    ):
+        """
+        Returns the job queue used by the API and the workers.
+        """
+
+    @abstractmethod
+    def publish(self, key: str, message: Any) -> int:
+        """
+        Delivers a message to the subscribers of the evaluation `key` on every
+        node.
+
+        Returns:
+            int: Number of clients of this node the message was queued for
+        """
+
+    async def start(self) -> None:
+        pass
+
+    async def close(self) -> None:
+        pass
+
+
+class InProcessBroker(Broker):
+    """
+    Single process broker: jobs stay in memory and results go straight to
+    the local sockets. With a journal, the jobs left unfinished by the
+    previous process are queued again on start.
+    """
+
+    def __init__(self, manager: ConnectionManager, journal=None):
+        super().__init__(manager)
+        self.journal = journal
+        self._queue: Optional[VideoQueue] = None
+
+    def create_queue(
+        self,
+        deadlines: Dict[str, float],
+        max_depth: int,
+        retry_after: int,
+        is_wanted: Optional[Callable[[Job], bool]] = None,
+        on_drop: Optional[Callable[[Job, str], None]] = None,
+    ) -> VideoQueue:
+        self._queue = VideoQueue(
+            deadlines, max_depth, retry_after, is_wanted, on_drop, self.journal
+        )
+        return self._queue
+
+    def publish(self, key: str, message: Any) -> int:
+        return self.manager.send_to_subscribers(key, message)
+
+    async def start(self) -> None:
+        if self.journal is None:
+            return
+        for payload in await self.journal.unfinished():
+            # Subscriptions did not survive the restart: the job is kept
+            # anonymous so it is not abandoned, and clients that submit it
+            # again attach to it
+            payload = payload.model_copy(update={"clientId": None})
+            try:
+                await self._queue.submit(payload)
+            except QueueFullError:
+                logger.warning(f"No room to replay the job of {payload.videoId}")
+                self.journal.completed(
+                    make_cache_key(
+                        payload.videoId, payload.categories, payload.customPrompts
+                    )
+                )
+        await self.journal.start()
+
+    async def close(self) -> None:
+        if self.journal is not None:
+            await self.journal.close()
@@ -0,0 +1,443 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from collections import OrderedDict, deque
+from typing import Any, Callable, Deque, Dict, Iterable, List, Optional, Set, Tuple
+
+from backend.cache.result_cache import (
+    make_cache_key,
+    normalize_categories,
+    normalize_prompts,
+)
+from backend.metrics.metrics import observe_stage
+from backend.queue.admission import QueueFullError
+from backend.schemas.schemas import ActionRequest, EvaluationResult
+
+logger = logging.getLogger("queue")
+
+
+PRIORITY_RANK = {"visible": 0, "prefetch": 1, "background": 2}
+
+
+class AgeStats:
+    """
+    Time jobs spent queued before a worker picked them up, per priority.
+    Percentiles are computed over the most recent `window` jobs.
+    """
+
+    def __init__(self, window: int = 1024):
+        self.count: Dict[str, int] = {p: 0 for p in PRIORITY_RANK}
+        self.max: Dict[str, float] = {p: 0.0 for p in PRIORITY_RANK}
+        self.recent: Dict[str, Deque[float]] = {
+            p: deque(maxlen=window) for p in PRIORITY_RANK
+        }
+
+    def record(self, priority: str, age: float) -> None:
+        observe_stage("queue_wait", age)
+        self.count[priority] += 1
+        self.max[priority] = max(self.max[priority], age)
+        self.recent[priority].append(age)
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        snapshot = {}
+        for priority, recent in self.recent.items():
+            ages = sorted(recent)
+            snapshot[priority] = {
+                "count": self.count[priority],
+                "p50": ages[len(ages) // 2] if ages else 0.0,
+                "p95": ages[int(len(ages) * 0.95)] if ages else 0.0,
+                "max": self.max[priority],
+            }
+        return snapshot
+
+
+class Job:
+    """
+    A queued video evaluation.
+    Every submission of the same request shares the job and its future.
+    `clients` holds the clients that asked for it, and `anonymous` whether a
+    submission came without a client, which keeps the job wanted for good.
+    """
+
+    def __init__(self, key: str, payload: ActionRequest, deadline: float):
+        self.key = key
+        self.payload = payload
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.submissions = 1
+        self.priority = payload.priority
+        self.deadline = deadline
+        self.clients: Set[str] = {payload.clientId} if payload.clientId else set()
+        self.anonymous = not payload.clientId
+        # "queued", then "running" once a worker picks it up
+        self.state = "queued"
+        # Set while the job is scored, with the jobs scored in the same call
+        self.task: Optional[asyncio.Task] = None
+        self.batch: List["Job"] = []
+        # Jobs in the same group share categories and prompts, so they can be
+        # scored together in one model call
+        self.group = (
+            tuple(normalize_categories(payload.categories)),
+            tuple(normalize_prompts(payload.customPrompts)),
+        )
+        # Filled in by the caption stage
+        self.chunks: List[str] = []
+        self.tokens = 0
+        self.created_at = time.monotonic()
+        # When it was handed over to the scoring stage
+        self.ready_at = 0.0
+
+    @property
+    def rank(self) -> int:
+        return PRIORITY_RANK[self.priority]
+
+
+class VideoQueue:
+    """
+    Bounded priority queue of evaluation jobs with in-flight request coalescing.
+    Jobs are served by priority (visible, prefetch, background) and then in
+    arrival order. A submission whose key is already queued or running
+    attaches to that job instead of adding a new one, promoting it if it asks
+    for a higher priority. Jobs past their deadline, or that no connected
+    client wants anymore, are dropped when dequeued. Jobs are cancelled as
+    soon as the last client that asked for them cancels or disconnects.
+    When `max_depth` jobs are queued, new jobs shed queued jobs of lower
+    priority, newest first, or are rejected with QueueFullError.
+    Jobs are recorded in the journal, if any, so they survive a restart.
+    """
+
+    def __init__(
+        self,
+        deadlines: Dict[str, float],
+        max_depth: int,
+        retry_after: int,
+        is_wanted: Optional[Callable[[Job], bool]] = None,
+        on_drop: Optional[Callable[[Job, str], None]] = None,
+        journal=None,
+    ):
+        self.deadlines = deadlines
+        self.max_depth = max_depth
+        self.retry_after = retry_after
+        self.is_wanted = is_wanted
+        self.on_drop = on_drop
+        self.journal = journal
+        self._queue: asyncio.PriorityQueue = asyncio.PriorityQueue()
+        self._pending: Dict[str, Job] = {}
+        # Queued jobs by priority in arrival order, to pick what to shed
+        self._queued: Dict[str, "OrderedDict[str, Job]"] = {
+            p: OrderedDict() for p in PRIORITY_RANK
+        }
+        self._sequence = itertools.count()
+        self.coalesced = 0
+        self.expired = 0
+        self.abandoned = 0
+        self.shed = 0
+        self.rejected = 0
+        self.cancelled = 0
+        self.interrupted = 0
+        self.failed = 0
+        self.age_stats = AgeStats()
+
+    async def submit(self, payload: ActionRequest) -> Tuple[Job, bool]:
+        """
+        Enqueues an evaluation request unless an identical one is pending.
+
+        Args:
+            payload (ActionRequest): Request to evaluate
+
+        Returns:
+            Tuple[Job, bool]: The job handling the request and whether it was created
+
+        Raises:
+            QueueFullError: If the queue is full and nothing can be shed
+        """
+        return (await self.submit_many([payload]))[0]
+
+    async def submit_many(
+        self, payloads: List[ActionRequest]
+    ) -> List[Tuple[Job, bool]]:
+        """
+        Enqueues several requests in one step, coalescing each one like `submit`.
+        The batch is admitted as a whole or not at all.
+
+        Raises:
+            QueueFullError: If the queue cannot make room for the new jobs
+        """
+        keys = {
+            make_cache_key(p.videoId, p.categories, p.customPrompts) for p in payloads
+        }
+        new_jobs = len(keys.difference(self._pending))
+        if new_jobs:
+            rank = min(PRIORITY_RANK[p.priority] for p in payloads)
+            if not self._make_room(new_jobs, rank, keys):
+                self.rejected += new_jobs
+                raise QueueFullError(
+                    f"Queue is full ({self.qsize()}/{self.max_depth} jobs)",
+                    self.retry_after,
+                )
+        return [self._submit_nowait(payload) for payload in payloads]
+
+    def _make_room(self, needed: int, rank: int, keep: Set[str]) -> bool:
+        """
+        Ensures `needed` free slots, shedding queued jobs of lower priority
+        than `rank` if necessary. Jobs whose key is in `keep` are not shed.
+        """
+        free = self.max_depth - self.qsize()
+        if free >= needed:
+            return True
+        lower = [p for p, r in PRIORITY_RANK.items() if r > rank]
+        candidates = [
+            job
+            for priority in reversed(lower)
+            for key, job in reversed(self._queued[priority].items())
+            if key not in keep
+        ]
+        if free + len(candidates) < needed:
+            return False
+        for job in candidates[: needed - free]:
+            del self._queued[job.priority][job.key]
+            job.state = "shed"
+            self.shed += 1
+            self._drop(job, "shed")
+        return True
+
+    def _submit_nowait(self, payload: ActionRequest) -> Tuple[Job, bool]:
+        key = make_cache_key(payload.videoId, payload.categories, payload.customPrompts)
+        deadline = time.monotonic() + (
+            payload.deadlineMs / 1000
+            if payload.deadlineMs is not None
+            else self.deadlines[payload.priority]
+        )
+        job = self._pending.get(key)
+        if job is not None:
+            job.submissions += 1
+            job.deadline = max(job.deadline, deadline)
+            if payload.clientId:
+                job.clients.add(payload.clientId)
+            else:
+                job.anonymous = True
+            self.coalesced += 1
+            if job.state == "queued" and PRIORITY_RANK[payload.priority] < job.rank:
+                # The old heap entry is skipped when it comes up
+                del self._queued[job.priority][key]
+                job.priority = payload.priority
+                self._queued[job.priority][key] = job
+                self._put(job)
+            logger.info(
+                f"Coalesced video {payload.videoId} into pending job "
+                f"({job.submissions} submissions)"
+            )
+            return job, False
+
+        job = Job(key, payload, deadline)
+        self._pending[key] = job
+        if self.journal is not None:
+            self.journal.enqueued(key, payload)
+        self._queued[job.priority][key] = job
+        self._put(job)
+        return job, True
+
+    def _put(self, job: Job) -> None:
+        self._queue.put_nowait((job.rank, next(self._sequence), job))
+
+    async def get(self) -> Job:
+        """
+        Returns the next job to process, dropping stale ones on the way.
+        """
+        while True:
+            rank, _, job = await self._queue.get()
+            if job.state != "queued" or rank != job.rank:
+                # Superseded by a promotion, or already handled
+                self._queue.task_done()
+                continue
+
+            job.state = "running"
+            del self._queued[job.priority][job.key]
+            if self.journal is not None:
+                self.journal.started(job.key)
+            now = time.monotonic()
+            self.age_stats.record(job.priority, now - job.created_at)
+            if self.is_stale(job, now):
+                self._queue.task_done()
+                continue
+            return job
+
+    def is_stale(self, job: Job, now: Optional[float] = None) -> bool:
+        """
+        Whether the job is past its deadline or no client wants it anymore.
+        """
+        if job.state == "cancelled":
+            return True
+        if (now or time.monotonic()) > job.deadline:
+            self.expired += 1
+            self._drop(job, "expired")
+            return True
+        if self.is_wanted is not None and not self.is_wanted(job):
+            self.abandoned += 1
+            self._drop(job, "abandoned")
+            return True
+        return False
+
+    def cancel(self, client_id: str, video_ids: Optional[Iterable[str]] = None) -> int:
+        """
+        Withdraws the client from its jobs, or from its jobs for the given
+        videos. The jobs no other client wants anymore are cancelled: queued
+        ones are dropped, and the scoring of running ones is cancelled once
+        every job scored in the same call is.
+
+        Returns:
+            int: Number of jobs cancelled
+        """
+        wanted = set(video_ids) if video_ids is not None else None
+        cancelled = 0
+        for job in list(self._pending.values()):
+            if client_id not in job.clients:
+                continue
+            if wanted is not None and job.payload.videoId not in wanted:
+                continue
+            job.clients.discard(client_id)
+            if job.anonymous or (
+                job.clients and (self.is_wanted is None or self.is_wanted(job))
+            ):
+                continue
+            if job.state == "queued":
+                del self._queued[job.priority][job.key]
+            job.state = "cancelled"
+            self.cancelled += 1
+            cancelled += 1
+            self._drop(job, "cancelled")
+            if job.task is not None and all(
+                other.state == "cancelled" for other in job.batch
+            ):
+                self.interrupted += job.task.cancel()
+        return cancelled
+
+    def fail(self, job: Job) -> None:
+        """
+        Drops a job whose evaluation failed, so its clients can submit it
+        again later.
+        """
+        self.failed += 1
+        self._drop(job, "failed")
+
+    def _drop(self, job: Job, reason: str) -> None:
+        logger.info(f"Dropping {reason} job for video {job.payload.videoId}")
+        self.complete(job, None)
+        if self.on_drop is not None:
+            self.on_drop(job, reason)
+
+    def task_done(self) -> None:
+        self._queue.task_done()
+
+    def qsize(self) -> int:
+        return sum(len(queued) for queued in self._queued.values())
+
+    def pending(self) -> int:
+        """
+        Number of jobs queued or running.
+        """
+        return len(self._pending)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queued": self.qsize(),
+            "queuedByPriority": {p: len(q) for p, q in self._queued.items()},
+            "maxDepth": self.max_depth,
+            "pending": self.pending(),
+            "coalesced": self.coalesced,
+            "expired": self.expired,
+            "abandoned": self.abandoned,
+            "shed": self.shed,
+            "rejected": self.rejected,
+            "cancelled": self.cancelled,
+            "interrupted": self.interrupted,
+            "failed": self.failed,
+            "ageAtDequeue": self.age_stats.snapshot(),
+        }
+
+    def complete(self, job: Job, result: Optional[EvaluationResult]) -> None:
+        """
+        Releases the job key and hands the result to every waiter.
+        A failed or dropped evaluation resolves with None.
+        """
+        if self._pending.get(job.key) is job:
+            del self._pending[job.key]
+            if self.journal is not None:
+                self.journal.completed(job.key)
+        if not job.future.done():
+            job.future.set_result(result)
+
+
+class ScoringQueue:
+    """
+    Bounded hand-off of captioned jobs to the scoring stage, served by
+    priority and then in arrival order like VideoQueue.
+    Caption workers reserve room before taking a job from VideoQueue, so
+    jobs only leave it, in priority order, once they can be handed over.
+    Scoring workers wait for a job to be ready, then for an evaluation slot,
+    and only then take the best job queued at that moment. No job therefore
+    waits inside a worker while a more urgent one queues behind it.
+    """
+
+    def __init__(self, maxsize: int):
+        # Jobs ready plus jobs whose caption is being fetched
+        self.maxsize = maxsize
+        self.reserved = 0
+        self._heap: List[Tuple[int, int, Job]] = []
+        self._sequence = itertools.count()
+        self._changed = asyncio.Condition()
+
+    async def reserve(self) -> None:
+        """
+        Waits until there is room for one more job and keeps it.
+        """
+        async with self._changed:
+            await self._changed.wait_for(
+                lambda: len(self._heap) + self.reserved < self.maxsize
+            )
+            self.reserved += 1
+
+    async def release(self) -> None:
+        """
+        Gives back a reservation that will not be used.
+        """
+        async with self._changed:
+            self.reserved -= 1
+            self._changed.notify_all()
+
+    async def put(self, job: Job) -> None:
+        """
+        Queues the job in the room reserved for it.
+        """
+        async with self._changed:
+            self.reserved -= 1
+            job.ready_at = time.monotonic()
+            heapq.heappush(self._heap, (job.rank, next(self._sequence), job))
+            self._changed.notify_all()
+
+    async def ready(self) -> None:
+        """
+        Waits until a job is queued, without taking it.
+        """
+        async with self._changed:
+            await self._changed.wait_for(lambda: bool(self._heap))
+
+    async def take(
+        self, accept: Optional[Callable[[Job], bool]] = None
+    ) -> Optional[Job]:
+        """
+        Removes and returns the next job, if there is one and `accept`, if
+        given, takes it.
+        """
+        async with self._changed:
+            if not self._heap:
+                return None
+            if accept is not None and not accept(self._heap[0][2]):
+                return None
+            job = heapq.heappop(self._heap)[2]
+            self._changed.notify_all()
+            return job
+
+    def qsize(self) -> int:
+        return len(self._heap)
@@ -0,0 +1,153 @@
+import asyncio
+import logging
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from backend.queue.sqlite_util import transaction
+from backend.schemas.schemas import ActionRequest
+
+logger = logging.getLogger("journal")
+
+# (event, key, payload) as recorded, the payload only for "enqueue"
+Event = Tuple[str, str, Optional[str]]
+
+
+class JobJournal:
+    """
+    On-disk log of the jobs of the in-memory queue, so the jobs of a process
+    that stops or crashes are evaluated after the restart.
+
+    Enqueue, start and complete events are appended to a SQLite table in WAL
+    mode. Events are buffered in memory and written together every
+    `flush_interval` seconds in a single transaction (group commit), so
+    submissions never wait for the disk. A complete event removes every event
+    of its job, so the table only holds unfinished jobs. A crash loses at most
+    the events of the last `flush_interval`, and a job may be evaluated again
+    if it finished right before it (at-least-once).
+    """
+
+    def __init__(self, db_path: str, flush_interval: float):
+        self.flush_interval = flush_interval
+        self._events: List[Event] = []
+        self._task: Optional[asyncio.Task] = None
+        self.commits = 0
+        self.written = 0
+        self.replayed = 0
+        self._db_lock = threading.Lock()
+        self._db = sqlite3.connect(
+            db_path, check_same_thread=False, isolation_level=None, timeout=30
+        )
+        self._db.execute("PRAGMA journal_mode=WAL")
+        # Commits survive a crash of the process, only a power loss may
+        # roll back the last ones
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS job_events (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                key TEXT NOT NULL,
+                event TEXT NOT NULL,
+                payload TEXT,
+                created_at REAL NOT NULL
+            )
+            """
+        )
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS idx_job_events_key ON job_events (key)"
+        )
+
+    def enqueued(self, key: str, payload: ActionRequest) -> None:
+        self._events.append(("enqueue", key, payload.model_dump_json()))
+
+    def started(self, key: str) -> None:
+        self._events.append(("start", key, None))
+
+    def completed(self, key: str) -> None:
+        self._events.append(("complete", key, None))
+
+    async def unfinished(self) -> List[ActionRequest]:
+        """
+        Returns the requests of the jobs that were queued or running when the
+        previous process stopped, in submission order.
+        """
+        rows = await asyncio.to_thread(self._db_unfinished)
+        payloads: Dict[str, ActionRequest] = {}
+        interrupted = 0
+        for key, event, payload in rows:
+            if event == "enqueue" and key not in payloads:
+                payloads[key] = ActionRequest.model_validate_json(payload)
+            elif event == "start":
+                interrupted += 1
+        if payloads:
+            logger.info(
+                f"Replaying {len(payloads)} unfinished jobs, "
+                f"{interrupted} of them were running"
+            )
+        self.replayed += len(payloads)
+        return list(payloads.values())
+
+    async def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        await self.flush()
+        with self._db_lock:
+            self._db.close()
+
+    async def flush(self) -> None:
+        events, self._events = self._events, []
+        if not events:
+            return
+        try:
+            await asyncio.to_thread(self._db_write, events)
+        except Exception:
+            # Kept for the next commit
+            self._events = events + self._events
+            raise
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Error writing the job journal: {e}", exc_info=True)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "buffered": len(self._events),
+            "written": self.written,
+            "commits": self.commits,
+            "replayed": self.replayed,
+        }
+
+    def _db_write(self, events: List[Event]) -> None:
+        now = time.time()
+        with self._db_lock:
+            with transaction(self._db):
+                # In order, so a key completed and enqueued again in the same
+                # batch keeps its new job
+                for event, key, payload in events:
+                    if event == "complete":
+                        self._db.execute("DELETE FROM job_events WHERE key = ?", (key,))
+                    else:
+                        self._db.execute(
+                            """
+                            INSERT INTO job_events (key, event, payload, created_at)
+                            VALUES (?, ?, ?, ?)
+                            """,
+                            (key, event, payload, now),
+                        )
+        self.commits += 1
+        self.written += len(events)
+
+    def _db_unfinished(self) -> List[Tuple[str, str, Optional[str]]]:
+        with self._db_lock:
+            return self._db.execute(
+                "SELECT key, event, payload FROM job_events ORDER BY id"
+            ).fetchall()
@@ -0,0 +1,124 @@
+import asyncio
+import logging
+import time
+from typing import Dict, List, Tuple
+
+from backend.cache.result_cache import ResultCache, make_cache_key
+from backend.queue.admission import AdmissionError
+from backend.schemas.schemas import ActionRequest
+
+logger = logging.getLogger("prewarm")
+
+
+class Prewarmer:
+    """
+    Keeps the results of trending videos fresh ahead of demand.
+
+    Every request adds to the demand score of its evaluation, which halves
+    every `half_life` seconds. Every `interval` seconds, the `top` evaluations
+    with the highest demand whose stored result expires within
+    `refresh_before` seconds are scored again as background jobs, so their
+    next requests are still served from stored results.
+    """
+
+    def __init__(
+        self,
+        queue,
+        cache: ResultCache,
+        interval: float,
+        top: int,
+        refresh_before: float,
+        half_life: float,
+        max_tracked: int = 10000,
+    ):
+        self.queue = queue
+        self.cache = cache
+        self.interval = interval
+        self.top = top
+        self.refresh_before = refresh_before
+        self.half_life = half_life
+        self.max_tracked = max_tracked
+        # Demand score of each evaluation key, when it was last updated and
+        # the request to replay
+        self._demand: Dict[str, Tuple[float, float, ActionRequest]] = {}
+        self._task = None
+        self.refreshed = 0
+
+    def record(self, payloads: List[ActionRequest]) -> None:
+        now = time.monotonic()
+        for payload in payloads:
+            key = make_cache_key(
+                payload.videoId, payload.categories, payload.customPrompts
+            )
+            score = self._score(key, now) + 1
+            self._demand[key] = (score, now, payload)
+        if len(self._demand) > self.max_tracked:
+            self._prune(now)
+
+    def trending(self) -> List[Tuple[str, ActionRequest]]:
+        now = time.monotonic()
+        ranked = sorted(
+            self._demand, key=lambda key: self._score(key, now), reverse=True
+        )
+        return [(key, self._demand[key][2]) for key in ranked[: self.top]]
+
+    async def refresh(self) -> int:
+        """
+        Submits the trending evaluations whose result is about to expire.
+
+        Returns:
+            int: Number of jobs submitted
+        """
+        trending = dict(self.trending())
+        if not trending:
+            return 0
+        expiring = await self.cache.expiring(list(trending), self.refresh_before)
+        submitted = 0
+        for key in expiring:
+            payload = trending[key].model_copy(
+                update={"clientId": None, "priority": "background", "deadlineMs": None}
+            )
+            try:
+                _, created = await self.queue.submit(payload)
+            except AdmissionError:
+                # The queue is busy with real demand
+                break
+            submitted += created
+        if submitted:
+            logger.info(f"Refreshing {submitted} trending evaluations")
+        self.refreshed += submitted
+        return submitted
+
+    async def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.error(f"Error refreshing trending videos: {e}", exc_info=True)
+
+    def stats(self) -> Dict[str, int]:
+        return {"tracked": len(self._demand), "refreshed": self.refreshed}
+
+    def _score(self, key: str, now: float) -> float:
+        entry = self._demand.get(key)
+        if entry is None:
+            return 0.0
+        score, updated_at, _ = entry
+        return score * 0.5 ** ((now - updated_at) / self.half_life)
+
+    def _prune(self, now: float) -> None:
+        # Keep the most demanded half
+        ranked = sorted(
+            self._demand, key=lambda key: self._score(key, now), reverse=True
+        )
+        for key in ranked[self.max_tracked // 2 :]:
+            del self._demand[key]
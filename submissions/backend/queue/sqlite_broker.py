@@ -0,0 +1,537 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from backend.cache.result_cache import make_cache_key
+from backend.queue.admission import QueueFullError
+from backend.queue.broker import Broker
+from backend.queue.job_queue import PRIORITY_RANK, AgeStats, Job
+from backend.queue.sqlite_util import transaction
+from backend.schemas.schemas import ActionRequest, EvaluationResult
+from backend.ws.connection_manager import ConnectionManager
+
+logger = logging.getLogger("broker")
+
+RANK_PRIORITY = {rank: priority for priority, rank in PRIORITY_RANK.items()}
+
+
+class SQLiteBroker(Broker):
+    """
+    Broker shared by every process that opens the same SQLite file, so
+    several API processes and worker processes on one host can run together.
+
+    Jobs live in the `jobs` table and are claimed with a lease, so the jobs
+    of a crashed worker are served again once the lease runs out. Each node
+    claims for all its workers at once, as many jobs as it has idle workers.
+    Messages for subscribers are delivered to the local sockets right away and
+    written to the `messages` table, which every node polls to deliver the
+    messages of the other nodes to its own sockets.
+    """
+
+    def __init__(
+        self,
+        manager: ConnectionManager,
+        db_path: str,
+        poll_interval: float,
+        lease_seconds: float,
+        retention_seconds: float = 60,
+    ):
+        super().__init__(manager)
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self.retention_seconds = retention_seconds
+        self.node_id = uuid.uuid4().hex
+        self._outbox: List[Tuple[str, str]] = []
+        self._task: Optional[asyncio.Task] = None
+        self._queue: Optional["SQLiteJobQueue"] = None
+        self._db_lock = threading.Lock()
+        self._db = sqlite3.connect(
+            db_path, check_same_thread=False, isolation_level=None, timeout=30
+        )
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                key TEXT PRIMARY KEY,
+                video_id TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                rank INTEGER NOT NULL,
+                deadline REAL NOT NULL,
+                submissions INTEGER NOT NULL,
+                state TEXT NOT NULL,
+                leased_until REAL,
+                created_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_jobs_state_rank ON jobs (state, rank);
+            CREATE TABLE IF NOT EXISTS messages (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                node_id TEXT NOT NULL,
+                key TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                created_at REAL NOT NULL
+            );
+            """
+        )
+        # Only messages published from now on are delivered
+        self._last_message_id = self._db.execute(
+            "SELECT COALESCE(MAX(id), 0) FROM messages"
+        ).fetchone()[0]
+
+    def create_queue(
+        self,
+        deadlines: Dict[str, float],
+        max_depth: int,
+        retry_after: int,
+        is_wanted: Optional[Callable[[Job], bool]] = None,
+        on_drop: Optional[Callable[[Job, str], None]] = None,
+    ) -> "SQLiteJobQueue":
+        # Subscribers are spread over the nodes, so `is_wanted` cannot be
+        # answered locally and abandoned jobs are only dropped by deadline
+        self._queue = SQLiteJobQueue(self, deadlines, max_depth, retry_after, on_drop)
+        return self._queue
+
+    def publish(self, key: str, message: Any) -> int:
+        self._outbox.append((key, json.dumps(message)))
+        return self.manager.send_to_subscribers(key, message)
+
+    async def start(self) -> None:
+        self._task = asyncio.create_task(self._pump())
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        if self._queue is not None:
+            await self._queue.close()
+        await asyncio.to_thread(self._db_exchange, self._take_outbox())
+        with self._db_lock:
+            self._db.close()
+
+    async def _pump(self) -> None:
+        while True:
+            try:
+                messages = await asyncio.to_thread(
+                    self._db_exchange, self._take_outbox()
+                )
+                for key, payload in messages:
+                    self.manager.send_to_subscribers(key, json.loads(payload))
+            except Exception as e:
+                logger.error(f"Error exchanging broker messages: {e}", exc_info=True)
+            await asyncio.sleep(self.poll_interval)
+
+    def _take_outbox(self) -> List[Tuple[str, str]]:
+        outbox, self._outbox = self._outbox, []
+        return outbox
+
+    def _db_exchange(self, outbox: List[Tuple[str, str]]) -> List[Tuple[str, str]]:
+        """
+        Writes the outbox, reads the messages published by other nodes and
+        refreshes the queue depth.
+        """
+        now = time.time()
+        with self._db_lock:
+            with transaction(self._db):
+                self._db.executemany(
+                    """
+                    INSERT INTO messages (node_id, key, payload, created_at)
+                    VALUES (?, ?, ?, ?)
+                    """,
+                    [(self.node_id, key, payload, now) for key, payload in outbox],
+                )
+                self._db.execute(
+                    "DELETE FROM messages WHERE created_at < ?",
+                    (now - self.retention_seconds,),
+                )
+            rows = self._db.execute(
+                """
+                SELECT id, node_id, key, payload FROM messages
+                WHERE id > ? ORDER BY id
+                """,
+                (self._last_message_id,),
+            ).fetchall()
+            if self._queue is not None:
+                self._queue._db_count(self._db)
+        if rows:
+            self._last_message_id = rows[-1][0]
+        return [
+            (key, payload) for _, node, key, payload in rows if node != self.node_id
+        ]
+
+
+class SQLiteJobQueue:
+    """
+    Job queue stored in the broker database, with the interface of VideoQueue.
+    Jobs are coalesced by key, served by priority and then in arrival order,
+    and shed or rejected like in VideoQueue when `max_depth` jobs are queued.
+    Counters are kept per node.
+    """
+
+    def __init__(
+        self,
+        broker: SQLiteBroker,
+        deadlines: Dict[str, float],
+        max_depth: int,
+        retry_after: int,
+        on_drop: Optional[Callable[[Job, str], None]] = None,
+    ):
+        self.broker = broker
+        self.deadlines = deadlines
+        self.max_depth = max_depth
+        self.retry_after = retry_after
+        self.on_drop = on_drop
+        self._db = broker._db
+        self._db_lock = broker._db_lock
+        # Jobs claimed by this node, by key
+        self._claimed: Dict[str, Job] = {}
+        # Claimed jobs not yet taken by a worker, and the workers waiting
+        self._ready: "asyncio.Queue[Job]" = asyncio.Queue()
+        self._waiting = 0
+        self._wake = asyncio.Event()
+        self._claimer: Optional[asyncio.Task] = None
+        self._writes: Set[asyncio.Task] = set()
+        self._queued: Dict[str, int] = {p: 0 for p in PRIORITY_RANK}
+        self._running = 0
+        self.coalesced = 0
+        self.expired = 0
+        self.abandoned = 0
+        self.shed = 0
+        self.rejected = 0
+        self.failed = 0
+        self.age_stats = AgeStats()
+
+    async def submit(self, payload: ActionRequest) -> Tuple[Job, bool]:
+        """
+        Enqueues an evaluation request unless an identical one is pending.
+
+        Raises:
+            QueueFullError: If the queue is full and nothing can be shed
+        """
+        return (await self.submit_many([payload]))[0]
+
+    async def submit_many(
+        self, payloads: List[ActionRequest]
+    ) -> List[Tuple[Job, bool]]:
+        """
+        Enqueues several requests in one transaction, as a whole or not at all.
+
+        Raises:
+            QueueFullError: If the queue cannot make room for the new jobs
+        """
+        if not payloads:
+            return []
+        now = time.time()
+        rows = []
+        for payload in payloads:
+            key = make_cache_key(
+                payload.videoId, payload.categories, payload.customPrompts
+            )
+            timeout = (
+                payload.deadlineMs / 1000
+                if payload.deadlineMs is not None
+                else self.deadlines[payload.priority]
+            )
+            rows.append((key, payload, PRIORITY_RANK[payload.priority], now + timeout))
+
+        created, shed = await asyncio.to_thread(self._db_submit, rows, now)
+        for key, payload_json in shed:
+            self.shed += 1
+            job = Job(key, ActionRequest.model_validate_json(payload_json), 0)
+            self._drop(job, "shed")
+        if created is None:
+            self.rejected += len(rows)
+            raise QueueFullError(
+                f"Queue is full ({self.qsize()}/{self.max_depth} jobs)",
+                self.retry_after,
+            )
+
+        results = []
+        for (key, payload, _, deadline), is_new in zip(rows, created):
+            if not is_new:
+                self.coalesced += 1
+                logger.info(f"Coalesced video {payload.videoId} into pending job")
+            results.append((Job(key, payload, self._monotonic(deadline)), is_new))
+        return results
+
+    async def get(self) -> Job:
+        """
+        Takes the next job claimed for this node, waiting for one to be
+        queued by any node.
+        """
+        if self._claimer is None:
+            self._claimer = asyncio.create_task(self._claim())
+        self._waiting += 1
+        self._wake.set()
+        try:
+            while True:
+                job = await self._ready.get()
+                if not self.is_stale(job):
+                    return job
+        finally:
+            self._waiting -= 1
+
+    async def _claim(self) -> None:
+        """
+        Claims jobs for the workers of this node in a single transaction,
+        as many as are waiting, and polls while there are none to claim.
+        """
+        while True:
+            wanted = self._waiting - self._ready.qsize()
+            if wanted <= 0:
+                self._wake.clear()
+                await self._wake.wait()
+                continue
+            try:
+                rows = await asyncio.to_thread(self._db_claim, time.time(), wanted)
+            except Exception as e:
+                logger.error(f"Error claiming jobs: {e}", exc_info=True)
+                rows = []
+            for key, payload_json, rank, deadline, submissions, created_at in rows:
+                job = Job(
+                    key,
+                    ActionRequest.model_validate_json(payload_json),
+                    self._monotonic(deadline),
+                )
+                job.priority = RANK_PRIORITY[rank]
+                job.submissions = submissions
+                job.state = "running"
+                self._claimed[key] = job
+                self.age_stats.record(job.priority, time.time() - created_at)
+                self._ready.put_nowait(job)
+            if len(rows) < wanted:
+                await asyncio.sleep(self.broker.poll_interval)
+
+    async def close(self) -> None:
+        """
+        Stops claiming, hands the jobs no worker took back to the other
+        nodes and waits for the pending writes.
+        """
+        if self._claimer is not None:
+            self._claimer.cancel()
+            await asyncio.gather(self._claimer, return_exceptions=True)
+        unclaimed = []
+        while not self._ready.empty():
+            job = self._ready.get_nowait()
+            self._claimed.pop(job.key, None)
+            unclaimed.append(job.key)
+        await asyncio.gather(*self._writes, return_exceptions=True)
+        if unclaimed:
+            await asyncio.to_thread(self._db_release, unclaimed)
+
+    def is_stale(self, job: Job, now: Optional[float] = None) -> bool:
+        """
+        Whether the job is past its deadline.
+        """
+        if (now or time.monotonic()) > job.deadline:
+            self.expired += 1
+            self._drop(job, "expired")
+            return True
+        return False
+
+    def cancel(self, client_id: str, video_ids: Optional[Iterable[str]] = None) -> int:
+        """
+        Jobs are not tracked per client: their clients may be connected to any
+        node, so jobs are only dropped by deadline.
+        """
+        return 0
+
+    def fail(self, job: Job) -> None:
+        """
+        Drops a job whose evaluation failed, so its clients can submit it
+        again later.
+        """
+        self.failed += 1
+        self._drop(job, "failed")
+
+    def _drop(self, job: Job, reason: str) -> None:
+        logger.info(f"Dropping {reason} job for video {job.payload.videoId}")
+        self.complete(job, None)
+        if self.on_drop is not None:
+            self.on_drop(job, reason)
+
+    def task_done(self) -> None:
+        pass
+
+    def qsize(self) -> int:
+        """
+        Jobs queued by every node, as of the last poll.
+        """
+        return sum(self._queued.values())
+
+    def pending(self) -> int:
+        return self.qsize() + self._running
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "broker": "sqlite",
+            "queued": self.qsize(),
+            "queuedByPriority": dict(self._queued),
+            "maxDepth": self.max_depth,
+            "pending": self.pending(),
+            "coalesced": self.coalesced,
+            "expired": self.expired,
+            "abandoned": self.abandoned,
+            "shed": self.shed,
+            "rejected": self.rejected,
+            "failed": self.failed,
+            "ageAtDequeue": self.age_stats.snapshot(),
+        }
+
+    def complete(self, job: Job, result: Optional[EvaluationResult]) -> None:
+        """
+        Removes the job from the broker and hands the result to local waiters.
+        """
+        if self._claimed.get(job.key) is job:
+            del self._claimed[job.key]
+            task = asyncio.get_running_loop().create_task(
+                asyncio.to_thread(self._db_complete, job.key)
+            )
+            self._writes.add(task)
+            task.add_done_callback(self._writes.discard)
+        if not job.future.done():
+            job.future.set_result(result)
+
+    @staticmethod
+    def _monotonic(deadline: float) -> float:
+        # Deadlines are stored as wall-clock time, shared by every process
+        return time.monotonic() + (deadline - time.time())
+
+    def _db_submit(
+        self, rows: List[Tuple[str, ActionRequest, int, float]], now: float
+    ) -> Tuple[Optional[List[bool]], List[Tuple[str, str]]]:
+        """
+        Returns whether each row created a job, or None if the queue is full,
+        and the jobs shed to make room.
+        """
+        keys = {key for key, _, _, _ in rows}
+        with self._db_lock, transaction(self._db) as db:
+            existing = {
+                key
+                for (key,) in db.execute(
+                    f"SELECT key FROM jobs WHERE key IN ({','.join('?' * len(keys))})",
+                    list(keys),
+                )
+            }
+            needed = len(keys - existing)
+            shed: List[Tuple[str, str]] = []
+            if needed:
+                queued = db.execute(
+                    "SELECT COUNT(*) FROM jobs WHERE state = 'queued'"
+                ).fetchone()[0]
+                free = self.max_depth - queued
+                if free < needed:
+                    rank = min(rank for _, _, rank, _ in rows)
+                    candidates = [
+                        (key, payload)
+                        for key, payload in db.execute(
+                            """
+                            SELECT key, payload FROM jobs
+                            WHERE state = 'queued' AND rank > ?
+                            ORDER BY rank DESC, rowid DESC
+                            """,
+                            (rank,),
+                        )
+                        if key not in keys
+                    ][: needed - free]
+                    if free + len(candidates) < needed:
+                        return None, []
+                    db.executemany(
+                        "DELETE FROM jobs WHERE key = ?",
+                        [(key,) for key, _ in candidates],
+                    )
+                    shed = candidates
+
+            created = []
+            for key, payload, rank, deadline in rows:
+                if key in existing:
+                    db.execute(
+                        """
+                        UPDATE jobs SET
+                            submissions = submissions + 1,
+                            deadline = MAX(deadline, ?),
+                            rank = CASE WHEN state = 'queued'
+                                THEN MIN(rank, ?) ELSE rank END
+                        WHERE key = ?
+                        """,
+                        (deadline, rank, key),
+                    )
+                    created.append(False)
+                    continue
+                db.execute(
+                    """
+                    INSERT INTO jobs (key, video_id, payload, rank, deadline,
+                        submissions, state, created_at)
+                    VALUES (?, ?, ?, ?, ?, 1, 'queued', ?)
+                    """,
+                    (
+                        key,
+                        payload.videoId,
+                        payload.model_dump_json(),
+                        rank,
+                        deadline,
+                        now,
+                    ),
+                )
+                existing.add(key)
+                created.append(True)
+            self._db_count(db)
+            return created, shed
+
+    def _db_claim(self, now: float, limit: int) -> List[Tuple]:
+        with self._db_lock, transaction(self._db) as db:
+            # Jobs of workers that died while holding them are served again
+            db.execute(
+                """
+                UPDATE jobs SET state = 'queued', leased_until = NULL
+                WHERE state = 'running' AND leased_until < ?
+                """,
+                (now,),
+            )
+            rows = db.execute(
+                """
+                SELECT key, payload, rank, deadline, submissions, created_at
+                FROM jobs WHERE state = 'queued'
+                ORDER BY rank, rowid LIMIT ?
+                """,
+                (limit,),
+            ).fetchall()
+            db.executemany(
+                """
+                UPDATE jobs SET state = 'running', leased_until = ?
+                WHERE key = ?
+                """,
+                [(now + self.broker.lease_seconds, row[0]) for row in rows],
+            )
+            self._db_count(db)
+        return rows
+
+    def _db_release(self, keys: List[str]) -> None:
+        with self._db_lock, transaction(self._db) as db:
+            db.executemany(
+                """
+                UPDATE jobs SET state = 'queued', leased_until = NULL
+                WHERE key = ? AND state = 'running'
+                """,
+                [(key,) for key in keys],
+            )
+
+    def _db_count(self, db: sqlite3.Connection) -> None:
+        # Refreshes the depth reported by qsize and stats
+        queued = {p: 0 for p in PRIORITY_RANK}
+        running = 0
+        for state, rank, count in db.execute(
+            "SELECT state, rank, COUNT(*) FROM jobs GROUP BY state, rank"
+        ):
+            if state == "queued":
+                queued[RANK_PRIORITY[rank]] = count
+            else:
+                running += count
+        self._queued, self._running = queued, running
+
+    def _db_complete(self, key: str) -> None:
+        with self._db_lock, transaction(self._db) as db:
+            db.execute("DELETE FROM jobs WHERE key = ? AND state = 'running'", (key,))
@@ -0,0 +1,15 @@
+import sqlite3
+from contextlib import contextmanager
+from typing import Iterator
+
+
+@contextmanager
+def transaction(db: sqlite3.Connection) -> Iterator[sqlite3.Connection]:
+    # Takes the write lock up front, so concurrent processes serialize
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        yield db
+    except BaseException:
+        db.execute("ROLLBACK")
+        raise
+    db.execute("COMMIT")
@@ -1,56 +1,599 @@
 import asyncio
 import logging
+import time
 from contextlib import asynccontextmanager
-from typing import List
+from functools import partial
+from typing import Awaitable, Dict, List, Optional, Set, Tuple
 
-from backend.agent.agent import run_agent
+from backend.agent.agent import (
+    PROMPTS,
+    create_agent_client,
+    escalate,
+    run_agent,
+    run_agent_batch,
+)
+from backend.agent.captions import CaptionError, CaptionFetcher
+from backend.agent.parsing import UNREADABLE_RESPONSE
+from backend.agent.concurrency import AdaptiveLimiter
+from backend.agent.pool import AgentPool
+from backend.agent.prescreen import PreScreen
+from backend.agent.tiers import Escalation, EscalationPolicy
+from backend.agent.transcript import count_tokens, prepare_transcript
+from backend.cache.result_cache import ResultCache
+from backend.cache.transcript_cache import TranscriptCache
 from backend.config import get_settings
-from backend.schemas.schemas import ActionRequest
+from backend.metrics.metrics import observe_stage, timed, worker_label
+from backend.queue.admission import RateLimiter
+from backend.queue.broker import InProcessBroker
+from backend.queue.job_queue import Job, ScoringQueue, VideoQueue
+from backend.queue.journal import JobJournal
+from backend.queue.prewarm import Prewarmer
+from backend.queue.sqlite_broker import SQLiteBroker
+from backend.schemas.schemas import ActionRequest, EvaluationResult, VideoScoreResult
 from backend.ws.connection_manager import ConnectionManager
+from backend.ws.websocket import (
+    notify_dropped,
+    notify_no_captions,
+    send_category_score_to_ws,
+    send_score_to_ws,
+)
 
 settings = get_settings()
 logger = logging.getLogger("queue")
 
 
-# Global queue for ActionRequest
-async def worker(queue: asyncio.Queue, manager: ConnectionManager, worker_id: str):
+async def caption_worker(
+    queue: VideoQueue,
+    scoring_queue: ScoringQueue,
+    fetcher: CaptionFetcher,
+    screener: Optional[PreScreen],
+    manager: ConnectionManager,
+    worker_id: str,
+):
+    """
+    First pipeline stage: fetches the caption of each queued job, settles
+    the videos without speech with the pre-screen, sends its provisional
+    flags and hands the rest over to the scoring stage.
+    """
+    worker_label.set(worker_id)
     while True:
+        await scoring_queue.reserve()
+        job: Job = await queue.get()
+        video_id = job.payload.videoId
+        handed_over = False
         try:
-            payload: ActionRequest = await queue.get()
-            logger.info(f"[W{worker_id}] ⏳ Processing video: {payload.videoId}")
-            await run_agent(
-                payload.videoId, payload.categories, payload.customPrompts, manager
+            logger.info(f"[C{worker_id}] ⏳ Fetching caption: {video_id}")
+            with timed("caption_fetch"):
+                transcript = await fetcher.fetch(video_id)
+            if job.state == "cancelled":
+                continue
+            job.chunks = prepare_transcript(
+                transcript,
+                settings.TRANSCRIPT_MAX_TOKENS,
+                settings.TRANSCRIPT_CHUNK_TOKENS,
+                settings.TRANSCRIPT_MAX_CHUNKS,
+                settings.TRANSCRIPT_STRATEGY,
             )
-            logger.info(f"[W{worker_id}] ✅ Successfully processed {payload.videoId!r}")
+            verdict, flagged = None, []
+            if screener is not None:
+                with timed("prescreen"):
+                    verdict, flagged = screener.screen(
+                        job.payload.categories, job.chunks
+                    )
+            if verdict is not None:
+                logger.info(f"[C{worker_id}] Settled by the pre-screen: {video_id}")
+                notify_no_captions(manager, job, verdict.error)
+                queue.complete(job, verdict)
+                continue
+            for index in range(len(flagged)):
+                # Keyword hits are only shown until the model has its say
+                send_category_score_to_ws(
+                    manager, job.key, video_id, flagged[: index + 1]
+                )
+            job.tokens = sum(count_tokens(chunk) for chunk in job.chunks)
+            await scoring_queue.put(job)
+            handed_over = True
+        except CaptionError as e:
+            if not e.permanent:
+                # Subscribers are told the job was dropped and may ask again
+                logger.warning(
+                    f"[C{worker_id}] Caption fetch failed for {video_id}: {e}"
+                )
+                queue.fail(job)
+                continue
+            logger.warning(f"[C{worker_id}] Caption unavailable for {video_id}: {e}")
+            notify_no_captions(manager, job, str(e))
+            queue.complete(job, EvaluationResult.from_error(str(e)))
         except Exception as e:
-            logger.error(f"Error processing {payload.videoId}: {e}", exc_info=True)
+            logger.error(f"Error fetching caption {video_id}: {e}", exc_info=True)
+            queue.complete(job, None)
         finally:
+            if not handed_over:
+                await scoring_queue.release()
             queue.task_done()
-            size_after = queue.qsize()
-            logger.info(f"[W{worker_id}] ← {size_after} tasks remaining in the queue")
+
+
+def is_batchable(job: Job) -> bool:
+    return (
+        settings.SCORING_BATCH_ENABLED
+        and len(job.chunks) == 1
+        and job.tokens <= settings.SCORING_BATCH_VIDEO_MAX_TOKENS
+    )
+
+
+async def collect_batch(scoring_queue: ScoringQueue, first: Job) -> List[Job]:
+    """
+    Packs the short transcripts queued after `first` that share its categories
+    and prompts, until the token budget or the video limit is reached, or the
+    next job cannot join. Shorter transcripts therefore make larger batches.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + settings.SCORING_BATCH_LINGER_MS / 1000
+    batch = [first]
+    tokens = first.tokens
+
+    def fits(job: Job) -> bool:
+        return (
+            is_batchable(job)
+            and job.group == first.group
+            and tokens + job.tokens <= settings.SCORING_BATCH_MAX_TOKENS
+        )
+
+    while len(batch) < settings.SCORING_BATCH_MAX_VIDEOS:
+        if not scoring_queue.qsize():
+            # Give concurrent captions a moment to join the batch
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                await asyncio.wait_for(scoring_queue.ready(), timeout)
+            except asyncio.TimeoutError:
+                break
+        # Jobs that do not fit stay queued for the next free slot
+        job = await scoring_queue.take(fits)
+        if job is None:
+            break
+        batch.append(job)
+        tokens += job.tokens
+    return batch
+
+
+async def score_jobs(
+    jobs: List[Job],
+    pool: AgentPool,
+    manager: ConnectionManager,
+    cache: ResultCache,
+    escalation: Optional[Escalation] = None,
+) -> Tuple[Dict[str, Optional[EvaluationResult]], List[Job]]:
+    """
+    Scores one job, or a batch of jobs in a single model call, and caches
+    every successful result. With an escalation, `pool` is the cheap tier and
+    the results its policy doubts are neither sent nor cached.
+
+    Returns:
+        Tuple[Dict[str, Optional[EvaluationResult]], List[Job]]: Result of
+            each job by its key, and the jobs whose result must be escalated
+    """
+    held: Set[str] = set()
+
+    def hold(video_id: str, evaluation_result: Optional[EvaluationResult]) -> bool:
+        reason = escalation.check(evaluation_result)
+        if reason is None:
+            return False
+        logger.info(f"Escalating video {video_id} to the strong model ({reason})")
+        held.add(video_id)
+        return True
+
+    payload: ActionRequest = jobs[0].payload
+    if len(jobs) == 1:
+        results = {
+            payload.videoId: await run_agent(
+                payload.videoId,
+                payload.categories,
+                jobs[0].chunks,
+                pool,
+                payload.customPrompts,
+                manager,
+                hold if escalation is not None else None,
+            )
+        }
+    else:
+        results = await run_agent_batch(
+            [(job.payload.videoId, job.chunks[0]) for job in jobs],
+            payload.categories,
+            pool,
+            payload.customPrompts,
+            manager,
+            hold if escalation is not None else None,
+        )
+
+    by_key: Dict[str, Optional[EvaluationResult]] = {}
+    for job in jobs:
+        video_id = job.payload.videoId
+        evaluation_result = results.get(video_id)
+        if video_id not in held:
+            await cache_result(cache, job, evaluation_result)
+        by_key[job.key] = evaluation_result
+    return by_key, [job for job in jobs if job.payload.videoId in held]
+
+
+async def cache_result(
+    cache: ResultCache, job: Job, evaluation_result: Optional[EvaluationResult]
+) -> None:
+    # Incomplete results are sent, but the video is scored again next time
+    if (
+        evaluation_result is not None
+        and not evaluation_result.error
+        and not evaluation_result.incomplete
+    ):
+        await cache.set(
+            job.key,
+            VideoScoreResult.from_evaluation(job.payload.videoId, evaluation_result),
+        )
+
+
+def settle(
+    queue: VideoQueue, job: Job, evaluation_result: Optional[EvaluationResult]
+) -> None:
+    """
+    Completes a scored job, or fails it if the model gave no usable result,
+    so its clients submit it again later.
+    """
+    # Jobs dropped meanwhile, as stale or cancelled, are already done
+    if not job.future.done() and (
+        evaluation_result is None or evaluation_result.error == UNREADABLE_RESPONSE
+    ):
+        queue.fail(job)
+    else:
+        queue.complete(job, evaluation_result)
+
+
+async def run_for(jobs: List[Job], evaluation: Awaitable) -> asyncio.Task:
+    """
+    Runs the evaluation of the jobs in its own task, so it can be cancelled
+    when nobody wants them anymore, and returns the task once it is done.
+    """
+    task = asyncio.ensure_future(evaluation)
+    for job in jobs:
+        job.task = task
+        job.batch = jobs
+    try:
+        # Waiting does not propagate cancellation either way, so a cancelled
+        # evaluation is told apart from a cancelled worker
+        await asyncio.wait({task})
+    except asyncio.CancelledError:
+        task.cancel()
+        raise
+    return task
+
+
+# Global queue for ActionRequest
+async def worker(
+    scoring_queue: ScoringQueue,
+    queue: VideoQueue,
+    pool: AgentPool,
+    manager: ConnectionManager,
+    cache: ResultCache,
+    limiter: AdaptiveLimiter,
+    escalation: Optional[Escalation],
+    worker_id: str,
+):
+    """
+    Second pipeline stage: scores jobs whose caption is already fetched,
+    batching short transcripts together. There are CONCURRENCY_MAX workers
+    and the limiter decides how many of them evaluate at the same time.
+    Workers only take a job once they hold a slot, so jobs wait in the
+    priority-ordered scoring queue rather than in the workers.
+    """
+    worker_label.set(worker_id)
+    while True:
+        await scoring_queue.ready()
+        jobs: List[Job] = []
+        results: Dict[str, Optional[EvaluationResult]] = {}
+        try:
+            async with limiter.slot():
+                job = await scoring_queue.take()
+                if job is None:
+                    # Taken by another worker while this one waited for a slot
+                    continue
+                jobs = [job]
+                observe_stage("slot_wait", time.monotonic() - job.ready_at)
+                if is_batchable(job):
+                    jobs = await collect_batch(scoring_queue, job)
+                # Captions take a while, skip jobs that went stale meanwhile
+                fresh = [j for j in jobs if not queue.is_stale(j)]
+                video_ids = ", ".join(j.payload.videoId for j in fresh)
+                if fresh:
+                    logger.info(f"[W{worker_id}] ⏳ Processing video: {video_ids}")
+                    task = await run_for(
+                        fresh, score_jobs(fresh, pool, manager, cache, escalation)
+                    )
+                    if task.cancelled():
+                        logger.info(f"[W{worker_id}] 🛑 Cancelled {video_ids!r}")
+                    else:
+                        results, escalated = task.result()
+                        # The strong tier finishes them, this slot is free
+                        # for the next cheap evaluation
+                        for held in escalated:
+                            escalation.queue.put_nowait((held, results[held.key]))
+                            jobs.remove(held)
+                        logger.info(
+                            f"[W{worker_id}] ✅ Successfully processed {video_ids!r}"
+                        )
+        except asyncio.CancelledError:
+            # Shutting down: the jobs are left unfinished, so the journal
+            # replays them after the restart
+            jobs = []
+            raise
+        except Exception as e:
+            video_ids = ", ".join(j.payload.videoId for j in jobs)
+            logger.error(f"Error processing {video_ids}: {e}", exc_info=True)
+        finally:
+            for processed in jobs:
+                # Wake every coalesced submission of this job
+                settle(queue, processed, results.get(processed.key))
+            if jobs:
+                size_after = queue.qsize() + scoring_queue.qsize()
+                logger.info(
+                    f"[W{worker_id}] ← {size_after} tasks remaining in the queue"
+                )
+
+
+async def escalation_worker(
+    queue: VideoQueue,
+    escalation: Escalation,
+    manager: ConnectionManager,
+    cache: ResultCache,
+    worker_id: str,
+):
+    """
+    Strong tier stage: evaluates again the results the policy doubts,
+    outside the slots of the cheap tier. There are TIER_STRONG_CONCURRENCY
+    workers, as many as strong clients.
+    """
+    worker_label.set(worker_id)
+    while True:
+        job, cheap_result = await escalation.queue.get()
+        video_id = job.payload.videoId
+        evaluation_result = cheap_result
+        try:
+            if job.state == "cancelled":
+                continue
+            if time.monotonic() > job.deadline:
+                # Too late for a second opinion, the cheap one will do
+                escalation.late += 1
+            else:
+                payload: ActionRequest = job.payload
+                task = await run_for(
+                    [job],
+                    escalate(
+                        escalation,
+                        video_id,
+                        payload.categories,
+                        job.chunks,
+                        payload.customPrompts,
+                        cheap_result,
+                    ),
+                )
+                if task.cancelled():
+                    logger.info(f"[E{worker_id}] 🛑 Cancelled {video_id}")
+                    continue
+                evaluation_result = task.result()
+            # Cached first, so submissions arriving meanwhile do not join a
+            # job whose result was already sent
+            await cache_result(cache, job, evaluation_result)
+            if evaluation_result is not None and not evaluation_result.error:
+                await send_score_to_ws(manager, job.key, video_id, evaluation_result)
+        except asyncio.CancelledError:
+            # Shutting down: left unfinished, so the journal replays it
+            job = None
+            raise
+        except Exception as e:
+            logger.error(f"Error escalating {video_id}: {e}", exc_info=True)
+        finally:
+            if job is not None:
+                settle(queue, job, evaluation_result)
 
 
 @asynccontextmanager
 async def lifespan(app):
     # Initialize queue and manager in app state
-    queue: asyncio.Queue = asyncio.Queue()
-    manager = ConnectionManager()
+    manager = ConnectionManager(
+        settings.WS_SEND_QUEUE_SIZE,
+        settings.RESULT_REPLAY_SECONDS,
+        settings.RESULT_REPLAY_MAX_ENTRIES,
+        settings.WS_BATCH_WINDOW_MS / 1000,
+        settings.WS_BATCH_MAX_MESSAGES,
+    )
+    journal = None
+    if settings.BROKER != "sqlite" and settings.JOURNAL_ENABLED:
+        # The SQLite broker keeps its jobs on disk already
+        journal = JobJournal(settings.JOURNAL_DB_PATH, settings.JOURNAL_FLUSH_INTERVAL)
+    if settings.BROKER == "sqlite":
+        broker = SQLiteBroker(
+            manager,
+            settings.BROKER_DB_PATH,
+            settings.BROKER_POLL_INTERVAL,
+            settings.BROKER_LEASE_SECONDS,
+        )
+    else:
+        broker = InProcessBroker(manager, journal)
+    manager.broker = broker
+    queue = broker.create_queue(
+        settings.QUEUE_DEADLINES,
+        settings.QUEUE_MAX_DEPTH,
+        settings.QUEUE_RETRY_AFTER_SECONDS,
+        is_wanted=manager.wants,
+        on_drop=lambda job, reason: notify_dropped(manager, job, reason),
+    )
+    rate_limiter = RateLimiter(
+        settings.RATE_LIMIT_PER_MINUTE, settings.RATE_LIMIT_BURST
+    )
+    cache = ResultCache(
+        settings.CACHE_DB_PATH,
+        settings.CACHE_TTL_SECONDS,
+        settings.CACHE_MAX_ENTRIES,
+        settings.CACHE_DISK_MAX_ENTRIES,
+        settings.CACHE_DISK_EVICT_EVERY,
+    )
+    transcript_cache = TranscriptCache(
+        settings.TRANSCRIPT_CACHE_DB_PATH,
+        settings.TRANSCRIPT_CACHE_TTL_SECONDS,
+        settings.TRANSCRIPT_CACHE_MAX_ENTRIES,
+    )
+    fakes = None
+    if settings.FAKE_BACKENDS:
+        from backend.bench.fakes import FakeBackends
+
+        logger.warning("Serving the model and YouTube with the benchmark's fakes")
+        fakes = FakeBackends.from_environment()
+    fetcher = CaptionFetcher(
+        transcript_cache,
+        settings.CAPTION_LANGUAGES,
+        settings.CAPTION_MAX_RETRIES,
+        settings.CAPTION_RETRY_BASE_DELAY,
+        fakes.youtube.download if fakes is not None else None,
+    )
+    transport = fakes.llm if fakes is not None else None
+    limiter = AdaptiveLimiter(
+        settings.WORKERS,
+        settings.CONCURRENCY_MIN,
+        settings.CONCURRENCY_MAX,
+        settings.CONCURRENCY_LATENCY_TOLERANCE,
+        settings.CONCURRENCY_BACKOFF,
+    )
+    # Agent clients keep their HTTP connections alive for the whole run
+    cascade = settings.TIER_POLICY == "cascade"
+    pool = AgentPool(
+        settings.AGENT_POOL_SIZE,
+        partial(
+            create_agent_client,
+            limiter,
+            transport=transport,
+            model_id=settings.TIER_CHEAP_MODEL if cascade else settings.MODEL,
+        ),
+        settings.AGENT_POOL_MAX_FAILURES,
+        settings.AGENT_POOL_MAX_USES,
+    )
+    escalation = None
+    if cascade:
+        # The strong tier has a fixed limit, its latency would mislead the
+        # limiter tuned to the cheap model
+        escalation = Escalation(
+            AgentPool(
+                settings.TIER_STRONG_CONCURRENCY,
+                partial(
+                    create_agent_client, transport=transport, model_id=settings.MODEL
+                ),
+                settings.AGENT_POOL_MAX_FAILURES,
+                settings.AGENT_POOL_MAX_USES,
+            ),
+            EscalationPolicy(
+                settings.TIER_MIN_CONFIDENCE,
+                settings.TIER_HARMFUL_CATEGORIES,
+                settings.TIER_BORDERLINE_LOW,
+                settings.TIER_BORDERLINE_HIGH,
+            ),
+        )
+    screener = (
+        PreScreen(
+            PROMPTS["instructions"],
+            settings.PRESCREEN_MIN_WORDS,
+            settings.PRESCREEN_MIN_HITS,
+            settings.PRESCREEN_FLAG_SCORE,
+        )
+        if settings.PRESCREEN_ENABLED
+        else None
+    )
+    prewarmer = (
+        Prewarmer(
+            queue,
+            cache,
+            settings.PREWARM_INTERVAL,
+            settings.PREWARM_TOP,
+            settings.PREWARM_REFRESH_BEFORE,
+            settings.PREWARM_HALF_LIFE,
+        )
+        if settings.PREWARM_ENABLED
+        else None
+    )
+    # Jobs being captioned plus a small buffer, so captions are fetched just
+    # ahead of the model
+    scoring_queue = ScoringQueue(settings.WORKERS + settings.CAPTION_WORKERS)
     app.state.queue = queue
+    app.state.rate_limiter = rate_limiter
     app.state.manager = manager
+    app.state.cache = cache
+    app.state.pool = pool
+    app.state.escalation = escalation
+    app.state.limiter = limiter
+    app.state.screener = screener
+    app.state.journal = journal
+    app.state.prewarmer = prewarmer
+    app.state.fakes = fakes
+
+    await broker.start()
+    if fakes is not None:
+        fakes.lag.start()
+    if prewarmer is not None:
+        await prewarmer.start()
 
     # Start the workers
     tasks: List[asyncio.Task] = []
-    for _ in range(settings.WORKERS):
-        task = asyncio.create_task(worker(queue, manager, "worker_" + str(_)))
+    if not settings.RUN_WORKERS:
+        logger.info(f"Workers disabled, jobs are left to the {settings.BROKER} broker")
+    for _ in range(settings.CAPTION_WORKERS if settings.RUN_WORKERS else 0):
+        task = asyncio.create_task(
+            caption_worker(
+                queue,
+                scoring_queue,
+                fetcher,
+                screener,
+                manager,
+                "caption_" + str(_),
+            )
+        )
+        task.add_done_callback(lambda t: _log_task_exc(t, logger))
+        tasks.append(task)
+    for _ in range(settings.CONCURRENCY_MAX if settings.RUN_WORKERS else 0):
+        task = asyncio.create_task(
+            worker(
+                scoring_queue,
+                queue,
+                pool,
+                manager,
+                cache,
+                limiter,
+                escalation,
+                "worker_" + str(_),
+            )
+        )
         # Register a callback for uncaught exception logging
         task.add_done_callback(lambda t: _log_task_exc(t, logger))
         tasks.append(task)
+    strong_workers = settings.TIER_STRONG_CONCURRENCY if escalation is not None else 0
+    for _ in range(strong_workers if settings.RUN_WORKERS else 0):
+        task = asyncio.create_task(
+            escalation_worker(queue, escalation, manager, cache, "strong_" + str(_))
+        )
+        task.add_done_callback(lambda t: _log_task_exc(t, logger))
+        tasks.append(task)
 
     yield
     for task in tasks:
         task.cancel()
     # Ensure complete cancellation
     await asyncio.gather(*tasks, return_exceptions=True)
+    if prewarmer is not None:
+        await prewarmer.close()
+    if fakes is not None:
+        await fakes.lag.stop()
+    await broker.close()
+    await pool.close()
+    if escalation is not None:
+        await escalation.pool.close()
+    cache.close()
+    transcript_cache.close()
 
 
 def _log_task_exc(task: asyncio.Task, logger):
@@ -1,19 +1,107 @@
-from pydantic import BaseModel, Field
-from typing import Optional, List, Any, Dict
+from pydantic import BaseModel, Field, field_validator
+from pydantic.json_schema import SkipJsonSchema
+from typing import Optional, List, Any, Dict, Literal
+
+from backend.config import get_settings
+
+settings = get_settings()
+
+
+Priority = Literal["visible", "prefetch", "background"]
 
 
 class ActionRequest(BaseModel):
     videoId: str
     categories: List[str]
     customPrompts: Any = {}
+    clientId: Optional[str] = None
+    priority: Priority = Field(
+        "visible",
+        description=(
+            "visible: on screen now, prefetch: about to be on screen, "
+            "background: anywhere else in the feed."
+        ),
+    )
+    deadlineMs: Optional[int] = Field(
+        None,
+        gt=0,
+        description=(
+            "Milliseconds after which the result is no longer useful and the "
+            "job is dropped. Defaults to the deadline of its priority."
+        ),
+    )
+
+
+class BatchActionRequest(BaseModel):
+    videoIds: List[str] = Field(
+        ...,
+        min_length=1,
+        max_length=settings.BATCH_MAX_VIDEOS,
+        description="Videos to evaluate with the same categories and prompts.",
+    )
+    categories: List[str]
+    customPrompts: Any = {}
+    clientId: Optional[str] = None
+    priority: Priority = "visible"
+    deadlineMs: Optional[int] = Field(None, gt=0)
+
+    @field_validator("videoIds")
+    @classmethod
+    def dedupe_video_ids(cls, video_ids: List[str]) -> List[str]:
+        video_ids = [v.strip() for v in video_ids]
+        if not all(video_ids):
+            raise ValueError("videoIds must not contain empty values")
+        return list(dict.fromkeys(video_ids))
+
+    def to_requests(self) -> List["ActionRequest"]:
+        return [
+            ActionRequest(
+                videoId=video_id,
+                categories=self.categories,
+                customPrompts=self.customPrompts,
+                clientId=self.clientId,
+                priority=self.priority,
+                deadlineMs=self.deadlineMs,
+            )
+            for video_id in self.videoIds
+        ]
 
 
 class StatusResponse(BaseModel):
     status: str
     detail: Optional[str] = None
+    result: Optional[Dict[str, Any]] = None
+
+
+class BatchStatusResponse(BaseModel):
+    status: str
+    detail: Optional[str] = None
+    results: List[Dict[str, Any]] = Field(
+        default_factory=list, description="Cached results, answered inline."
+    )
+    enqueued: List[str] = Field(
+        default_factory=list, description="Videos whose result arrives via WebSocket."
+    )
+
+
+class ScoresResponse(BaseModel):
+    results: List[Dict[str, Any]] = Field(
+        default_factory=list, description="Stored results of the found videos."
+    )
+    missing: List[str] = Field(
+        default_factory=list, description="Videos without a stored result."
+    )
 
 
 class VideoScoreResult:
+    """
+    Score of a video as sent to the clients.
+    A partial result ("categoryScore") is sent each time a category is scored
+    while the model is still answering: `category` is the one just scored,
+    `categories` holds the ones scored so far and `score` is their average.
+    The complete result ("videoScore") follows.
+    """
+
     def __init__(
         self,
         video_id: str,
@@ -21,23 +109,78 @@ class VideoScoreResult:
         categories: Dict[str, float],
         evaluation_summary: str,
         content_summary: str,
+        partial: bool = False,
+        category: Optional["CategoryResult"] = None,
     ):
-        self.type = "videoScore"
+        self.type = "categoryScore" if partial else "videoScore"
         self.video_id = video_id
         self.score = score
         self.categories = categories
         self.evaluation_summary = evaluation_summary
         self.content_summary = content_summary
+        self.partial = partial
+        self.category = category
 
     def to_dict(self):
-        return {
+        data = {
             "type": self.type,
             "videoId": self.video_id,
             "score": round(self.score, 2),
             "categories": {k: round(v, 2) for k, v in self.categories.items()},
             "evaluation_summary": self.evaluation_summary,
             "content_summary": self.content_summary,
+            "partial": self.partial,
         }
+        if self.category is not None:
+            data["category"] = {
+                "name": self.category.name,
+                "score": round(self.category.score, 2),
+                "connotation": self.category.connotation,
+                "reason": self.category.reason,
+            }
+        return data
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "VideoScoreResult":
+        return cls(
+            video_id=data["videoId"],
+            score=data["score"],
+            categories=data["categories"],
+            evaluation_summary=data["evaluation_summary"],
+            content_summary=data["content_summary"],
+        )
+
+    @classmethod
+    def from_evaluation(
+        cls, video_id: str, evaluation_result: "EvaluationResult"
+    ) -> "VideoScoreResult":
+        category_scores = {
+            category.name: category.score for category in evaluation_result.categories
+        }
+        return cls(
+            video_id=video_id,
+            score=evaluation_result.overall.score,
+            categories=category_scores,
+            evaluation_summary=evaluation_result.overall.reason,
+            content_summary=evaluation_result.content_summary,
+        )
+
+    @classmethod
+    def from_partial(
+        cls, video_id: str, scored: List["CategoryResult"]
+    ) -> "VideoScoreResult":
+        """
+        Builds the partial result after the last category in `scored`.
+        """
+        return cls(
+            video_id=video_id,
+            score=sum(c.score for c in scored) / len(scored),
+            categories={c.name: c.score for c in scored},
+            evaluation_summary="",
+            content_summary="",
+            partial=True,
+            category=scored[-1],
+        )
 
 
 class CategoryResult(BaseModel):
@@ -74,6 +217,13 @@ class OverallResult(BaseModel):
         ...,
         description="Summary of reasons of all categories.",
     )
+    confidence: Optional[float] = Field(
+        None,
+        description=(
+            "How sure the scores are given the caption, from 0 (a guess) to 1 "
+            "(certain)."
+        ),
+    )
 
 
 class EvaluationResult(BaseModel):
@@ -93,3 +243,29 @@ class EvaluationResult(BaseModel):
         ...,
         description="Summary of the video content.",
     )
+    # Set on results recovered from a cut off response that lost some of the
+    # requested categories, never asked from the model
+    incomplete: SkipJsonSchema[bool] = False
+
+    @classmethod
+    def from_error(cls, error: str) -> "EvaluationResult":
+        return cls(
+            categories=[],
+            overall=OverallResult(score=None, reason=None),
+            error=error,
+            content_summary="",
+        )
+
+
+class VideoEvaluationResult(EvaluationResult):
+    videoId: str = Field(
+        ...,
+        description="ID of the evaluated video.",
+    )
+
+
+class BatchEvaluationResult(BaseModel):
+    results: List[VideoEvaluationResult] = Field(
+        ...,
+        description="Evaluation result of each video in the batch.",
+    )
@@ -1,36 +1,345 @@
-from fastapi import WebSocket, WebSocketDisconnect
-from typing import List
+from collections import OrderedDict
+from fastapi import WebSocket
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
 import asyncio
+import logging
+import time
+import uuid
+
+from backend.metrics.metrics import (
+    WS_ACTIVE_CONNECTIONS,
+    WS_FANOUT,
+    WS_FRAME_BYTES,
+    observe_stage,
+    worker_label,
+)
+from backend.ws import protocol
+
+logger = logging.getLogger("ws")
+
+# Messages after which an evaluation sends nothing else
+FINAL_TYPES = ("videoScore", "noCaptions", "videoError")
+
+
+class ClientConnection:
+    """
+    A connected WebSocket client.
+    Outgoing messages go through a bounded per-connection queue drained by its
+    own sender task, so a slow reader only delays itself.
+    Clients of the "compact" and "msgpack" protocols get the messages queued
+    within `batch_window` seconds of each other in a single frame.
+    Subscriptions end with the final result of their evaluation, the keys of
+    the last `settled_max` videos are kept to answer summary requests.
+    """
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        client_id: str,
+        max_queue_size: int,
+        protocol: str = "json",
+        batch_window: float = 0,
+        batch_max: int = 64,
+        settled_max: int = 256,
+    ):
+        self.websocket = websocket
+        self.client_id = client_id
+        self.protocol = protocol
+        self.batch_window = batch_window
+        self.batch_max = batch_max
+        # Evaluation keys the client subscribed to, by video
+        self.subscriptions: Dict[str, Set[str]] = {}
+        # Evaluation keys the client got the final result of, by video
+        self.settled: "OrderedDict[str, Set[str]]" = OrderedDict()
+        self.settled_max = settled_max
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue_size)
+        self.sender: Optional[asyncio.Task] = None
+        self.dropped = 0
+
+    def enqueue(self, message: Any) -> None:
+        """
+        Queues a message without waiting. When the queue is full the oldest
+        message is dropped to make room.
+        """
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+            logger.warning(
+                f"Send queue full for client {self.client_id}, dropped oldest message"
+            )
+        self.queue.put_nowait(message)
+
+    def settle(self, video_id: str, key: str) -> None:
+        """
+        Ends the subscription to an evaluation that sent its final result.
+        """
+        keys = self.subscriptions.get(video_id)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self.subscriptions[video_id]
+        self.settled.setdefault(video_id, set()).add(key)
+        self.settled.move_to_end(video_id)
+        while len(self.settled) > self.settled_max:
+            self.settled.popitem(last=False)
+
+    def evaluation_keys(self, video_id: str) -> List[str]:
+        """
+        Keys of the evaluations of a video the client is subscribed to or
+        recently got the final result of.
+        """
+        keys = self.subscriptions.get(video_id, set())
+        return [*keys, *(self.settled.get(video_id, set()) - keys)]
+
+    def prepare(self, message: Any) -> Any:
+        """
+        Form of a message queued for this client.
+        """
+        if self.protocol == "json":
+            return protocol.encode(message, "json")
+        return protocol.trim(message)
+
+    async def send_loop(self, manager: "ConnectionManager") -> None:
+        try:
+            while True:
+                message = await self.queue.get()
+                if self.protocol != "json":
+                    message = await self.collect(message)
+                started_at = time.monotonic()
+                data = protocol.encode(message, self.protocol)
+                if isinstance(data, bytes):
+                    await self.websocket.send_bytes(data)
+                else:
+                    await self.websocket.send_text(data)
+                WS_FRAME_BYTES.observe(len(data), protocol=self.protocol)
+                observe_stage("ws_send", time.monotonic() - started_at, "ws")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # The socket is gone, stop delivering to it
+            logger.info(f"Stopped sending to client {self.client_id}: {e}")
+            await manager.disconnect(self)
+
+    async def collect(self, first: Any) -> Any:
+        """
+        Waits for the batch window and returns the messages queued meanwhile
+        as one frame.
+        """
+        if self.batch_window:
+            await asyncio.sleep(self.batch_window)
+        messages = [first]
+        while len(messages) < self.batch_max and not self.queue.empty():
+            messages.append(self.queue.get_nowait())
+        return protocol.frame(messages)
 
 
 class ConnectionManager:
     """
-    Manages multiple WebSocket connections and message broadcasting.
+    Manages WebSocket connections and routes each video result only to the
+    clients subscribed to that evaluation: the same video evaluated with
+    other categories or prompts is another evaluation, with its own key
+    (`make_cache_key`).
+    The last result of each evaluation is kept for `replay_seconds`, so
+    clients that subscribe after it was sent still receive it.
+    Each message is encoded once per protocol, whatever the number of clients
+    it goes to. Subscriptions are removed once the final result (see
+    `FINAL_TYPES`) of their evaluation is queued.
     """
 
-    def __init__(self):
-        self.active_connections: List[WebSocket] = []
+    def __init__(
+        self,
+        send_queue_size: int = 256,
+        replay_seconds: float = 0,
+        replay_max_entries: int = 0,
+        batch_window: float = 0,
+        batch_max: int = 64,
+    ):
+        self.active_connections: Dict[str, ClientConnection] = {}
+        # Client ids by evaluation key
+        self.subscribers: Dict[str, Set[str]] = {}
+        self.send_queue_size = send_queue_size
+        self.batch_window = batch_window
+        self.batch_max = batch_max
+        self.replay_seconds = replay_seconds
+        self.replay_max_entries = replay_max_entries
+        # Time each evaluation's last result was sent, and the result
+        self.recent: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self.replayed = 0
         self.lock = asyncio.Lock()
+        # Set at startup, routes results to the subscribers on other nodes
+        self.broker = None
 
-    async def connect(self, websocket: WebSocket):
+    async def connect(
+        self,
+        websocket: WebSocket,
+        client_id: Optional[str] = None,
+        requested_protocol: str = "json",
+    ) -> ClientConnection:
+        """
+        Accepts the socket and registers it under `client_id`, or a new id if
+        none was given or it is already in use. The "hello" message tells the
+        client the protocol it got, which may differ from the one it asked for.
+        """
         await websocket.accept()
         async with self.lock:
-            self.active_connections.append(websocket)
+            if not client_id or client_id in self.active_connections:
+                client_id = uuid.uuid4().hex
+            client = ClientConnection(
+                websocket,
+                client_id,
+                self.send_queue_size,
+                protocol.negotiate(requested_protocol),
+                self.batch_window,
+                self.batch_max,
+            )
+            self.active_connections[client_id] = client
+            WS_ACTIVE_CONNECTIONS.set(len(self.active_connections))
+        client.sender = asyncio.create_task(client.send_loop(self))
+        client.enqueue(
+            client.prepare(
+                {"type": "hello", "clientId": client_id, "protocol": client.protocol}
+            )
+        )
+        return client
 
-    async def disconnect(self, websocket: WebSocket):
+    async def disconnect(self, client: ClientConnection):
         async with self.lock:
-            if websocket in self.active_connections:
-                self.active_connections.remove(websocket)
+            if self.active_connections.get(client.client_id) is not client:
+                return
+            del self.active_connections[client.client_id]
+            WS_ACTIVE_CONNECTIONS.set(len(self.active_connections))
+            self._unsubscribe(client, list(client.subscriptions))
+        if client.sender is not None and client.sender is not asyncio.current_task():
+            client.sender.cancel()
 
-    async def broadcast(self, message: str):
-        async with self.lock:
-            connections = list(self.active_connections)
-        for ws in connections:
-            try:
-                if isinstance(message, dict):
-                    await ws.send_json(message)
-                else:
-                    await ws.send_text(str(message))
-            except WebSocketDisconnect:
-                # If disconnect occurs, remove it from the list
-                await self.disconnect(ws)
+    def get(self, client_id: Optional[str]) -> Optional[ClientConnection]:
+        if not client_id:
+            return None
+        return self.active_connections.get(client_id)
+
+    def subscribe(
+        self,
+        client_id: str,
+        subscriptions: Iterable[Tuple[str, str]],
+        replay: bool = False,
+    ) -> bool:
+        """
+        Registers the client's interest in the given (video_id, key) pairs.
+        With `replay`, the recent results of those evaluations are sent to the
+        client right away, instead of subscribing to evaluations that are over.
+
+        Returns:
+            bool: False if the client is not connected
+        """
+        client = self.get(client_id)
+        if client is None:
+            return False
+        for video_id, key in subscriptions:
+            message = self.recent_result(key) if replay else None
+            if message is not None:
+                client.enqueue(client.prepare(message))
+                client.settle(video_id, key)
+                self.replayed += 1
+                continue
+            client.subscriptions.setdefault(video_id, set()).add(key)
+            self.subscribers.setdefault(key, set()).add(client_id)
+        return True
+
+    def unsubscribe(self, client_id: str, video_ids: Iterable[str]) -> None:
+        client = self.get(client_id)
+        if client is not None:
+            self._unsubscribe(client, video_ids)
+
+    def _unsubscribe(self, client: ClientConnection, video_ids: Iterable[str]):
+        for video_id in video_ids:
+            for key in client.subscriptions.pop(video_id, ()):
+                clients = self.subscribers.get(key)
+                if clients is not None:
+                    clients.discard(client.client_id)
+                    if not clients:
+                        del self.subscribers[key]
+
+    def wants(self, job) -> bool:
+        """
+        Whether a job is still wanted: it was submitted anonymously, or at
+        least one of its clients is connected and subscribed to it.
+        """
+        if job.anonymous or not job.clients:
+            return True
+        subscribers = self.subscribers.get(job.key, ())
+        return any(client_id in subscribers for client_id in job.clients)
+
+    def publish(self, key: str, message: Any) -> int:
+        """
+        Delivers the message to the subscribers of the evaluation `key` on
+        every node.
+
+        Returns:
+            int: Number of clients of this node the message was queued for
+        """
+        if self.broker is None:
+            return self.send_to_subscribers(key, message)
+        return self.broker.publish(key, message)
+
+    def send_to_subscribers(self, key: str, message: Any) -> int:
+        """
+        Queues the message on every connection of this node subscribed to
+        the evaluation `key`.
+
+        Returns:
+            int: Number of clients the message was queued for
+        """
+        final = isinstance(message, dict) and message.get("type") in FINAL_TYPES
+        if final:
+            self.remember(key, message)
+        client_ids = self.subscribers.get(key, ())
+        clients = [
+            self.active_connections[client_id]
+            for client_id in list(client_ids)
+            if client_id in self.active_connections
+        ]
+        delivered = self._deliver(clients, message)
+        if final:
+            # Nothing else will be sent for this evaluation
+            self.subscribers.pop(key, None)
+            for client in clients:
+                client.settle(message.get("videoId", ""), key)
+        WS_FANOUT.observe(
+            delivered,
+            type=message.get("type", "") if isinstance(message, dict) else "text",
+            worker=worker_label.get(),
+        )
+        return delivered
+
+    def remember(self, key: str, message: Any) -> None:
+        if not self.replay_seconds:
+            return
+        self.recent[key] = (time.monotonic(), message)
+        self.recent.move_to_end(key)
+        while len(self.recent) > self.replay_max_entries:
+            self.recent.popitem(last=False)
+
+    def recent_result(self, key: str) -> Optional[Any]:
+        entry = self.recent.get(key)
+        if entry is None:
+            return None
+        if time.monotonic() - entry[0] > self.replay_seconds:
+            del self.recent[key]
+            return None
+        return entry[1]
+
+    def broadcast(self, message: Any) -> int:
+        """
+        Queues the message on every connection.
+        """
+        return self._deliver(list(self.active_connections.values()), message)
+
+    def _deliver(self, clients: Iterable[ClientConnection], message: Any) -> int:
+        prepared: Dict[str, Any] = {}
+        delivered = 0
+        for client in clients:
+            if client.protocol not in prepared:
+                prepared[client.protocol] = client.prepare(message)
+            client.enqueue(prepared[client.protocol])
+            delivered += 1
+        return delivered
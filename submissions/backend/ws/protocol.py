@@ -0,0 +1,81 @@
+import json
+from typing import Any, List, Union
+
+try:
+    import msgpack
+except ImportError:  # msgpack is optional, "msgpack" clients get compact JSON
+    msgpack = None
+
+# "json": one full JSON text frame per message, as sent from the start.
+# "compact": results without their summaries, and the messages of a short
+# window coalesced into one frame. "msgpack": the same as MessagePack frames.
+PROTOCOLS = ("json", "compact", "msgpack")
+
+# Text fields only shown on demand, sent in reply to a "summary" request
+SUMMARY_FIELDS = ("evaluation_summary", "content_summary")
+
+
+def negotiate(requested: str) -> str:
+    """
+    Returns the protocol used for a client that asked for `requested`.
+    """
+    if requested == "msgpack" and msgpack is None:
+        return "compact"
+    return requested if requested in PROTOCOLS else "json"
+
+
+def trim(message: Any) -> Any:
+    """
+    Compact form of a message: results without their texts and without
+    the fields left at their defaults.
+    """
+    if not isinstance(message, dict) or message.get("type") not in (
+        "videoScore",
+        "categoryScore",
+    ):
+        return message
+    trimmed = {k: v for k, v in message.items() if k not in SUMMARY_FIELDS}
+    if "category" in trimmed:
+        # The scores of the category are enough to show it
+        trimmed["category"] = {
+            k: v for k, v in trimmed["category"].items() if k != "reason"
+        }
+    if not trimmed.get("partial"):
+        trimmed.pop("partial", None)
+    return trimmed
+
+
+def frame(messages: List[Any]) -> Any:
+    """
+    Coalesces the messages of one window into a single frame.
+    """
+    if len(messages) == 1:
+        return messages[0]
+    return {"type": "batch", "messages": messages}
+
+
+def encode(message: Any, protocol: str) -> Union[str, bytes]:
+    if protocol == "msgpack":
+        return msgpack.packb(message)
+    if isinstance(message, str):
+        return message
+    # Compact separators, there is no reader to indent for
+    return json.dumps(message, separators=(",", ":"), ensure_ascii=False)
+
+
+def decode(data: Union[str, bytes]) -> Any:
+    """
+    Reads a control message sent by a client: JSON text, or MessagePack or
+    UTF-8 JSON in a binary frame.
+
+    Raises:
+        ValueError: If the message cannot be read
+    """
+    if isinstance(data, bytes):
+        if msgpack is not None:
+            try:
+                return msgpack.unpackb(data)
+            except Exception:
+                pass  # Not MessagePack, JSON sent as bytes
+        data = data.decode("utf-8")
+    return json.loads(data)
@@ -1,41 +1,170 @@
 import logging
+from typing import List, Union
 
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect
 
+from backend.cache.result_cache import ResultCache, make_cache_key
 from backend.config import get_settings
-from backend.schemas.schemas import VideoScoreResult, EvaluationResult
-from backend.ws.connection_manager import ConnectionManager
+from backend.schemas.schemas import CategoryResult, EvaluationResult, VideoScoreResult
+from backend.ws import protocol
+from backend.ws.connection_manager import ClientConnection, ConnectionManager
 
 settings = get_settings()
 ws_router = APIRouter()
-manager = ConnectionManager()
 logger = logging.getLogger("ws")
 
 
 @ws_router.websocket(settings.WS_ENDPOINT)
 async def websocket_endpoint(ws: WebSocket):
     manager: ConnectionManager = ws.app.state.manager
-    await manager.connect(ws)
+    client = await manager.connect(
+        ws, ws.query_params.get("clientId"), ws.query_params.get("protocol", "json")
+    )
     async with manager.lock:
         total = len(manager.active_connections)
     logger.info("Connection open. Total WebSocket clients: %d", total)
     try:
         while True:
-            await ws.receive_text()
+            message = await ws.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            data = message.get("text")
+            if data is None:
+                data = message.get("bytes") or b""
+            try:
+                await handle_client_message(ws.app.state, client, data)
+            except Exception as e:
+                logger.error(f"Error handling message of {client.client_id}: {e}")
     except WebSocketDisconnect:
-        await manager.disconnect(ws)
+        pass
+    finally:
+        # Runs whatever ended the connection, so nothing it held is leaked
+        await manager.disconnect(client)
+        # Nobody will see the results of the jobs only this client wanted
+        cancelled = ws.app.state.queue.cancel(client.client_id)
         async with manager.lock:
             total = len(manager.active_connections)
-        logger.info("Connection closed. Total WebSocket clients: %d", total)
+        logger.info(
+            "Connection closed, %d jobs cancelled. Total WebSocket clients: %d",
+            cancelled,
+            total,
+        )
+
+
+async def handle_client_message(
+    state, client: ClientConnection, data: Union[str, bytes]
+) -> None:
+    """
+    Handles a control message sent by a client. Control messages are JSON
+    text frames whatever the protocol of the connection, msgpack clients may
+    also send them as MessagePack binary frames.
+
+    Supported messages:
+        {"type": "subscribe", "videoIds": [...], "categories": [...],
+         "customPrompts": [...]}
+        {"type": "unsubscribe", "videoIds": [...]}
+        {"type": "cancel", "videoIds": [...]}
+        {"type": "summary", "videoIds": [...]}
+
+    A "subscribe" names the evaluation like the evaluate request does, only
+    its results are routed to the client. A "cancel" unsubscribes and
+    withdraws the client from the evaluation of the videos, which stops if no
+    other client is waiting for it. A "summary" is answered from the
+    evaluations the client subscribed to.
+    """
+    manager: ConnectionManager = state.manager
+    try:
+        message = protocol.decode(data)
+    except ValueError:
+        logger.debug(f"Ignoring unreadable message from client {client.client_id}")
+        return
+    if not isinstance(message, dict):
+        return
+
+    video_ids = message.get("videoIds") or []
+    if not isinstance(video_ids, list):
+        return
+    video_ids = [v for v in video_ids if isinstance(v, str) and v]
+
+    if message.get("type") == "subscribe":
+        categories = message.get("categories")
+        if not isinstance(categories, list):
+            logger.debug(
+                f"Ignoring subscribe without categories from {client.client_id}"
+            )
+            return
+        custom_prompts = message.get("customPrompts")
+        subscriptions = [
+            (video_id, make_cache_key(video_id, categories, custom_prompts))
+            for video_id in video_ids
+        ]
+        # Results sent before the client subscribed are replayed
+        manager.subscribe(client.client_id, subscriptions, replay=True)
+    elif message.get("type") == "unsubscribe":
+        manager.unsubscribe(client.client_id, video_ids)
+    elif message.get("type") == "cancel":
+        manager.unsubscribe(client.client_id, video_ids)
+        state.queue.cancel(client.client_id, video_ids)
+    elif message.get("type") == "summary":
+        await send_summaries(manager, state.cache, client, video_ids)
+
+
+async def send_summaries(
+    manager: ConnectionManager,
+    cache: ResultCache,
+    client: ClientConnection,
+    video_ids: List[str],
+) -> None:
+    """
+    Sends the summaries left out of the compact results of the given videos,
+    from the recently sent results of the evaluations the client subscribed
+    to or recently got a result of, or else the stored ones. Videos without a
+    result are left out.
+    """
+    summaries = {}
+    missing = {}
+    for video_id in video_ids[: settings.BATCH_MAX_VIDEOS]:
+        for key in client.evaluation_keys(video_id):
+            recent = manager.recent_result(key)
+            if recent is not None and recent.get("type") == "videoScore":
+                summaries[video_id] = (
+                    recent.get("evaluation_summary", ""),
+                    recent.get("content_summary", ""),
+                )
+                break
+            missing[key] = video_id
+    missing = {k: v for k, v in missing.items() if v not in summaries}
+    if missing and cache is not None:
+        stored = await cache.get_many(list(missing))
+        for key, result in stored.items():
+            summaries[missing[key]] = (
+                result.evaluation_summary,
+                result.content_summary,
+            )
+    for video_id, (evaluation_summary, content_summary) in summaries.items():
+        client.enqueue(
+            client.prepare(
+                {
+                    "type": "summary",
+                    "videoId": video_id,
+                    "evaluation_summary": evaluation_summary,
+                    "content_summary": content_summary,
+                }
+            )
+        )
 
 
 async def send_score_to_ws(
-    manager: ConnectionManager, video_id: str, evaluation_result: EvaluationResult
+    manager: ConnectionManager,
+    key: str,
+    video_id: str,
+    evaluation_result: EvaluationResult,
 ) -> None:
     """
     Sends the video evaluation result via WebSocket.
 
     Args:
+        key (str): Key of the evaluation, see `make_cache_key`
         video_id (str): ID of the evaluated video
         evaluation_result (EvaluationResult): Result of the video evaluation
 
@@ -46,23 +175,86 @@ async def send_score_to_ws(
         f"📤 Sending score for video {video_id}: {evaluation_result.overall.score}"
     )
 
-    category_scores = {
-        category.name: category.score for category in evaluation_result.categories
-    }
     # Create the result object
-    result = VideoScoreResult(
-        video_id=video_id,
-        score=evaluation_result.overall.score,
-        categories=category_scores,
-        evaluation_summary=evaluation_result.overall.reason,
-        content_summary=evaluation_result.content_summary,
-    )
+    result = VideoScoreResult.from_evaluation(video_id, evaluation_result)
 
-    # Execute the broadcast and complete the future
+    # Queue the result for the clients subscribed to this evaluation
     try:
         if manager is None:
             logger.info(f"Cannot send video: {video_id}")
         else:
-            await manager.broadcast(result.to_dict())
+            delivered = manager.publish(key, result.to_dict())
+            logger.info(f"Result for video {video_id} queued for {delivered} clients")
     except Exception as e:
         logger.error(f"Error sending result for video {video_id}: {str(e)}")
+
+
+def send_category_score_to_ws(
+    manager: ConnectionManager, key: str, video_id: str, scored: List[CategoryResult]
+) -> None:
+    """
+    Sends the partial result of a video after each scored category, before
+    the evaluation is complete.
+
+    Args:
+        key (str): Key of the evaluation, see `make_cache_key`
+        video_id (str): ID of the video being evaluated
+        scored (List[CategoryResult]): Categories scored so far, the last one
+            is the new one
+    """
+    if manager is None:
+        return
+    try:
+        manager.publish(key, VideoScoreResult.from_partial(video_id, scored).to_dict())
+    except Exception as e:
+        logger.error(f"Error sending partial result for video {video_id}: {str(e)}")
+
+
+def send_error_to_ws(
+    manager: ConnectionManager, key: str, video_id: str, error: str
+) -> None:
+    """
+    Tells the subscribers of an evaluation that the model declined to score
+    the video, e.g. because none of the categories is supported. Asking again
+    gets the same answer, so unlike a dropped job it is not submitted again.
+
+    Args:
+        key (str): Key of the evaluation, see `make_cache_key`
+        video_id (str): ID of the evaluated video
+        error (str): Error the model answered with
+    """
+    if manager is None:
+        return
+    try:
+        manager.publish(
+            key, {"type": "videoError", "videoId": video_id, "reason": error}
+        )
+    except Exception as e:
+        logger.error(f"Error sending error for video {video_id}: {str(e)}")
+
+
+def notify_dropped(manager: ConnectionManager, job, reason: str) -> None:
+    """
+    Tells the subscribers of a dropped job that no result will arrive, so
+    they can submit it again later.
+    """
+    video_id = job.payload.videoId
+    manager.publish(
+        job.key, {"type": "videoDropped", "videoId": video_id, "reason": reason}
+    )
+
+
+def notify_no_captions(manager: ConnectionManager, job, reason: str) -> None:
+    """
+    Tells the subscribers of a job that its video cannot be evaluated because
+    it has no usable captions, so they can mark it instead of waiting.
+    """
+    if manager is None:
+        return
+    video_id = job.payload.videoId
+    try:
+        manager.publish(
+            job.key, {"type": "noCaptions", "videoId": video_id, "reason": reason}
+        )
+    except Exception as e:
+        logger.error(f"Error sending no captions for video {video_id}: {str(e)}")
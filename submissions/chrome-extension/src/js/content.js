@@ -4,12 +4,19 @@
 // Global state
 let config = null;
 let wsConnection = null;
+let wsClientId = null; // Client id assigned by the server, used to route results
 let videoScores = {}; // { videoId: { score: number, categories: {} } }
 let videoElements = {}; // { videoId: HTMLElement }
 let processedVideos = new Set(); // Set of IDs that have been processed
 let processingQueue = new Set(); // Set of IDs in evaluation process
+let noCaptionVideos = new Set(); // IDs the server cannot evaluate, they have no captions
 let videoObserver = null; // Observer to detect new videos
 let retryTimeout = null; // Timeout to retry WebSocket connection
+let pendingEvaluations = new Set(); // IDs waiting to be sent in the next batch
+let batchTimeout = null; // Timeout to send the next batch
+let pendingSummaries = {}; // { videoId: button } waiting for the server to send their summaries
+const BATCH_DELAY_MS = 100; // Time to collect videos before sending a batch
+const BATCH_MAX_VIDEOS = 100; // Must not exceed the server's BATCH_MAX_VIDEOS
 
 // Initialization
 (async function init() {
@@ -47,15 +54,29 @@ function connectWebSocket() {
   }
   
   try {
-    wsConnection = new WebSocket(config.wsUrl);
+    // Reuse the previous client id so the server keeps routing our results.
+    // The compact protocol leaves summaries out of the results and batches
+    // the messages of a short window in one frame
+    const params = new URLSearchParams({ protocol: 'compact' });
+    if (wsClientId) {
+      params.set('clientId', wsClientId);
+    }
+    const wsUrl = `${config.wsUrl}?${params}`;
+    wsConnection = new WebSocket(wsUrl);
     
     wsConnection.onopen = () => {
       console.log('Connected to WebSocket server');
       clearTimeout(retryTimeout);
       
+      // Submit again the videos still being evaluated: the server may have
+      // dropped them while we were disconnected, otherwise it coalesces them
+      const inFlight = [...processingQueue];
+      processingQueue.clear();
+      inFlight.forEach(requestVideoEvaluation);
+      
       // Request evaluation of already detected videos
       Object.keys(videoElements).forEach(videoId => {
-        if (!videoScores[videoId] && !processingQueue.has(videoId)) {
+        if (!videoScores[videoId] && !processingQueue.has(videoId) && !noCaptionVideos.has(videoId)) {
           requestVideoEvaluation(videoId);
         }
       });
@@ -65,9 +86,11 @@ function connectWebSocket() {
       try {
         const data = JSON.parse(event.data);
         
-        if (data.type === 'videoScore') {
-          // We received a video evaluation
-          processVideoScore(data.videoId, data.score, data.categories, data.content_summary, data.evaluation_summary);
+        if (data.type === 'batch') {
+          // Several messages sent together
+          data.messages.forEach(handleServerMessage);
+        } else {
+          handleServerMessage(data);
         }
       } catch (error) {
         console.error('Error processing WebSocket message:', error);
@@ -92,6 +115,33 @@ function connectWebSocket() {
   }
 }
 
+// Handle a single message from the server
+function handleServerMessage(data) {
+  if (data.type === 'hello') {
+    wsClientId = data.clientId;
+  } else if (data.type === 'videoDropped') {
+    // The server gave up on this video (overloaded or expired)
+    if (data.reason !== 'abandoned' && data.reason !== 'cancelled') {
+      setTimeout(() => retryVideoEvaluations([data.videoId]), 10000);
+    }
+  } else if (data.type === 'categoryScore') {
+    // Provisional score while the evaluation is still running
+    processPartialScore(data.videoId, data.score, data.categories);
+  } else if (data.type === 'videoScore') {
+    // We received a video evaluation
+    processVideoScore(data.videoId, data.score, data.categories, data.content_summary, data.evaluation_summary);
+  } else if (data.type === 'noCaptions') {
+    // Nothing to evaluate, the video has no speech or no captions
+    processNoCaptions(data.videoId, data.reason);
+  } else if (data.type === 'videoError') {
+    // The model declined to score the video, asking again would not help
+    processVideoError(data.videoId, data.reason);
+  } else if (data.type === 'summary') {
+    // Summaries requested when the Summary button was clicked
+    processSummary(data.videoId, data.content_summary, data.evaluation_summary);
+  }
+}
+
 // Configure observer to detect new videos
 function setupVideoObserver() {
   if (videoObserver) {
@@ -163,6 +213,7 @@ function detectVideos() {
   
   // Track new videos found in this detection pass
   const newVideosFound = [];
+  const videosOnPage = new Set();
   
   // Process only videos that aren't already in our tracking
   elements.forEach(element => {
@@ -171,6 +222,7 @@ function detectVideos() {
     
     // Skip if no valid ID
     if (!videoId) return;
+    videosOnPage.add(videoId);
     
     // Skip if already processed or in processing queue and the element is stored
     if ((processedVideos.has(videoId) || processingQueue.has(videoId)) && videoElements[videoId]) {
@@ -185,6 +237,14 @@ function detectVideos() {
   if (newVideosFound.length > 0) {
     console.log(`Found ${newVideosFound.length} new videos to process`);
   }
+  
+  // Videos still being evaluated that left the page are not worth the wait
+  const goneVideos = [...processingQueue].filter(videoId =>
+    !videosOnPage.has(videoId) && !videoElements[videoId]?.isConnected
+  );
+  if (goneVideos.length > 0) {
+    cancelVideoEvaluations(goneVideos);
+  }
 }
 
 // Extract video ID from element
@@ -225,6 +285,10 @@ function processVideoElement(element) {
     // Mark as processed since we already have the score
     processedVideos.add(videoId);
   } 
+  // If it cannot be evaluated, say so
+  else if (noCaptionVideos.has(videoId)) {
+    applyNoCaptionsIndicator(videoId, element);
+  }
   // If in processing queue, show processing indicator
   else if (processingQueue.has(videoId)) {
     applyProcessingIndicator(videoId, element);
@@ -291,35 +355,132 @@ function requestVideoEvaluation(videoId) {
     applyProcessingIndicator(videoId, videoElements[videoId]);
   }
   
+  // Collect the videos found in this pass and send them in a single request
+  pendingEvaluations.add(videoId);
+  clearTimeout(batchTimeout);
+  if (pendingEvaluations.size >= BATCH_MAX_VIDEOS) {
+    flushEvaluationBatch();
+  } else {
+    batchTimeout = setTimeout(flushEvaluationBatch, BATCH_DELAY_MS);
+  }
+}
+
+// Send the collected videos to the batch endpoint, one request per priority
+function flushEvaluationBatch() {
+  const byPriority = {};
+  pendingEvaluations.forEach(videoId => {
+    const priority = getVideoPriority(videoId);
+    (byPriority[priority] = byPriority[priority] || []).push(videoId);
+  });
+  pendingEvaluations.clear();
+  
+  // Visible videos first, so the server can start on them right away
+  ['visible', 'prefetch', 'background'].forEach(priority => {
+    if (byPriority[priority]) {
+      sendEvaluationBatch(byPriority[priority], priority);
+    }
+  });
+}
+
+// Priority of a video according to where its thumbnail is
+function getVideoPriority(videoId) {
+  const element = videoElements[videoId];
+  if (!element) return 'background';
+  
+  const rect = element.getBoundingClientRect();
+  const viewportHeight = window.innerHeight || document.documentElement.clientHeight;
+  if (rect.bottom >= 0 && rect.top <= viewportHeight) {
+    return 'visible';
+  }
+  // Within one screen of the viewport, the user is likely to get there soon
+  if (rect.bottom >= -viewportHeight && rect.top <= 2 * viewportHeight) {
+    return 'prefetch';
+  }
+  return 'background';
+}
+
+function sendEvaluationBatch(videoIds, priority) {
+  // Ask the server to route these videos' results to us
+  subscribeToVideos(videoIds);
+  
   // Send REST request to server
-  fetch(`${config.serverUrl}/api/videos/evaluate`, {
+  fetch(`${config.serverUrl}/api/videos/evaluate/batch`, {
     method: 'POST',
     headers: {
       'Content-Type': 'application/json'
     },
     body: JSON.stringify({
-      videoId,
+      videoIds,
       categories: getActiveCategories(),
-      customPrompts: config.customPrompts
+      customPrompts: config.customPrompts,
+      clientId: wsClientId,
+      priority
     })
   })
   .then(response => {
+    if (response.status === 429) {
+      // Server is saturated, submit these videos again when it asks us to
+      const retryAfter = parseInt(response.headers.get('Retry-After'), 10) || 10;
+      console.log(`Server busy, retrying ${videoIds.length} videos in ${retryAfter}s`);
+      setTimeout(() => retryVideoEvaluations(videoIds), retryAfter * 1000);
+      return null;
+    }
     if (!response.ok) {
       throw new Error(`Response error: ${response.status}`);
     }
     return response.json();
   })
   .then(data => {
-    console.log(`Video evaluation ${videoId} sent to queue`);
-    // The actual response will arrive via WebSocket
+    if (!data) return;
+    // Already evaluated videos are answered inline
+    (data.results || []).forEach(result => {
+      processVideoScore(result.videoId, result.score, result.categories, result.content_summary, result.evaluation_summary);
+    });
+    console.log(`${data.enqueued.length} video evaluations sent to queue`);
+    // The remaining responses will arrive via WebSocket
   })
   .catch(error => {
-    console.error(`Error requesting evaluation for ${videoId}:`, error);
+    console.error(`Error requesting evaluation for ${videoIds.length} videos:`, error);
     // Remove from queue to allow future retries
+    videoIds.forEach(videoId => processingQueue.delete(videoId));
+  });
+}
+
+// Request again videos whose evaluation was rejected or dropped by the server
+function retryVideoEvaluations(videoIds) {
+  videoIds.forEach(videoId => {
     processingQueue.delete(videoId);
+    // Only the ones still on the page
+    if (videoElements[videoId] && !videoScores[videoId]) {
+      requestVideoEvaluation(videoId);
+    }
   });
 }
 
+// Subscribe to the results of the given videos over the WebSocket, for the
+// categories and prompts they are evaluated with
+function subscribeToVideos(videoIds) {
+  if (wsConnection?.readyState !== WebSocket.OPEN) return;
+  wsConnection.send(JSON.stringify({
+    type: 'subscribe',
+    videoIds,
+    categories: getActiveCategories(),
+    customPrompts: config.customPrompts
+  }));
+}
+
+// Tell the server we no longer need these videos, so it stops evaluating
+// the ones no other tab is waiting for
+function cancelVideoEvaluations(videoIds) {
+  videoIds.forEach(videoId => {
+    processingQueue.delete(videoId);
+    pendingEvaluations.delete(videoId);
+    delete videoElements[videoId];
+  });
+  if (wsConnection?.readyState !== WebSocket.OPEN) return;
+  wsConnection.send(JSON.stringify({ type: 'cancel', videoIds }));
+}
+
 // Get active categories according to configuration
 function getActiveCategories() {
   const activeCategories = [];
@@ -360,6 +521,79 @@ function processVideoScore(videoId, score, categories, content_summary, evaluati
   });
 }
 
+// Mark a video the server cannot evaluate
+function processNoCaptions(videoId, reason) {
+  processingQueue.delete(videoId);
+  processedVideos.add(videoId);
+  noCaptionVideos.add(videoId);
+  
+  if (videoElements[videoId]) {
+    applyNoCaptionsIndicator(videoId, videoElements[videoId]);
+  }
+  
+  logAction({
+    type: 'videoNoCaptions',
+    videoId,
+    reason
+  });
+}
+
+// Process a video the model could not score
+function processVideoError(videoId, reason) {
+  processingQueue.delete(videoId);
+  processedVideos.add(videoId);
+
+  logAction({
+    type: 'videoError',
+    videoId,
+    reason
+  });
+}
+
+// Replace the processing indicator with a "no captions" badge
+function applyNoCaptionsIndicator(videoId, element) {
+  applyProcessingIndicator(videoId, element);
+  const badge = element.querySelector('.agno-score-badge.processing');
+  if (!badge) return;
+  badge.classList.replace('processing', 'no-captions');
+  badge.innerHTML = `
+    <span class="agno-icon">CC ✕</span>
+  `;
+  badge.title = 'No captions to evaluate';
+}
+
+// Show the summaries of a video once the server sends them
+function processSummary(videoId, content_summary, evaluation_summary) {
+  if (videoScores[videoId]) {
+    videoScores[videoId].content_summary = content_summary;
+    videoScores[videoId].evaluation_summary = evaluation_summary;
+  }
+  const anchorEl = pendingSummaries[videoId];
+  delete pendingSummaries[videoId];
+  if (anchorEl && anchorEl.isConnected) {
+    showSummaryPopup(videoId, content_summary, evaluation_summary, anchorEl);
+  }
+}
+
+// Show the summaries of a video, asking the server for them the first time
+function openSummary(videoId, anchorEl) {
+  const scoreData = videoScores[videoId] || {};
+  if (scoreData.content_summary || scoreData.evaluation_summary) {
+    showSummaryPopup(videoId, scoreData.content_summary, scoreData.evaluation_summary, anchorEl);
+  } else if (wsConnection && wsConnection.readyState === WebSocket.OPEN) {
+    pendingSummaries[videoId] = anchorEl;
+    wsConnection.send(JSON.stringify({ type: 'summary', videoIds: [videoId] }));
+  } else {
+    showSummaryPopup(videoId, '', '', anchorEl);
+  }
+}
+
+// Show the categories scored so far until the final score arrives
+function processPartialScore(videoId, score, categories) {
+  if (videoScores[videoId] || !videoElements[videoId]) return;
+  applyScoreToVideo(videoId, { score, categories, partial: true });
+}
+
 // Apply score visually to the video
 function applyScoreToVideo(videoId, scoreData) {
   const element = videoElements[videoId];
@@ -371,7 +605,7 @@ function applyScoreToVideo(videoId, scoreData) {
     existingBadgeWrapper.remove();
   }
 
-  const { score, categories, content_summary, evaluation_summary } = scoreData;
+  const { score, categories, partial } = scoreData;
 
   // Create the floating container for the badge
   const badgeWrapper = document.createElement('div');
@@ -392,6 +626,9 @@ function applyScoreToVideo(videoId, scoreData) {
   }
 
   scoreBadge.classList.add(colorClass);
+  if (partial) {
+    scoreBadge.classList.add('partial');
+  }
 
   // Badge content
   scoreBadge.innerHTML = `
@@ -419,7 +656,8 @@ function applyScoreToVideo(videoId, scoreData) {
     thumbnailElement.appendChild(badgeWrapper);
   }
 
-  if (content_summary || evaluation_summary) {
+  // Summaries are fetched on click, final results always have them
+  if (!partial) {
     const channelNameEl = element.querySelector('ytd-channel-name, .ytd-channel-name');
 
     if (channelNameEl && !channelNameEl.querySelector('.agno-summary-button')) {
@@ -429,13 +667,15 @@ function applyScoreToVideo(videoId, scoreData) {
       summaryButton.onclick = (e) => {
         e.stopPropagation();
         e.preventDefault();
-        showSummaryPopup(videoId, content_summary, evaluation_summary, summaryButton);
+        openSummary(videoId, summaryButton);
       };
       channelNameEl.appendChild(summaryButton);
     }
   }
-  // Apply extra logic if necessary (hide, warning, etc.)
-  applyAutoActions(videoId, element, score);
+  // Apply extra logic if necessary (hide, warning, etc.), only on final scores
+  if (!partial) {
+    applyAutoActions(videoId, element, score);
+  }
 }
 
 // Get icon according to score
@@ -0,0 +1,80 @@
+import pytest
+
+import backend.queue.admission as admission
+from backend.queue.admission import RateLimitedError, RateLimiter
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(admission.time, "monotonic", clock.monotonic)
+    return clock
+
+
+def test_burst_is_admitted_at_once(clock):
+    limiter = RateLimiter(rate_per_minute=60, burst=5)
+    limiter.acquire("tab", 5)
+    with pytest.raises(RateLimitedError) as error:
+        limiter.acquire("tab")
+    assert error.value.retry_after == 1
+    assert limiter.limited == 1
+
+
+def test_tokens_refill_at_the_rate(clock):
+    limiter = RateLimiter(rate_per_minute=60, burst=2)
+    limiter.acquire("tab", 2)
+    clock.now += 1
+    limiter.acquire("tab")
+    with pytest.raises(RateLimitedError):
+        limiter.acquire("tab")
+    # Never more than the burst, however long the client waited
+    clock.now += 3600
+    limiter.acquire("tab", 2)
+    with pytest.raises(RateLimitedError):
+        limiter.acquire("tab")
+
+
+def test_clients_have_their_own_buckets(clock):
+    limiter = RateLimiter(rate_per_minute=60, burst=1)
+    limiter.acquire("tab1")
+    limiter.acquire("tab2")
+    with pytest.raises(RateLimitedError):
+        limiter.acquire("tab1")
+
+
+def test_requests_larger_than_the_burst_cost_the_whole_bucket(clock):
+    limiter = RateLimiter(rate_per_minute=60, burst=3)
+    limiter.acquire("tab", 10)
+    with pytest.raises(RateLimitedError) as error:
+        limiter.acquire("tab", 10)
+    assert error.value.retry_after == 3
+
+
+def test_full_buckets_are_forgotten_past_max_clients(clock):
+    limiter = RateLimiter(rate_per_minute=60, burst=1, max_clients=2)
+    limiter.acquire("old")
+    clock.now += 10
+    limiter.acquire("tab1")
+    limiter.acquire("tab2")
+    assert set(limiter._buckets) == {"tab1", "tab2"}
+
+
+def test_refunds_give_tokens_back_up_to_the_burst(clock):
+    limiter = RateLimiter(rate_per_minute=60, burst=2)
+    limiter.acquire("tab", 2)
+    limiter.refund("tab")
+    limiter.acquire("tab")
+    limiter.refund("tab", 10)
+    limiter.acquire("tab", 2)
+    with pytest.raises(RateLimitedError):
+        limiter.acquire("tab")
+    limiter.refund("unknown")
+    assert "unknown" not in limiter._buckets
@@ -0,0 +1,234 @@
+import asyncio
+import os
+from functools import partial
+
+import pytest
+
+import backend.queue.video_queue as video_queue
+from backend.agent.agent import create_agent_client, run_agent, run_agent_batch
+from backend.agent.parsing import UNREADABLE_RESPONSE
+from backend.agent.pool import AgentPool
+from backend.bench.fakes import PROMPT_VIDEO, FakeLatency, FakeLLM
+from backend.queue.job_queue import ScoringQueue, VideoQueue
+from backend.queue.video_queue import collect_batch
+from backend.schemas.schemas import ActionRequest
+
+# The fake model never checks it, but the OpenAI client needs one
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+CATEGORIES = ["hatred", "clarity"]
+DEADLINES = {"visible": 60, "prefetch": 60, "background": 60}
+
+
+class ScriptedLLM(FakeLLM):
+    """
+    Fake model that leaves videos out of its batch answers, declines to
+    score others or answers with text that is not JSON.
+    """
+
+    def __init__(self, left_out=(), declined=(), unreadable=False, **kwargs):
+        super().__init__(FakeLatency(0, 0), **kwargs)
+        self.left_out = set(left_out)
+        self.declined = set(declined)
+        self.unreadable = unreadable
+
+    def answer(self, prompt: str):
+        if self.unreadable:
+            return "Sorry, I cannot help with that."
+        answer = super().answer(prompt)
+        if "results" in answer:
+            answer["results"] = [
+                r for r in answer["results"] if r["videoId"] not in self.left_out
+            ]
+            for result in answer["results"]:
+                if result["videoId"] in self.declined:
+                    result.update(categories=[], error="No valid categories")
+        elif PROMPT_VIDEO.search(prompt).group(1) in self.declined:
+            answer.update(categories=[], error="No valid categories")
+        return answer
+
+
+class Published:
+    def __init__(self):
+        self.messages = []
+
+    def publish(self, key: str, message: dict) -> int:
+        self.messages.append(message)
+        return 1
+
+    def final(self):
+        return [
+            (m["type"], m["videoId"])
+            for m in self.messages
+            if m["type"] != "categoryScore"
+        ]
+
+
+def make_pool(llm: FakeLLM) -> AgentPool:
+    return AgentPool(1, partial(create_agent_client, transport=llm), 3, 100)
+
+
+def evaluate(llm: FakeLLM, video_ids, manager=None):
+    async def scenario():
+        pool = make_pool(llm)
+        try:
+            return await run_agent_batch(
+                [(video_id, "a short caption") for video_id in video_ids],
+                CATEGORIES,
+                pool,
+                None,
+                manager,
+            )
+        finally:
+            await pool.close()
+
+    return asyncio.run(scenario())
+
+
+def test_videos_are_scored_in_one_call():
+    llm, manager = ScriptedLLM(), Published()
+    results = evaluate(llm, ["a", "b", "c"], manager)
+    assert llm.calls == 1
+    assert all(not results[v].error for v in "abc")
+    assert [c.name for c in results["a"].categories] == CATEGORIES
+    assert manager.final() == [("videoScore", v) for v in "abc"]
+
+
+def test_videos_left_out_of_the_answer_are_evaluated_alone():
+    llm, manager = ScriptedLLM(left_out={"b"}), Published()
+    results = evaluate(llm, ["a", "b", "c"], manager)
+    assert llm.calls == 2 and llm.videos == 4
+    assert not results["b"].error
+    assert sorted(manager.final()) == [("videoScore", v) for v in "abc"]
+
+
+def test_videos_the_model_declines_get_an_error_message():
+    llm, manager = ScriptedLLM(declined={"b"}), Published()
+    results = evaluate(llm, ["a", "b"], manager)
+    assert results["b"].error == "No valid categories"
+    assert manager.final() == [("videoScore", "a"), ("videoError", "b")]
+
+
+def test_unreadable_answers_are_left_to_fail_their_jobs():
+    llm, manager = ScriptedLLM(unreadable=True), Published()
+    results = evaluate(llm, ["a", "b"], manager)
+    assert {results[v].error for v in "ab"} == {UNREADABLE_RESPONSE}
+    assert manager.final() == []
+
+
+def test_failed_calls_are_not_retried_video_by_video():
+    llm, manager = ScriptedLLM(error_rate=1.0), Published()
+    results = evaluate(llm, ["a", "b", "c"], manager)
+    assert results == {"a": None, "b": None, "c": None}
+    assert llm.videos == 0 and manager.final() == []
+
+
+@pytest.fixture
+def batching(monkeypatch):
+    for name, value in (
+        ("SCORING_BATCH_ENABLED", True),
+        ("SCORING_BATCH_MAX_VIDEOS", 3),
+        ("SCORING_BATCH_MAX_TOKENS", 100),
+        ("SCORING_BATCH_VIDEO_MAX_TOKENS", 50),
+        ("SCORING_BATCH_LINGER_MS", 20),
+    ):
+        monkeypatch.setattr(video_queue.settings, name, value)
+
+
+async def ready_job(videos: VideoQueue, scoring: ScoringQueue, video_id, **fields):
+    tokens = fields.pop("tokens", 10)
+    job, _ = await videos.submit(
+        ActionRequest(videoId=video_id, categories=CATEGORIES, **fields)
+    )
+    job.chunks, job.tokens = ["caption"], tokens
+    await scoring.reserve()
+    await scoring.put(job)
+    return job
+
+
+def ids(jobs):
+    return [job.payload.videoId for job in jobs]
+
+
+def evaluate_alone(llm: FakeLLM, video_id: str, manager):
+    async def scenario():
+        pool = make_pool(llm)
+        try:
+            return await run_agent(
+                video_id, CATEGORIES, ["a short caption"], pool, None, manager
+            )
+        finally:
+            await pool.close()
+
+    return asyncio.run(scenario())
+
+
+def test_single_videos_the_model_declines_get_an_error_message():
+    llm, manager = ScriptedLLM(declined={"a"}), Published()
+    assert evaluate_alone(llm, "a", manager).error == "No valid categories"
+    assert manager.final() == [("videoError", "a")]
+
+    llm, manager = ScriptedLLM(unreadable=True), Published()
+    assert evaluate_alone(llm, "a", manager).error == UNREADABLE_RESPONSE
+    assert manager.final() == []
+
+
+def test_batches_stop_at_the_video_limit(batching):
+    async def scenario():
+        videos, scoring = VideoQueue(DEADLINES, 10, 5), ScoringQueue(10)
+        first = await ready_job(videos, scoring, "a")
+        await scoring.take()
+        for video_id in "bcd":
+            await ready_job(videos, scoring, video_id)
+        assert ids(await collect_batch(scoring, first)) == ["a", "b", "c"]
+        assert scoring.qsize() == 1
+
+    asyncio.run(scenario())
+
+
+def test_batches_stop_at_the_token_budget(batching):
+    async def scenario():
+        videos, scoring = VideoQueue(DEADLINES, 10, 5), ScoringQueue(10)
+        first = await ready_job(videos, scoring, "a", tokens=40)
+        await scoring.take()
+        await ready_job(videos, scoring, "b", tokens=40)
+        await ready_job(videos, scoring, "c", tokens=40)
+        assert ids(await collect_batch(scoring, first)) == ["a", "b"]
+
+    asyncio.run(scenario())
+
+
+def test_jobs_that_cannot_join_stay_queued(batching):
+    async def scenario():
+        videos, scoring = VideoQueue(DEADLINES, 10, 5), ScoringQueue(10)
+        first = await ready_job(videos, scoring, "a")
+        await scoring.take()
+        await ready_job(videos, scoring, "b", customPrompts=["be strict"])
+        await ready_job(videos, scoring, "c")
+        assert ids(await collect_batch(scoring, first)) == ["a"]
+        assert scoring.qsize() == 2
+
+        # Long transcripts are scored alone
+        await scoring.take()
+        await scoring.take()
+        await ready_job(videos, scoring, "d", tokens=60)
+        assert ids(await collect_batch(scoring, first)) == ["a"]
+        assert scoring.qsize() == 1
+
+    asyncio.run(scenario())
+
+
+def test_batches_wait_a_moment_for_captions_still_coming(batching):
+    async def scenario():
+        videos, scoring = VideoQueue(DEADLINES, 10, 5), ScoringQueue(10)
+        first = await ready_job(videos, scoring, "a")
+        await scoring.take()
+
+        async def arrive_late():
+            await asyncio.sleep(0.005)
+            await ready_job(videos, scoring, "b")
+
+        batch, _ = await asyncio.gather(collect_batch(scoring, first), arrive_late())
+        assert ids(batch) == ["a", "b"]
+
+    asyncio.run(scenario())
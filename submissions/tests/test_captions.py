@@ -0,0 +1,171 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from backend.agent.captions import CaptionError, CaptionFetcher
+from backend.bench.fakes import FakeLatency, FakeYouTube
+from backend.cache.transcript_cache import TranscriptCache, transcript_digest
+from backend.queue.job_queue import ScoringQueue, VideoQueue
+from backend.queue.video_queue import caption_worker
+from backend.schemas.schemas import ActionRequest
+
+DEADLINES = {"visible": 60, "prefetch": 60, "background": 60}
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = TranscriptCache(str(tmp_path / "transcripts.sqlite3"), 60, 10)
+    yield cache
+    cache.close()
+
+
+def make_fetcher(cache, download, max_retries: int = 2) -> CaptionFetcher:
+    return CaptionFetcher(cache, ["en"], max_retries, 0, download)
+
+
+def test_captions_are_downloaded_once_then_served_from_the_cache(cache):
+    youtube = FakeYouTube(FakeLatency(0, 0))
+    fetcher = make_fetcher(cache, youtube.download)
+
+    async def scenario():
+        first = await fetcher.fetch("v")
+        assert first.strip()
+        assert await fetcher.fetch("v") == first
+        assert youtube.downloads == 1
+
+    asyncio.run(scenario())
+
+
+def test_transient_errors_are_retried(cache):
+    calls = []
+
+    def download(video_id: str) -> str:
+        calls.append(video_id)
+        if len(calls) < 3:
+            raise ConnectionError("reset by peer")
+        return "hello there"
+
+    async def scenario():
+        assert await make_fetcher(cache, download).fetch("v") == "hello there"
+        assert len(calls) == 3
+
+    asyncio.run(scenario())
+
+
+def test_transient_errors_give_up_after_the_retries(cache):
+    youtube = FakeYouTube(FakeLatency(0, 0), error_rate=1.0)
+
+    async def scenario():
+        with pytest.raises(CaptionError) as error:
+            await make_fetcher(cache, youtube.download).fetch("v")
+        assert not error.value.permanent
+        assert youtube.downloads == 3
+        assert await cache.get("v") is None
+
+    asyncio.run(scenario())
+
+
+def test_videos_without_captions_are_not_retried(cache):
+    youtube = FakeYouTube(FakeLatency(0, 0), unavailable_rate=1.0)
+
+    async def scenario():
+        with pytest.raises(CaptionError, match="TranscriptsDisabled") as error:
+            await make_fetcher(cache, youtube.download).fetch("v")
+        assert error.value.permanent
+        assert youtube.downloads == 1
+
+    asyncio.run(scenario())
+
+
+def test_empty_captions_are_an_error(cache):
+    async def scenario():
+        with pytest.raises(CaptionError) as error:
+            await make_fetcher(cache, lambda video_id: " \n ").fetch("v")
+        assert error.value.permanent
+        assert await cache.get("v") is None
+
+    asyncio.run(scenario())
+
+
+def test_identical_transcripts_are_stored_once(cache):
+    async def scenario():
+        digest = await cache.set("original", "same words")
+        assert await cache.set("mirror", "same words") == digest
+        assert digest == transcript_digest("same words")
+        (stored,) = cache._db.execute("SELECT COUNT(*) FROM transcripts").fetchone()
+        assert stored == 1
+
+    asyncio.run(scenario())
+
+
+def test_transcripts_are_read_back_from_disk(tmp_path):
+    path = str(tmp_path / "transcripts.sqlite3")
+
+    async def scenario():
+        cache = TranscriptCache(path, 60, 10)
+        await cache.set("v", "some words")
+        cache.close()
+        cache = TranscriptCache(path, 60, 10)
+        assert await cache.get("v") == "some words"
+        assert await cache.get("other") is None
+        cache.close()
+
+    asyncio.run(scenario())
+
+
+def test_expired_transcripts_are_deleted_with_their_text(tmp_path):
+    path = str(tmp_path / "transcripts.sqlite3")
+
+    async def scenario():
+        cache = TranscriptCache(path, -1, 10)
+        await cache.set("old", "old words")
+        assert await cache.get("old") is None
+        cache.ttl_seconds = 60
+        await cache.set("new", "new words")
+        texts = cache._db.execute("SELECT text FROM transcripts").fetchall()
+        assert texts == [("new words",)]
+        cache.close()
+
+    asyncio.run(scenario())
+
+
+def run_caption_worker(cache, download):
+    """
+    Runs one job through the caption stage and returns its result, the drop
+    reasons and the types of the messages sent.
+    """
+    dropped, published = [], []
+
+    async def scenario():
+        queue = VideoQueue(
+            DEADLINES, 10, 5, on_drop=lambda job, reason: dropped.append(reason)
+        )
+        manager = SimpleNamespace(
+            publish=lambda key, message: published.append(message["type"])
+        )
+        fetcher = make_fetcher(cache, download, max_retries=0)
+        job, _ = await queue.submit(ActionRequest(videoId="v", categories=["hatred"]))
+        worker = asyncio.create_task(
+            caption_worker(queue, ScoringQueue(1), fetcher, None, manager, "1")
+        )
+        try:
+            return await asyncio.wait_for(job.future, 1)
+        finally:
+            worker.cancel()
+
+    return asyncio.run(scenario()), dropped, published
+
+
+def test_videos_without_captions_are_settled(cache):
+    youtube = FakeYouTube(FakeLatency(0, 0), unavailable_rate=1.0)
+    result, dropped, published = run_caption_worker(cache, youtube.download)
+    assert "TranscriptsDisabled" in result.error
+    assert dropped == [] and published == ["noCaptions"]
+
+
+def test_failed_caption_downloads_drop_the_job(cache):
+    youtube = FakeYouTube(FakeLatency(0, 0), error_rate=1.0)
+    result, dropped, published = run_caption_worker(cache, youtube.download)
+    assert result is None
+    assert dropped == ["failed"] and published == []
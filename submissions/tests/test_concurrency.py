@@ -0,0 +1,147 @@
+import asyncio
+import time
+
+import httpx
+
+from backend.agent.concurrency import AdaptiveLimiter, parse_retry_after
+
+
+def make_limiter(initial: int = 4) -> AdaptiveLimiter:
+    return AdaptiveLimiter(
+        initial, min_limit=1, max_limit=8, latency_tolerance=2.0, backoff=0.5
+    )
+
+
+async def call(
+    limiter: AdaptiveLimiter, status: int, headers=None, latency: float = 0.0
+) -> None:
+    request = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+    await limiter.observe_request(request)
+    request.extensions["started_at"] -= latency
+    await limiter.observe_response(
+        httpx.Response(status, headers=headers, request=request)
+    )
+
+
+def test_retry_after_headers():
+    def response(headers):
+        return httpx.Response(429, headers=headers)
+
+    assert parse_retry_after(response({"retry-after-ms": "1500"})) == 1.5
+    assert parse_retry_after(response({"retry-after": "2"})) == 2.0
+    assert parse_retry_after(response({"retry-after": "soon"})) is None
+    assert parse_retry_after(response({})) is None
+
+
+def test_rate_limit_cuts_the_limit_and_pauses():
+    async def scenario():
+        limiter = make_limiter()
+        await call(limiter, 429, {"retry-after-ms": "500"})
+        assert limiter.current_limit == 2
+        assert limiter.rate_limited == 1
+        assert limiter._paused_until > time.monotonic()
+
+    asyncio.run(scenario())
+
+
+def test_calls_started_before_a_decrease_do_not_cut_again():
+    async def scenario():
+        limiter = make_limiter()
+        request = httpx.Request("POST", "https://api.openai.com/")
+        await limiter.observe_request(request)
+        await call(limiter, 500)
+        await limiter.observe_response(httpx.Response(500, request=request))
+        assert limiter.current_limit == 2
+        assert limiter.decreases == 1
+
+    asyncio.run(scenario())
+
+
+def test_limit_never_drops_below_the_minimum():
+    async def scenario():
+        limiter = make_limiter(initial=1)
+        await call(limiter, 500)
+        assert limiter.current_limit == 1
+        assert limiter.decreases == 0
+
+    asyncio.run(scenario())
+
+
+def test_limit_grows_only_while_every_slot_is_busy():
+    async def scenario():
+        limiter = make_limiter(initial=2)
+        await call(limiter, 200, latency=1.0)
+        assert limiter.current_limit == 2
+
+        limiter.in_flight = 2
+        for _ in range(4):
+            await call(limiter, 200, latency=1.0)
+        assert limiter.current_limit == 3
+        assert limiter.increases == 1
+
+    asyncio.run(scenario())
+
+
+def test_growing_latency_cuts_the_limit():
+    async def scenario():
+        limiter = make_limiter()
+        await call(limiter, 200, latency=1.0)
+        for _ in range(3):
+            await call(limiter, 200, latency=10.0)
+        assert limiter.current_limit == 2
+
+    asyncio.run(scenario())
+
+
+def test_slots_wait_while_the_limit_is_reached():
+    async def scenario():
+        limiter = make_limiter(initial=1)
+        entered = []
+
+        async def work(name: str):
+            async with limiter.slot():
+                entered.append(name)
+                await asyncio.sleep(0.01)
+
+        await asyncio.gather(work("a"), work("b"))
+        assert entered == ["a", "b"]
+        assert limiter.in_flight == 0
+
+        async with limiter.slot():
+            waiting = asyncio.ensure_future(work("c"))
+            await asyncio.sleep(0.01)
+            assert not waiting.done()
+        await asyncio.wait_for(waiting, 1)
+
+    asyncio.run(scenario())
+
+
+def test_latency_runs_until_the_body_is_read():
+    async def body():
+        yield b"{"
+        await asyncio.sleep(0.05)
+        yield b"}"
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, content=body())
+
+    async def scenario():
+        limiter = make_limiter()
+        async with httpx.AsyncClient(
+            transport=httpx.MockTransport(handler),
+            event_hooks={
+                "request": [limiter.observe_request],
+                "response": [limiter.observe_response],
+            },
+        ) as http:
+            async with http.stream("POST", "https://api.openai.com/") as response:
+                assert limiter.latency is None
+                await response.aread()
+            assert limiter.latency >= 0.05
+
+            # Bodies left unread say nothing about the latency
+            async with http.stream("POST", "https://api.openai.com/"):
+                pass
+            assert limiter.latency < 0.1
+
+    asyncio.run(scenario())
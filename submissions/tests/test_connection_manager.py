@@ -0,0 +1,206 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+from backend.cache.result_cache import make_cache_key
+from backend.ws.connection_manager import ClientConnection, ConnectionManager
+from backend.ws.websocket import handle_client_message
+
+
+class FakeWebSocket:
+    def __init__(self):
+        self.sent = []
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, data: str):
+        self.sent.append(json.loads(data))
+
+    async def send_bytes(self, data: bytes):
+        self.sent.append(data)
+
+
+def score(video_id: str, kind: str = "videoScore") -> dict:
+    return {"type": kind, "videoId": video_id, "score": 7}
+
+
+async def connect(manager: ConnectionManager, client_id: str):
+    websocket = FakeWebSocket()
+    client = await manager.connect(websocket, client_id)
+    return client, websocket
+
+
+async def received(websocket: FakeWebSocket):
+    await asyncio.sleep(0.01)
+    return [m for m in websocket.sent if m["type"] != "hello"]
+
+
+def test_results_go_only_to_the_subscribers_of_the_evaluation():
+    async def scenario():
+        manager = ConnectionManager()
+        _, first = await connect(manager, "tab1")
+        _, second = await connect(manager, "tab2")
+        manager.subscribe("tab1", [("v", "key-a")])
+        manager.subscribe("tab2", [("v", "key-b")])
+        assert manager.send_to_subscribers("key-a", score("v")) == 1
+        assert await received(first) == [score("v")]
+        assert await received(second) == []
+
+    asyncio.run(scenario())
+
+
+def test_clients_ids_in_use_are_not_taken_over():
+    async def scenario():
+        manager = ConnectionManager()
+        first, _ = await connect(manager, "tab")
+        second, websocket = await connect(manager, "tab")
+        assert first.client_id == "tab" and second.client_id != "tab"
+        await asyncio.sleep(0.01)
+        assert websocket.sent[0]["clientId"] == second.client_id
+
+    asyncio.run(scenario())
+
+
+def test_subscriptions_end_with_the_final_result():
+    async def scenario():
+        manager = ConnectionManager()
+        client, websocket = await connect(manager, "tab")
+        manager.subscribe("tab", [("v", "key"), ("w", "other")])
+        manager.send_to_subscribers("key", score("v", "categoryScore"))
+        assert "key" in manager.subscribers
+
+        manager.send_to_subscribers("key", score("v"))
+        assert set(manager.subscribers) == {"other"}
+        assert client.subscriptions == {"w": {"other"}}
+        assert client.evaluation_keys("v") == ["key"]
+        assert manager.send_to_subscribers("key", score("v")) == 0
+        assert len(await received(websocket)) == 2
+
+    asyncio.run(scenario())
+
+
+def test_settled_keys_are_kept_for_the_latest_videos_only():
+    async def scenario():
+        manager = ConnectionManager()
+        client, _ = await connect(manager, "tab")
+        client.settled_max = 2
+        for video_id in ("v1", "v2", "v3"):
+            manager.subscribe("tab", [(video_id, f"key-{video_id}")])
+            manager.send_to_subscribers(f"key-{video_id}", score(video_id))
+        assert list(client.settled) == ["v2", "v3"]
+        assert client.evaluation_keys("v1") == []
+
+    asyncio.run(scenario())
+
+
+def test_late_subscribers_get_the_recent_result_replayed():
+    async def scenario():
+        manager = ConnectionManager(replay_seconds=60, replay_max_entries=10)
+        client, websocket = await connect(manager, "tab")
+        manager.send_to_subscribers("key", score("v"))
+        manager.send_to_subscribers("partial", score("w", "categoryScore"))
+        manager.subscribe("tab", [("v", "key"), ("w", "partial")], replay=True)
+        assert await received(websocket) == [score("v")]
+        assert manager.replayed == 1
+        # The evaluation is over, only the other one is still subscribed to
+        assert set(manager.subscribers) == {"partial"}
+        assert client.evaluation_keys("v") == ["key"]
+
+        manager.recent["key"] = (0.0, score("v"))
+        assert manager.recent_result("key") is None
+
+    asyncio.run(scenario())
+
+
+def test_replay_keeps_the_most_recent_evaluations():
+    manager = ConnectionManager(replay_seconds=60, replay_max_entries=2)
+    for key in ("a", "b", "c"):
+        manager.send_to_subscribers(key, score(key))
+    assert list(manager.recent) == ["b", "c"]
+
+
+def test_disconnected_clients_lose_their_subscriptions():
+    async def scenario():
+        manager = ConnectionManager()
+        client, _ = await connect(manager, "tab")
+        manager.subscribe("tab", [("v", "key")])
+        await manager.disconnect(client)
+        assert manager.subscribers == {}
+        assert not manager.subscribe("tab", [("v", "key")])
+        assert manager.send_to_subscribers("key", score("v")) == 0
+
+    asyncio.run(scenario())
+
+
+def test_full_send_queues_drop_their_oldest_message():
+    client = ClientConnection(FakeWebSocket(), "tab", max_queue_size=2)
+    for video_id in ("v1", "v2", "v3"):
+        client.enqueue(score(video_id))
+    assert client.dropped == 1
+    assert [client.queue.get_nowait()["videoId"] for _ in range(2)] == ["v2", "v3"]
+
+
+def test_slow_clients_do_not_hold_back_the_others():
+    async def scenario():
+        manager = ConnectionManager(send_queue_size=1)
+        slow, _ = await connect(manager, "slow")
+        slow.sender.cancel()
+        _, websocket = await connect(manager, "fast")
+        manager.subscribe("slow", [(f"v{i}", f"k{i}") for i in range(5)])
+        manager.subscribe("fast", [(f"v{i}", f"k{i}") for i in range(5)])
+        for i in range(5):
+            manager.send_to_subscribers(f"k{i}", score(f"v{i}"))
+            await asyncio.sleep(0)
+        assert len(await received(websocket)) == 5
+        assert slow.queue.qsize() == 1 and slow.dropped == 5
+
+    asyncio.run(scenario())
+
+
+def test_compact_clients_get_a_window_of_messages_in_one_frame():
+    async def scenario():
+        manager = ConnectionManager(batch_window=0.01)
+        websocket = FakeWebSocket()
+        await manager.connect(websocket, "tab", "compact")
+        manager.subscribe("tab", [("v1", "k1"), ("v2", "k2")])
+        manager.send_to_subscribers("k1", dict(score("v1"), content_summary="x"))
+        manager.send_to_subscribers("k2", score("v2"))
+        await asyncio.sleep(0.05)
+        assert websocket.sent == [
+            {
+                "type": "batch",
+                "messages": [
+                    {"type": "hello", "clientId": "tab", "protocol": "compact"},
+                    score("v1"),
+                    score("v2"),
+                ],
+            }
+        ]
+
+    asyncio.run(scenario())
+
+
+def test_summaries_are_answered_after_the_subscription_ended():
+    async def scenario():
+        manager = ConnectionManager(replay_seconds=60, replay_max_entries=10)
+        state = SimpleNamespace(manager=manager, cache=None)
+        client, websocket = await connect(manager, "tab")
+        subscribe = {"type": "subscribe", "videoIds": ["v"], "categories": ["hatred"]}
+        await handle_client_message(state, client, json.dumps(subscribe))
+        key = make_cache_key("v", ["hatred"])
+        manager.send_to_subscribers(
+            key, dict(score("v"), evaluation_summary="Calm.", content_summary="A talk.")
+        )
+        assert manager.subscribers == {}
+
+        summary = {"type": "summary", "videoIds": ["v"]}
+        await handle_client_message(state, client, json.dumps(summary))
+        assert (await received(websocket))[-1] == {
+            "type": "summary",
+            "videoId": "v",
+            "evaluation_summary": "Calm.",
+            "content_summary": "A talk.",
+        }
+
+    asyncio.run(scenario())
@@ -0,0 +1,199 @@
+import asyncio
+
+import pytest
+
+from backend.queue.admission import QueueFullError
+from backend.queue.job_queue import ScoringQueue, VideoQueue
+from backend.schemas.schemas import ActionRequest
+
+DEADLINES = {"visible": 60, "prefetch": 60, "background": 60}
+
+
+def request(video_id: str, priority: str = "visible", client: str = "tab", **kwargs):
+    return ActionRequest(
+        videoId=video_id,
+        categories=["hatred"],
+        clientId=client,
+        priority=priority,
+        **kwargs,
+    )
+
+
+def make_queue(max_depth: int = 10, **kwargs) -> VideoQueue:
+    dropped = []
+    queue = VideoQueue(
+        DEADLINES,
+        max_depth,
+        retry_after=5,
+        on_drop=lambda job, reason: dropped.append((job.payload.videoId, reason)),
+        **kwargs,
+    )
+    queue.dropped = dropped
+    return queue
+
+
+def test_identical_requests_share_one_job():
+    async def scenario():
+        queue = make_queue()
+        job, created = await queue.submit(request("a", client="tab1"))
+        same, created_again = await queue.submit(
+            request("a", client="tab2").model_copy(update={"categories": ["HATRED "]})
+        )
+        other, _ = await queue.submit(request("b"))
+        assert created and not created_again
+        assert same is job and other is not job
+        assert job.submissions == 2 and job.clients == {"tab1", "tab2"}
+        assert queue.coalesced == 1 and queue.qsize() == 2
+
+        queue.complete(job, None)
+        assert await job.future is None
+        _, created = await queue.submit(request("a"))
+        assert created
+
+    asyncio.run(scenario())
+
+
+def test_jobs_are_served_by_priority_then_in_arrival_order():
+    async def scenario():
+        queue = make_queue()
+        for video_id, priority in (
+            ("b1", "background"),
+            ("v1", "visible"),
+            ("p1", "prefetch"),
+            ("v2", "visible"),
+        ):
+            await queue.submit(request(video_id, priority))
+        order = [(await queue.get()).payload.videoId for _ in range(4)]
+        assert order == ["v1", "v2", "p1", "b1"]
+
+    asyncio.run(scenario())
+
+
+def test_a_more_urgent_submission_promotes_the_queued_job():
+    async def scenario():
+        queue = make_queue()
+        await queue.submit(request("v1", "visible"))
+        job, _ = await queue.submit(request("b1", "background"))
+        await queue.submit(request("v2", "visible"))
+        await queue.submit(request("b1", "visible", client="other"))
+        assert job.priority == "visible"
+        order = [(await queue.get()).payload.videoId for _ in range(3)]
+        assert order == ["v1", "v2", "b1"]
+        assert queue.qsize() == 0
+
+    asyncio.run(scenario())
+
+
+def test_jobs_past_their_deadline_are_dropped_when_dequeued():
+    async def scenario():
+        queue = make_queue()
+        await queue.submit(request("late", deadlineMs=1))
+        await queue.submit(request("kept"))
+        await asyncio.sleep(0.01)
+        assert (await queue.get()).payload.videoId == "kept"
+        assert queue.dropped == [("late", "expired")]
+
+    asyncio.run(scenario())
+
+
+def test_full_queue_sheds_newest_jobs_of_lower_priority():
+    async def scenario():
+        queue = make_queue(max_depth=3)
+        await queue.submit(request("b1", "background"))
+        await queue.submit(request("b2", "background"))
+        await queue.submit(request("p1", "prefetch"))
+        await queue.submit(request("v1", "visible"))
+        await queue.submit(request("v2", "visible"))
+        assert queue.dropped == [("b2", "shed"), ("b1", "shed")]
+        assert queue.shed == 2
+        order = [(await queue.get()).payload.videoId for _ in range(3)]
+        assert order == ["v1", "v2", "p1"]
+
+    asyncio.run(scenario())
+
+
+def test_full_queue_rejects_jobs_it_cannot_make_room_for():
+    async def scenario():
+        queue = make_queue(max_depth=2)
+        await queue.submit(request("v1"))
+        await queue.submit(request("v2"))
+        with pytest.raises(QueueFullError) as error:
+            await queue.submit(request("b1", "background"))
+        assert error.value.retry_after == 5
+        # Coalescing needs no room
+        _, created = await queue.submit(request("v1", client="other"))
+        assert not created
+        assert queue.rejected == 1 and queue.qsize() == 2
+
+    asyncio.run(scenario())
+
+
+def test_batches_are_admitted_as_a_whole():
+    async def scenario():
+        queue = make_queue(max_depth=2)
+        await queue.submit(request("v1"))
+        with pytest.raises(QueueFullError):
+            await queue.submit_many([request("v2"), request("v3")])
+        assert queue.qsize() == 1
+
+    asyncio.run(scenario())
+
+
+def test_scoring_queue_serves_the_best_job_ready():
+    async def scenario():
+        videos = make_queue()
+        scoring = ScoringQueue(maxsize=2)
+        background, _ = await videos.submit(request("b1", "background"))
+        visible, _ = await videos.submit(request("v1", "visible"))
+        for job in (background, visible):
+            await scoring.reserve()
+            await scoring.put(job)
+        assert scoring.qsize() == 2
+        assert await scoring.take(lambda job: job.priority == "background") is None
+        assert await scoring.take() is visible
+        assert await scoring.take() is background
+        assert await scoring.take() is None
+
+    asyncio.run(scenario())
+
+
+def test_scoring_queue_reservations_wait_for_room():
+    async def scenario():
+        videos = make_queue()
+        scoring = ScoringQueue(maxsize=1)
+        job, _ = await videos.submit(request("a"))
+        await scoring.reserve()
+        waiting = asyncio.ensure_future(scoring.reserve())
+        await asyncio.sleep(0)
+        assert not waiting.done()
+        await scoring.put(job)
+        await asyncio.sleep(0)
+        assert not waiting.done()
+        await scoring.take()
+        await asyncio.wait_for(waiting, 1)
+
+    asyncio.run(scenario())
+
+
+def test_jobs_no_client_is_waiting_for_are_dropped_when_dequeued():
+    async def scenario():
+        queue = make_queue(is_wanted=lambda job: job.payload.videoId != "gone")
+        await queue.submit(request("gone"))
+        await queue.submit(request("kept"))
+        assert (await queue.get()).payload.videoId == "kept"
+        assert queue.dropped == [("gone", "abandoned")]
+
+    asyncio.run(scenario())
+
+
+def test_jobs_are_cancelled_once_no_client_wants_them():
+    async def scenario():
+        queue = make_queue()
+        await queue.submit(request("a", client="tab1"))
+        await queue.submit(request("a", client="tab2"))
+        await queue.submit(request("b", client="tab1"))
+        assert queue.cancel("tab1") == 1
+        assert queue.dropped == [("b", "cancelled")]
+        assert (await queue.get()).payload.videoId == "a"
+
+    asyncio.run(scenario())
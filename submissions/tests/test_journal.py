@@ -0,0 +1,150 @@
+import asyncio
+
+import pytest
+
+from backend.cache.result_cache import make_cache_key
+from backend.queue.broker import InProcessBroker
+from backend.queue.journal import JobJournal
+from backend.schemas.schemas import ActionRequest
+from backend.ws.connection_manager import ConnectionManager
+
+DEADLINES = {"visible": 60, "prefetch": 60, "background": 60}
+
+
+def request(video_id: str) -> ActionRequest:
+    return ActionRequest(videoId=video_id, categories=["hatred"], clientId="tab")
+
+
+def rows(journal: JobJournal):
+    return journal._db.execute(
+        "SELECT key, event FROM job_events ORDER BY id"
+    ).fetchall()
+
+
+def test_events_are_written_together_in_one_commit(tmp_path):
+    async def scenario():
+        journal = JobJournal(str(tmp_path / "journal.sqlite3"), 60)
+        journal.enqueued("a", request("a"))
+        journal.enqueued("b", request("b"))
+        journal.started("a")
+        assert rows(journal) == []
+
+        await journal.flush()
+        assert rows(journal) == [("a", "enqueue"), ("b", "enqueue"), ("a", "start")]
+        assert journal.stats() == {
+            "buffered": 0,
+            "written": 3,
+            "commits": 1,
+            "replayed": 0,
+        }
+        await journal.flush()
+        assert journal.commits == 1
+        await journal.close()
+
+    asyncio.run(scenario())
+
+
+def test_events_are_flushed_in_the_background(tmp_path):
+    async def scenario():
+        journal = JobJournal(str(tmp_path / "journal.sqlite3"), 0.01)
+        await journal.start()
+        journal.enqueued("a", request("a"))
+        await asyncio.sleep(0.05)
+        assert rows(journal) == [("a", "enqueue")]
+        await journal.close()
+
+    asyncio.run(scenario())
+
+
+def test_events_that_failed_to_be_written_are_kept(tmp_path, monkeypatch):
+    async def scenario():
+        journal = JobJournal(str(tmp_path / "journal.sqlite3"), 60)
+        journal.enqueued("a", request("a"))
+        write = journal._db_write
+
+        def fail(events):
+            raise OSError("disk full")
+
+        monkeypatch.setattr(journal, "_db_write", fail)
+        with pytest.raises(OSError):
+            await journal.flush()
+        journal.started("a")
+        assert journal.stats()["buffered"] == 2
+
+        monkeypatch.setattr(journal, "_db_write", write)
+        await journal.flush()
+        assert rows(journal) == [("a", "enqueue"), ("a", "start")]
+        await journal.close()
+
+    asyncio.run(scenario())
+
+
+def test_only_unfinished_jobs_are_replayed(tmp_path):
+    path = str(tmp_path / "journal.sqlite3")
+
+    async def scenario():
+        journal = JobJournal(path, 60)
+        for video_id in ("a", "b", "c"):
+            journal.enqueued(video_id, request(video_id))
+        journal.started("a")
+        journal.started("b")
+        journal.completed("b")
+        # Completed then submitted again in the same commit
+        journal.completed("c")
+        journal.enqueued("c", request("c"))
+        await journal.close()
+
+        journal = JobJournal(path, 60)
+        replayed = await journal.unfinished()
+        assert [payload.videoId for payload in replayed] == ["a", "c"]
+        assert journal.replayed == 2
+        await journal.close()
+
+    asyncio.run(scenario())
+
+
+def test_unfinished_jobs_are_queued_again_after_a_restart(tmp_path):
+    path = str(tmp_path / "journal.sqlite3")
+
+    async def scenario():
+        broker = InProcessBroker(ConnectionManager(), JobJournal(path, 60))
+        queue = broker.create_queue(DEADLINES, 10, retry_after=5)
+        await broker.start()
+        await queue.submit(request("a"))
+        await queue.submit(request("b"))
+        queue.complete(await queue.get(), None)
+        await broker.close()
+
+        broker = InProcessBroker(ConnectionManager(), JobJournal(path, 60))
+        queue = broker.create_queue(DEADLINES, 10, retry_after=5)
+        await broker.start()
+        job = await queue.get()
+        # Its subscribers were lost with the previous process
+        assert job.payload.videoId == "b" and job.payload.clientId is None
+        assert queue.qsize() == 0
+        await broker.close()
+
+    asyncio.run(scenario())
+
+
+def test_jobs_without_room_after_a_restart_are_forgotten(tmp_path):
+    path = str(tmp_path / "journal.sqlite3")
+
+    async def scenario():
+        journal = JobJournal(path, 60)
+        for video_id in ("a", "b"):
+            journal.enqueued(make_cache_key(video_id, ["hatred"]), request(video_id))
+        await journal.close()
+
+        journal = JobJournal(path, 60)
+        broker = InProcessBroker(ConnectionManager(), journal)
+        queue = broker.create_queue(DEADLINES, 1, retry_after=5)
+        await broker.start()
+        assert queue.qsize() == 1
+        await broker.close()
+
+        journal = JobJournal(path, 60)
+        assert [payload.videoId for payload in await journal.unfinished()] == ["a"]
+        await journal.close()
+
+    asyncio.run(scenario())
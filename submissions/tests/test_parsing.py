@@ -0,0 +1,84 @@
+import json
+
+from backend.agent.agent import parse_batch_response, parse_model_response
+from backend.agent.parsing import close_json, extract_json, parse_json
+
+RESPONSE = {
+    "categories": [
+        {"name": "hatred", "score": 9, "connotation": "negative", "reason": "None."},
+        {"name": "fraud", "score": 8, "connotation": "negative", "reason": "None."},
+    ],
+    "overall": {"score": 8.5, "reason": "Harmless.", "confidence": 0.9},
+    "error": "",
+    "content_summary": "A cooking video.",
+}
+
+
+def test_parse_json_reads_valid_json():
+    assert parse_json(json.dumps(RESPONSE)) == (RESPONSE, False)
+
+
+def test_parse_json_strips_fences_and_text_around():
+    text = "Here is the result:\n```json\n" + json.dumps(RESPONSE) + "\n```"
+    assert parse_json(text) == (RESPONSE, False)
+
+
+def test_parse_json_recovers_truncated_object():
+    text = json.dumps(RESPONSE)
+    cut = text[: text.index('{"name": "fraud"') + 20]
+    data, recovered = parse_json(cut)
+    assert recovered
+    # The category cut off keeps its complete fields only
+    assert data["categories"] == [RESPONSE["categories"][0], {"name": "fraud"}]
+
+
+def test_parse_json_gives_up_on_text_without_json():
+    assert parse_json("I cannot evaluate this video.") == (None, False)
+    assert parse_json("") == (None, False)
+
+
+def test_extract_json_keeps_truncated_tail():
+    assert extract_json('```json\n{"a": [1, 2') == '{"a": [1, 2'
+
+
+def test_close_json_cuts_after_last_complete_value():
+    assert close_json('{"a": [1, 2, {"b": "x') == '{"a": [1, 2]}'
+    assert close_json('{"a": 1, "b') == '{"a": 1}'
+    assert close_json('{"a": "x", "b": {"c": 1, "d') == '{"a": "x", "b": {"c": 1}}'
+    # A number is only complete once something follows it
+    assert close_json('{"a": "x", "b": 12') == '{"a": "x"}'
+
+
+def test_close_json_ignores_brackets_in_strings():
+    assert close_json('{"a": "}]", "b": "{[') == '{"a": "}]"}'
+    assert close_json('{"a": "say \\"hi\\"", "b') == '{"a": "say \\"hi\\""}'
+
+
+def test_close_json_returns_none_when_nothing_is_complete():
+    assert close_json('{"a": "unterminated') is None
+
+
+def test_parse_model_response_marks_recovered_result_missing_categories():
+    text = json.dumps(RESPONSE)
+    cut = text[: text.index('{"name": "fraud"') + 20]
+    result = parse_model_response(cut, ["hatred", "fraud"])
+    assert [c.name for c in result.categories] == ["hatred"]
+    assert result.incomplete
+
+
+def test_parse_model_response_keeps_whole_result_complete():
+    result = parse_model_response(json.dumps(RESPONSE), ["hatred", "fraud"])
+    assert not result.incomplete
+    assert result.overall.confidence == 0.9
+
+
+def test_parse_model_response_returns_none_when_unreadable():
+    assert parse_model_response("Sorry, no.", ["hatred"]) is None
+
+
+def test_parse_batch_response_skips_entries_without_video_id():
+    text = json.dumps(
+        {"results": [{"videoId": "a", **RESPONSE}, RESPONSE, {"videoId": "b"}]}
+    )
+    batch = parse_batch_response(text, ["hatred", "fraud"])
+    assert [r.videoId for r in batch.results] == ["a"]
@@ -0,0 +1,105 @@
+import asyncio
+
+import httpx
+import pytest
+
+from backend.agent.pool import AgentClient, AgentPool
+
+
+def make_pool(size: int = 1, max_failures: int = 2, max_uses: int = 3):
+    created = []
+
+    def factory() -> AgentClient:
+        client = AgentClient(httpx.AsyncClient(), {})
+        created.append(client)
+        return client
+
+    return AgentPool(size, factory, max_failures, max_uses), created
+
+
+async def use(pool: AgentPool, error: Exception = None) -> AgentClient:
+    async with pool.borrow() as client:
+        if error is not None:
+            raise error
+        return client
+
+
+def test_clients_are_reused_between_calls():
+    async def scenario():
+        pool, created = make_pool(max_uses=10)
+        assert await use(pool) is await use(pool)
+        assert len(created) == 1 and pool.recycled == 0
+        await pool.close()
+
+    asyncio.run(scenario())
+
+
+def test_clients_are_replaced_after_their_use_limit():
+    async def scenario():
+        pool, created = make_pool(max_uses=2)
+        first = await use(pool)
+        await use(pool)
+        assert await use(pool) is not first
+        assert len(created) == 2 and pool.recycled == 1
+        await asyncio.sleep(0)
+        assert first.http_client.is_closed
+        await pool.close()
+
+    asyncio.run(scenario())
+
+
+def test_clients_are_replaced_after_repeated_failures():
+    async def scenario():
+        pool, created = make_pool(max_failures=2, max_uses=100)
+        for _ in range(2):
+            with pytest.raises(ValueError):
+                await use(pool, ValueError("bad answer"))
+        assert pool.recycled == 1
+        assert await use(pool) is created[1]
+        await pool.close()
+
+    asyncio.run(scenario())
+
+
+def test_a_success_resets_the_failure_count():
+    async def scenario():
+        pool, _ = make_pool(max_failures=2, max_uses=100)
+        for _ in range(3):
+            with pytest.raises(ValueError):
+                await use(pool, ValueError("bad answer"))
+            await use(pool)
+        assert pool.recycled == 0
+        await pool.close()
+
+    asyncio.run(scenario())
+
+
+def test_clients_with_broken_connections_are_replaced_at_once():
+    async def scenario():
+        pool, created = make_pool(max_failures=10, max_uses=100)
+        with pytest.raises(httpx.ConnectError):
+            await use(pool, httpx.ConnectError("refused"))
+        assert pool.recycled == 1
+        assert await use(pool) is created[1]
+        await pool.close()
+
+    asyncio.run(scenario())
+
+
+def test_borrowers_wait_for_a_free_client():
+    async def scenario():
+        pool, _ = make_pool(size=1, max_uses=100)
+        order = []
+
+        async def call(name: str):
+            async with pool.borrow():
+                order.append(name)
+                await asyncio.sleep(0.01)
+                order.append(name)
+
+        await asyncio.gather(call("a"), call("b"))
+        assert order == ["a", "a", "b", "b"]
+        assert pool.available() == 1
+        await pool.close()
+
+    asyncio.run(scenario())
@@ -0,0 +1,62 @@
+import pytest
+
+from backend.agent.agent import PROMPTS
+from backend.agent.prescreen import (
+    NO_SPEECH,
+    KeywordAutomaton,
+    PreScreen,
+    build_markers,
+    normalize_phrase,
+)
+
+
+@pytest.fixture
+def screener():
+    return PreScreen(PROMPTS["instructions"], min_words=5, min_hits=2, flag_score=1.0)
+
+
+def test_automaton_finds_every_phrase_in_one_pass():
+    automaton = KeywordAutomaton({"he": "a", "she": "b", "hers": "c"})
+    assert automaton.find("ushers") == {}
+    assert automaton.find("she said hers") == {"b": {"she"}, "c": {"hers"}}
+
+
+def test_automaton_matches_on_word_boundaries_only():
+    automaton = KeywordAutomaton({"are animals": "hatred"})
+    assert automaton.find("they are animals") == {"hatred": {"are animals"}}
+    assert automaton.find("these are animalsounds") == {}
+
+
+def test_markers_come_from_negative_categories_only():
+    phrases, negative = build_markers(PROMPTS["instructions"])
+    assert negative == {"hatred", "misinformation", "violence", "fraud"}
+    assert set(phrases.values()) <= negative
+    # Examples with placeholders are templates, not phrases
+    assert not any("[" in phrase for phrase in phrases)
+    assert phrases[normalize_phrase("Send crypto and get 10x back.")] == "fraud"
+
+
+def test_captions_without_speech_are_settled(screener):
+    result, flagged = screener.screen(["fraud"], ["[Music]", "♪"])
+    assert result.error == NO_SPEECH
+    assert flagged == []
+    assert screener.stats()["llmCallsSaved"] == 1
+
+
+def test_requested_categories_with_enough_markers_are_flagged(screener):
+    chunks = ["Send crypto to the wallet address below and we send it back doubled"]
+    result, flagged = screener.screen(["Fraud", "clarity"], chunks)
+    assert result is None
+    assert [(c.name, c.score) for c in flagged] == [("fraud", 1.0)]
+    assert screener.stats()["flagged"] == 1
+
+
+def test_a_single_marker_is_not_enough(screener):
+    result, flagged = screener.screen(["fraud"], ["please send crypto to my friend"])
+    assert result is None
+    assert flagged == []
+
+
+def test_categories_not_requested_are_not_flagged(screener):
+    chunks = ["Send crypto to the wallet address below and we send it back doubled"]
+    assert screener.screen(["hatred"], chunks) == (None, [])
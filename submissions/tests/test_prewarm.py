@@ -0,0 +1,104 @@
+import asyncio
+
+import pytest
+
+import backend.queue.prewarm as prewarm
+from backend.cache.result_cache import ResultCache, make_cache_key
+from backend.queue.job_queue import VideoQueue
+from backend.queue.prewarm import Prewarmer
+from backend.schemas.schemas import ActionRequest, VideoScoreResult
+
+DEADLINES = {"visible": 60, "prefetch": 60, "background": 60}
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(prewarm.time, "monotonic", clock)
+    return clock
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = ResultCache(str(tmp_path / "results.sqlite3"), 60, 100, 100)
+    yield cache
+    cache.close()
+
+
+def request(video_id: str) -> ActionRequest:
+    return ActionRequest(videoId=video_id, categories=["hatred"], clientId="tab")
+
+
+def make_prewarmer(queue=None, cache=None, top: int = 2, **kwargs) -> Prewarmer:
+    return Prewarmer(queue, cache, 60, top, 120, 10, **kwargs)
+
+
+def trending(prewarmer: Prewarmer):
+    return [payload.videoId for _, payload in prewarmer.trending()]
+
+
+def test_demand_halves_every_half_life(clock):
+    prewarmer = make_prewarmer()
+    prewarmer.record([request("a"), request("a"), request("b")])
+    assert trending(prewarmer) == ["a", "b"]
+
+    # "a" is down to 0.5 after two half-lives, below a single new request
+    clock.now += 20
+    prewarmer.record([request("c")])
+    assert trending(prewarmer) == ["c", "a"]
+    key = make_cache_key("a", ["hatred"])
+    assert prewarmer._score(key, clock.now) == pytest.approx(0.5)
+
+
+def test_only_the_most_demanded_half_is_kept(clock):
+    prewarmer = make_prewarmer(max_tracked=4)
+    for count, video_id in enumerate("abcde"):
+        prewarmer.record([request(video_id)] * (count + 1))
+    assert prewarmer.stats()["tracked"] == 2
+    assert trending(prewarmer) == ["e", "d"]
+
+
+def test_trending_results_about_to_expire_are_scored_again(clock, cache):
+    async def scenario():
+        queue = VideoQueue(DEADLINES, 10, 5)
+        prewarmer = make_prewarmer(queue, cache)
+        for video_id in ("a", "b"):
+            await cache.set(
+                make_cache_key(video_id, ["hatred"]),
+                VideoScoreResult(video_id, 8, {"hatred": 8}, "Calm.", "A talk."),
+            )
+        prewarmer.record([request("a"), request("b"), request("not-stored")])
+
+        assert await prewarmer.refresh() == 2
+        job = await queue.get()
+        assert job.payload.priority == "background"
+        assert job.payload.clientId is None
+        # Already queued, so nothing new
+        assert await prewarmer.refresh() == 0
+        assert prewarmer.stats()["refreshed"] == 2
+
+    asyncio.run(scenario())
+
+
+def test_refresh_stops_when_the_queue_is_full(clock, cache):
+    async def scenario():
+        queue = VideoQueue(DEADLINES, 1, 5)
+        await queue.submit(request("busy"))
+        prewarmer = make_prewarmer(queue, cache)
+        await cache.set(
+            make_cache_key("a", ["hatred"]),
+            VideoScoreResult("a", 8, {"hatred": 8}, "Calm.", "A talk."),
+        )
+        prewarmer.record([request("a")])
+        assert await prewarmer.refresh() == 0
+        assert queue.qsize() == 1
+
+    asyncio.run(scenario())
@@ -0,0 +1,74 @@
+import json
+
+import pytest
+
+import backend.ws.protocol as protocol
+from backend.ws.protocol import decode, encode, frame, negotiate, trim
+
+
+def result(**fields) -> dict:
+    return {
+        "type": "videoScore",
+        "videoId": "v",
+        "score": 7,
+        "evaluation_summary": "Calm.",
+        "content_summary": "A talk.",
+        "partial": False,
+        **fields,
+    }
+
+
+def test_unknown_protocols_fall_back_to_json():
+    assert negotiate("compact") == "compact"
+    assert negotiate("") == "json"
+    assert negotiate("xml") == "json"
+
+
+def test_msgpack_falls_back_to_compact_without_the_package(monkeypatch):
+    monkeypatch.setattr(protocol, "msgpack", None)
+    assert negotiate("msgpack") == "compact"
+
+
+def test_results_are_sent_without_their_texts_and_defaults():
+    assert trim(result()) == {"type": "videoScore", "videoId": "v", "score": 7}
+    category = {"name": "hatred", "score": 2, "connotation": "negative", "reason": "x"}
+    trimmed = trim(result(type="categoryScore", partial=True, category=category))
+    assert trimmed["partial"] is True
+    assert "reason" not in trimmed["category"] and "reason" in category
+
+
+def test_other_messages_are_sent_whole():
+    message = {"type": "videoDropped", "videoId": "v", "reason": "shed"}
+    assert trim(message) is message
+    assert trim("ping") == "ping"
+
+
+def test_a_window_of_messages_is_sent_as_one_frame():
+    assert frame([result()]) == result()
+    assert frame(["a", "b"]) == {"type": "batch", "messages": ["a", "b"]}
+
+
+def test_json_is_encoded_without_spaces():
+    assert encode({"type": "hello", "name": "é"}, "json") == (
+        '{"type":"hello","name":"é"}'
+    )
+    assert encode("already text", "compact") == "already text"
+
+
+def test_client_messages_are_read_from_text_or_bytes(monkeypatch):
+    monkeypatch.setattr(protocol, "msgpack", None)
+    message = {"type": "subscribe", "videoIds": ["v"]}
+    assert decode(json.dumps(message)) == message
+    assert decode(json.dumps(message).encode("utf-8")) == message
+    for data in ("not json", b"\xff\xfe"):
+        with pytest.raises(ValueError):
+            decode(data)
+
+
+def test_msgpack_round_trips():
+    msgpack = pytest.importorskip("msgpack")
+    message = {"type": "subscribe", "videoIds": ["v"]}
+    data = encode(message, "msgpack")
+    assert msgpack.unpackb(data) == message
+    assert decode(data) == message
+    assert decode(json.dumps(message).encode("utf-8")) == message
@@ -0,0 +1,134 @@
+import asyncio
+
+import pytest
+
+import backend.cache.result_cache as result_cache
+from backend.cache.result_cache import ResultCache, make_cache_key
+from backend.schemas.schemas import VideoScoreResult
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def time(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(result_cache.time, "time", clock.time)
+    return clock
+
+
+def make_cache(tmp_path, **kwargs) -> ResultCache:
+    options = dict(ttl_seconds=60, max_entries=10, disk_max_entries=10)
+    options.update(kwargs)
+    return ResultCache(str(tmp_path / "results.sqlite3"), **options)
+
+
+def result(video_id: str, score: float = 7.0) -> VideoScoreResult:
+    return VideoScoreResult(video_id, score, {"hatred": score}, "Calm.", "A talk.")
+
+
+def accessed_at(cache: ResultCache):
+    return dict(cache._db.execute("SELECT key, accessed_at FROM results"))
+
+
+def test_keys_ignore_category_order_case_and_invalid_prompts():
+    key = make_cache_key("abc", ["Hatred", "clarity"], ["  be strict "])
+    assert key == make_cache_key(" abc ", ["clarity ", "hatred"], ["be strict"])
+    assert make_cache_key("abc", ["hatred"], {}) == make_cache_key("abc", ["hatred"])
+    assert key != make_cache_key("abc", ["hatred", "clarity"])
+
+
+def test_results_are_read_back_from_disk(tmp_path, clock):
+    async def scenario():
+        cache = make_cache(tmp_path)
+        await cache.set("k", result("v"))
+        cache.close()
+
+        cache = make_cache(tmp_path)
+        found = await cache.get("k")
+        assert found.to_dict() == result("v").to_dict()
+        assert await cache.get("other") is None
+        assert (cache.hits, cache.misses) == (1, 1)
+        assert list(await cache.get_many(["k", "other"])) == ["k"]
+        cache.close()
+
+    asyncio.run(scenario())
+
+
+def test_expired_results_are_misses(tmp_path, clock):
+    async def scenario():
+        cache = make_cache(tmp_path)
+        await cache.set("k", result("v"))
+        clock.now += 61
+        assert await cache.get("k") is None
+        assert await cache.get_many(["k"]) == {}
+        cache.close()
+
+    asyncio.run(scenario())
+
+
+def test_hits_are_written_with_the_next_set(tmp_path, clock):
+    async def scenario():
+        cache = make_cache(tmp_path, max_entries=1)
+        await cache.set("k0", result("v0"))
+        await cache.set("k1", result("v1"))
+        clock.now += 5
+        # k0 was pushed out of memory, so this hit reads the disk
+        assert await cache.get("k0") is not None
+        assert accessed_at(cache)["k0"] == 1_000_000.0
+
+        clock.now += 5
+        await cache.set("k2", result("v2"))
+        assert accessed_at(cache)["k0"] == 1_000_005.0
+
+        clock.now += 5
+        await cache.get("k2")
+        cache.close()
+        cache = make_cache(tmp_path)
+        assert accessed_at(cache)["k2"] == 1_000_015.0
+        cache.close()
+
+    asyncio.run(scenario())
+
+
+def test_disk_is_trimmed_to_the_least_recently_used_every_few_sets(tmp_path, clock):
+    async def scenario():
+        cache = make_cache(tmp_path, disk_max_entries=2, evict_every=3)
+        await cache.set("k0", result("v0"))
+        clock.now += 1
+        await cache.set("k1", result("v1"))
+        clock.now += 1
+        await cache.get("k0")
+        clock.now += 1
+        await cache.set("k2", result("v2"))
+        assert set(accessed_at(cache)) == {"k0", "k2"}
+
+        clock.now += 1
+        await cache.set("k3", result("v3"))
+        clock.now += 1
+        await cache.set("k4", result("v4"))
+        assert len(accessed_at(cache)) == 4
+
+        clock.now += 1
+        await cache.set("k5", result("v5"))
+        assert set(accessed_at(cache)) == {"k4", "k5"}
+        cache.close()
+
+    asyncio.run(scenario())
+
+
+def test_expired_rows_are_deleted_when_trimming(tmp_path, clock):
+    async def scenario():
+        cache = make_cache(tmp_path, evict_every=2)
+        await cache.set("old", result("old"))
+        clock.now += 61
+        await cache.set("new", result("new"))
+        assert set(accessed_at(cache)) == {"new"}
+        cache.close()
+
+    asyncio.run(scenario())
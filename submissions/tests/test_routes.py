@@ -0,0 +1,231 @@
+import asyncio
+
+import httpx
+from fastapi import FastAPI
+
+from backend.api.routes import router
+from backend.cache.result_cache import ResultCache, make_cache_key
+from backend.queue.admission import RateLimiter
+from backend.queue.job_queue import VideoQueue
+from backend.schemas.schemas import VideoScoreResult
+from backend.ws.connection_manager import ConnectionManager
+
+DEADLINES = {"visible": 60, "prefetch": 60, "background": 60}
+
+
+class FakeSocket:
+    async def accept(self):
+        pass
+
+    async def send_text(self, data):
+        pass
+
+    async def send_bytes(self, data):
+        pass
+
+
+def make_app(tmp_path, max_depth: int = 10, burst: int = 100) -> FastAPI:
+    app = FastAPI()
+    app.include_router(router)
+    manager = ConnectionManager()
+    app.state.manager = manager
+    app.state.queue = VideoQueue(
+        DEADLINES, max_depth, retry_after=5, is_wanted=manager.wants
+    )
+    app.state.cache = ResultCache(str(tmp_path / "results.sqlite3"), 60, 100, 100)
+    app.state.rate_limiter = RateLimiter(60, burst)
+    app.state.prewarmer = None
+    return app
+
+
+def run(app: FastAPI, scenario) -> None:
+    async def main():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://x") as http:
+            await scenario(http)
+        app.state.cache.close()
+
+    asyncio.run(main())
+
+
+async def store(app: FastAPI, video_id: str, categories=("hatred",)) -> None:
+    await app.state.cache.set(
+        make_cache_key(video_id, list(categories)),
+        VideoScoreResult(video_id, 8, {"hatred": 8}, "Calm.", "A talk."),
+    )
+
+
+def batch(*video_ids: str, **fields) -> dict:
+    return {"videoIds": list(video_ids), "categories": ["hatred"], **fields}
+
+
+def test_batch_answers_hits_inline_and_enqueues_the_misses(tmp_path):
+    app = make_app(tmp_path)
+
+    async def scenario(http):
+        await store(app, "hit")
+        response = await http.post(
+            "/api/videos/evaluate/batch", json=batch("hit", "miss", "other", "miss")
+        )
+        assert response.status_code == 200
+        body = response.json()
+        assert [r["videoId"] for r in body["results"]] == ["hit"]
+        assert body["enqueued"] == ["miss", "other"]
+        assert app.state.queue.qsize() == 2
+
+        response = await http.post(
+            "/api/videos/evaluate/batch", json=batch("miss", "new")
+        )
+        assert response.json()["enqueued"] == ["miss", "new"]
+        assert app.state.queue.qsize() == 3 and app.state.queue.coalesced == 1
+
+    run(app, scenario)
+
+
+def test_batch_subscribes_the_client_to_the_misses(tmp_path):
+    app = make_app(tmp_path)
+
+    async def scenario(http):
+        await app.state.manager.connect(FakeSocket(), "tab")
+        await store(app, "hit")
+        await http.post(
+            "/api/videos/evaluate/batch", json=batch("hit", "miss", clientId="tab")
+        )
+        client = app.state.manager.get("tab")
+        assert list(client.subscriptions) == ["miss"]
+        assert client.subscriptions["miss"] == {make_cache_key("miss", ["hatred"])}
+
+    run(app, scenario)
+
+
+def test_batch_is_rejected_whole_when_the_queue_is_full(tmp_path):
+    app = make_app(tmp_path, max_depth=2)
+
+    async def scenario(http):
+        response = await http.post(
+            "/api/videos/evaluate/batch", json=batch("a", "b", "c")
+        )
+        assert response.status_code == 429
+        assert response.headers["Retry-After"] == "5"
+        assert app.state.queue.qsize() == 0
+
+    run(app, scenario)
+
+
+def test_batch_spends_one_token_per_miss(tmp_path):
+    app = make_app(tmp_path, burst=3)
+
+    async def scenario(http):
+        await store(app, "hit")
+        response = await http.post(
+            "/api/videos/evaluate/batch", json=batch("hit", "a", "b")
+        )
+        assert response.status_code == 200
+        response = await http.post("/api/videos/evaluate/batch", json=batch("c", "d"))
+        assert response.status_code == 429
+
+    run(app, scenario)
+
+
+def test_batch_validates_the_video_ids(tmp_path):
+    app = make_app(tmp_path)
+
+    async def scenario(http):
+        for video_ids in ([], ["a", " "], ["v"] * 1000):
+            response = await http.post(
+                "/api/videos/evaluate/batch", json=batch(*video_ids)
+            )
+            assert response.status_code == 422
+
+    run(app, scenario)
+
+
+def evaluate(video_id: str, **fields) -> dict:
+    return {"videoId": video_id, "categories": ["hatred"], **fields}
+
+
+def test_rejected_requests_neither_subscribe_nor_spend_tokens(tmp_path):
+    app = make_app(tmp_path, max_depth=1, burst=2)
+
+    async def scenario(http):
+        await app.state.manager.connect(FakeSocket(), "tab")
+        await http.post("/api/videos/evaluate", json=evaluate("a"))
+        response = await http.post(
+            "/api/videos/evaluate", json=evaluate("b", clientId="tab")
+        )
+        assert response.status_code == 429
+        response = await http.post(
+            "/api/videos/evaluate/batch", json=batch("c", "d", clientId="tab")
+        )
+        assert response.status_code == 429
+        assert app.state.manager.get("tab").subscriptions == {}
+        assert app.state.manager.subscribers == {}
+
+        await app.state.queue.get()
+        response = await http.post(
+            "/api/videos/evaluate", json=evaluate("b", clientId="tab")
+        )
+        assert response.status_code == 200
+        assert list(app.state.manager.get("tab").subscriptions) == ["b"]
+
+    run(app, scenario)
+
+
+def test_rate_limited_requests_are_not_enqueued(tmp_path):
+    app = make_app(tmp_path, burst=1)
+
+    async def scenario(http):
+        await http.post("/api/videos/evaluate", json=evaluate("a", clientId="tab"))
+        response = await http.post(
+            "/api/videos/evaluate", json=evaluate("b", clientId="tab")
+        )
+        assert response.status_code == 429
+        assert int(response.headers["Retry-After"]) >= 1
+        assert app.state.queue.qsize() == 1
+
+    run(app, scenario)
+
+
+def test_scores_are_looked_up_without_evaluating(tmp_path):
+    app = make_app(tmp_path)
+
+    async def scenario(http):
+        await store(app, "hit")
+        response = await http.get(
+            "/api/videos/scores", params={"ids": "hit, miss,hit,"}
+        )
+        assert response.status_code == 200
+        body = response.json()
+        assert [r["videoId"] for r in body["results"]] == ["hit"]
+        assert body["missing"] == ["miss"]
+
+        response = await http.get(
+            "/api/videos/scores", params={"ids": "hit", "categories": "clarity"}
+        )
+        assert response.json() == {"results": [], "missing": ["hit"]}
+        assert app.state.queue.qsize() == 0
+
+        ids = ",".join(f"v{i}" for i in range(1000))
+        response = await http.get("/api/videos/scores", params={"ids": ids})
+        assert response.status_code == 422
+
+    run(app, scenario)
+
+
+def test_score_of_a_video_is_looked_up_without_evaluating(tmp_path):
+    app = make_app(tmp_path)
+
+    async def scenario(http):
+        await store(app, "hit")
+        response = await http.get(
+            "/api/videos/hit/score", params={"categories": "hatred"}
+        )
+        assert response.status_code == 200
+        assert response.json()["status"] == "cached"
+        assert response.json()["result"]["score"] == 8
+
+        response = await http.get("/api/videos/miss/score")
+        assert response.status_code == 404
+        assert app.state.queue.qsize() == 0
+
+    run(app, scenario)
@@ -0,0 +1,144 @@
+import asyncio
+import json
+
+import pytest
+
+from backend.queue.admission import QueueFullError
+from backend.queue.sqlite_broker import SQLiteBroker
+from backend.schemas.schemas import ActionRequest
+from backend.ws.connection_manager import ConnectionManager
+
+DEADLINES = {"visible": 60, "prefetch": 60, "background": 60}
+
+
+class FakeWebSocket:
+    def __init__(self):
+        self.sent = []
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, data: str):
+        message = json.loads(data)
+        if message["type"] != "hello":
+            self.sent.append(message)
+
+
+def request(video_id: str, priority: str = "visible") -> ActionRequest:
+    return ActionRequest(videoId=video_id, categories=["hatred"], priority=priority)
+
+
+def make_node(path, lease_seconds: float = 30, max_depth: int = 10):
+    broker = SQLiteBroker(ConnectionManager(), str(path), 0.01, lease_seconds)
+    queue = broker.create_queue(DEADLINES, max_depth, retry_after=5)
+    return broker, queue
+
+
+async def take(queue, timeout: float = 1):
+    return await asyncio.wait_for(queue.get(), timeout)
+
+
+def test_each_job_is_claimed_by_one_node(tmp_path):
+    async def scenario():
+        first, first_queue = make_node(tmp_path / "broker.sqlite3")
+        second, second_queue = make_node(tmp_path / "broker.sqlite3")
+        await first_queue.submit(request("a"))
+        await first_queue.submit(request("b"))
+
+        taken = {(await take(first_queue)).key, (await take(second_queue)).key}
+        assert len(taken) == 2
+        with pytest.raises(asyncio.TimeoutError):
+            await take(second_queue, timeout=0.05)
+        await first.close()
+        await second.close()
+
+    asyncio.run(scenario())
+
+
+def test_requests_from_other_nodes_are_coalesced(tmp_path):
+    async def scenario():
+        first, first_queue = make_node(tmp_path / "broker.sqlite3")
+        second, second_queue = make_node(tmp_path / "broker.sqlite3")
+        _, created = await first_queue.submit(request("a"))
+        _, created_again = await second_queue.submit(request("a"))
+        assert created and not created_again
+        assert second_queue.coalesced == 1 and second_queue.qsize() == 1
+        await first.close()
+        await second.close()
+
+    asyncio.run(scenario())
+
+
+def test_jobs_of_a_dead_worker_are_served_again_after_the_lease(tmp_path):
+    async def scenario():
+        crashed, crashed_queue = make_node(tmp_path / "broker.sqlite3", 0.05)
+        other, other_queue = make_node(tmp_path / "broker.sqlite3", 0.05)
+        await crashed_queue.submit(request("a"))
+        job = await take(crashed_queue)
+
+        # The job is never completed, so its lease runs out
+        assert (await take(other_queue)).key == job.key
+        await crashed.close()
+        await other.close()
+
+    asyncio.run(scenario())
+
+
+def test_completed_jobs_are_removed_for_every_node(tmp_path):
+    async def scenario():
+        first, first_queue = make_node(tmp_path / "broker.sqlite3", 0.05)
+        second, second_queue = make_node(tmp_path / "broker.sqlite3", 0.05)
+        await first_queue.submit(request("a"))
+        job = await take(first_queue)
+        first_queue.complete(job, None)
+        await asyncio.gather(*first_queue._writes)
+
+        with pytest.raises(asyncio.TimeoutError):
+            await take(second_queue, timeout=0.1)
+        _, created = await second_queue.submit(request("a"))
+        assert created
+        await first.close()
+        await second.close()
+
+    asyncio.run(scenario())
+
+
+def test_full_queue_sheds_lower_priority_jobs_or_rejects(tmp_path):
+    async def scenario():
+        broker, queue = make_node(tmp_path / "broker.sqlite3", max_depth=2)
+        await queue.submit(request("a"))
+        await queue.submit(request("b", "background"))
+        await queue.submit(request("c"))
+        assert queue.shed == 1 and queue.qsize() == 2
+
+        with pytest.raises(QueueFullError):
+            await queue.submit(request("d", "background"))
+        assert queue.rejected == 1
+        assert {(await take(queue)).payload.videoId for _ in range(2)} == {"a", "c"}
+        await broker.close()
+
+    asyncio.run(scenario())
+
+
+def test_messages_reach_subscribers_on_every_node(tmp_path):
+    async def scenario():
+        first, _ = make_node(tmp_path / "broker.sqlite3")
+        second, _ = make_node(tmp_path / "broker.sqlite3")
+        local, remote = FakeWebSocket(), FakeWebSocket()
+        await first.manager.connect(local, "tab1")
+        await second.manager.connect(remote, "tab2")
+        first.manager.subscribe("tab1", [("v", "key")])
+        second.manager.subscribe("tab2", [("v", "key")])
+        await first.start()
+        await second.start()
+
+        message = {"type": "videoScore", "videoId": "v", "score": 7}
+        first.publish("key", message)
+        await asyncio.sleep(0.1)
+        # Local subscribers get it right away and not again from the table
+        assert local.sent == [message]
+        assert remote.sent == [message]
+        await first.close()
+        await second.close()
+
+    asyncio.run(scenario())
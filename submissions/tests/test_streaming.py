@@ -0,0 +1,58 @@
+import json
+
+from backend.agent.streaming import CategoryStreamParser
+
+CATEGORIES = [
+    {"name": "hatred", "score": 9, "connotation": "negative", "reason": "No {slurs}."},
+    {
+        "name": "clarity",
+        "score": 7,
+        "connotation": "positive",
+        "reason": 'A "clear" talk',
+    },
+]
+
+
+def feed_in_pieces(text: str, size: int):
+    parser = CategoryStreamParser()
+    completed = []
+    for start in range(0, len(text), size):
+        completed += parser.feed(text[start : start + size])
+    return completed
+
+
+def test_returns_each_category_once_complete():
+    parser = CategoryStreamParser()
+    text = json.dumps({"categories": CATEGORIES, "error": ""})
+    first_end = text.index('}, {"name"') + 1
+    assert parser.feed(text[: first_end - 1]) == []
+    assert parser.feed(text[first_end - 1 : first_end]) == [(None, CATEGORIES[0])]
+    assert parser.feed(text[first_end:]) == [(None, CATEGORIES[1])]
+
+
+def test_pieces_of_any_size_give_the_same_categories():
+    text = json.dumps({"categories": CATEGORIES, "overall": {"score": 8}})
+    for size in (1, 3, 7, len(text)):
+        assert feed_in_pieces(text, size) == [(None, c) for c in CATEGORIES]
+
+
+def test_objects_outside_categories_are_ignored():
+    text = json.dumps(
+        {"overall": {"score": 8, "reason": "x"}, "tags": [{"name": "not a category"}]}
+    )
+    assert feed_in_pieces(text, 5) == []
+
+
+def test_batch_entries_come_with_their_video_id():
+    text = json.dumps(
+        {
+            "results": [
+                {"videoId": "first", "categories": CATEGORIES[:1]},
+                {"videoId": "second", "categories": CATEGORIES[1:]},
+            ]
+        }
+    )
+    assert feed_in_pieces(text, 4) == [
+        ("first", CATEGORIES[0]),
+        ("second", CATEGORIES[1]),
+    ]
@@ -0,0 +1,63 @@
+from types import SimpleNamespace
+
+import pytest
+
+from backend.agent.parsing import UNREADABLE_RESPONSE
+from backend.agent.tiers import Escalation, EscalationPolicy
+from backend.schemas.schemas import CategoryResult, EvaluationResult, OverallResult
+
+
+@pytest.fixture
+def policy() -> EscalationPolicy:
+    return EscalationPolicy(0.6, [" Hatred", "violence", ""], 3.0, 6.0)
+
+
+def result(confidence=0.9, incomplete=False, **scores) -> EvaluationResult:
+    return EvaluationResult(
+        categories=[
+            CategoryResult(
+                name=name, score=score, connotation="negative", reason="Because."
+            )
+            for name, score in scores.items()
+        ],
+        overall=OverallResult(score=5, reason="Because.", confidence=confidence),
+        error="",
+        content_summary="A talk.",
+        incomplete=incomplete,
+    )
+
+
+def test_unreadable_answers_are_escalated(policy):
+    assert policy.reason(None) == "unreadable"
+    assert policy.reason(EvaluationResult.from_error(UNREADABLE_RESPONSE)) == (
+        "unreadable"
+    )
+
+
+def test_declined_videos_are_not_escalated(policy):
+    assert policy.reason(EvaluationResult.from_error("No valid categories")) is None
+
+
+def test_incomplete_and_unsure_answers_are_escalated(policy):
+    assert policy.reason(result(incomplete=True, hatred=9)) == "incomplete"
+    assert policy.reason(result(confidence=0.5, hatred=9)) == "low_confidence"
+    assert policy.reason(result(confidence=0.6, hatred=9)) is None
+    assert policy.reason(result(confidence=None, hatred=9)) is None
+
+
+def test_only_harmful_categories_are_checked_for_borderline_scores(policy):
+    assert policy.reason(result(hatred=3.0)) == "borderline"
+    assert policy.reason(result(violence=6.0)) == "borderline"
+    assert policy.reason(result(hatred=2.9, violence=6.1)) is None
+    assert policy.reason(result(clarity=5)) is None
+
+
+def test_escalations_are_counted_by_reason(policy):
+    escalation = Escalation(SimpleNamespace(available=lambda: 2), policy)
+    for evaluation in (None, result(hatred=5), result(hatred=9), result(hatred=4)):
+        escalation.check(evaluation)
+    stats = escalation.stats()
+    assert stats["checked"] == 4 and stats["escalated"] == 3
+    assert stats["escalationRate"] == 0.75
+    assert stats["byReason"] == {"unreadable": 1, "borderline": 2}
+    assert stats["strongAvailable"] == 2
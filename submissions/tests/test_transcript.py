@@ -0,0 +1,102 @@
+from backend.agent.transcript import (
+    chunk_lines,
+    clean_transcript,
+    count_tokens,
+    merge_evaluations,
+    prepare_transcript,
+    sample_chunks,
+)
+from backend.schemas.schemas import CategoryResult, EvaluationResult, OverallResult
+
+
+def evaluation(scores, confidence=None, reason="", summary="", incomplete=False):
+    return EvaluationResult(
+        categories=[
+            CategoryResult(
+                name=name,
+                score=score,
+                connotation="negative" if name == "hatred" else "positive",
+                reason=f"{name} {score}",
+            )
+            for name, score in scores.items()
+        ],
+        overall=OverallResult(
+            score=sum(scores.values()) / len(scores),
+            reason=reason,
+            confidence=confidence,
+        ),
+        error="",
+        content_summary=summary,
+        incomplete=incomplete,
+    )
+
+
+def test_clean_transcript_drops_annotations_fillers_and_repeats():
+    text = "[Music]\nUm, so today we bake bread\nuh so today we bake bread.\n♪ ♪\nOK"
+    assert clean_transcript(text) == ["so today we bake bread", "OK"]
+
+
+def test_short_transcripts_are_sent_whole():
+    assert prepare_transcript("one\ntwo", 100, 50, 4, "sample") == ["one\ntwo"]
+
+
+def test_long_transcripts_are_sampled_into_one_call():
+    text = "\n".join(f"line number {i} of the video" for i in range(200))
+    prepared = prepare_transcript(text, 400, 200, 4, "sample")
+    assert len(prepared) == 1
+    assert count_tokens(prepared[0]) <= 400 + 4 * 10
+    segments = prepared[0].split("\n[...]\n")
+    assert len(segments) == 4
+    assert segments[0].startswith("line number 0 ")
+    assert segments[-1].endswith("line number 199 of the video")
+
+
+def test_long_transcripts_are_chunked_for_map_reduce():
+    text = "\n".join(f"line number {i} of the video" for i in range(200))
+    prepared = prepare_transcript(text, 400, 200, 3, "map_reduce")
+    assert len(prepared) == 3
+    assert all(count_tokens(chunk) <= 200 for chunk in prepared)
+
+
+def test_chunks_keep_lines_whole_and_in_order():
+    lines = [f"line {i}" for i in range(10)]
+    chunks = chunk_lines(lines, 10)
+    assert "\n".join(chunks).split("\n") == lines
+
+
+def test_sampled_chunks_keep_the_first_and_last():
+    chunks = [str(i) for i in range(10)]
+    assert sample_chunks(chunks, 3) == ["0", "4", "9"]
+    assert sample_chunks(chunks, 1) == ["0"]
+    assert sample_chunks(chunks, 20) == chunks
+
+
+def test_merge_keeps_the_worst_negative_and_averages_positives():
+    merged = merge_evaluations(
+        [
+            evaluation({"hatred": 9, "clarity": 8}, 0.9, "first", "Intro."),
+            evaluation({"hatred": 2, "clarity": 4}, 0.6, "second", "Rant."),
+        ]
+    )
+    scores = {c.name: c.score for c in merged.categories}
+    assert scores == {"hatred": 2, "clarity": 6}
+    assert merged.overall.score == 4
+    assert merged.overall.confidence == 0.6
+    assert merged.overall.reason == "first second"
+    assert merged.content_summary == "Intro. Rant."
+    assert not merged.incomplete
+
+
+def test_merge_skips_failed_chunks():
+    result = evaluation({"hatred": 9})
+    failed = EvaluationResult.from_error("Could not read the model response")
+    assert merge_evaluations([failed, None, result]) is result
+    assert merge_evaluations([None, failed]) is failed
+    assert merge_evaluations([None]) is None
+
+
+def test_merge_is_incomplete_if_any_chunk_is():
+    merged = merge_evaluations(
+        [evaluation({"hatred": 9}), evaluation({"hatred": 8}, incomplete=True)]
+    )
+    assert merged.incomplete